@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, tzinfo
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import DB_ERRORS, DB_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+ReportRow = Tuple[int, str, str, int, str, str, str, int]
+
+
+def _timed(func: Callable, mode: str, *args, **kwargs):
+    """Выполнение метода базы в потоке с учетом времени в метриках"""
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        DB_ERRORS.inc(func.__name__)
+        raise
+    finally:
+        DB_SECONDS.observe(time.perf_counter() - started, func.__name__, mode)
+
+
+class ReportWriteBuffer:
+    """Буфер отложенной записи с групповым коммитом.
+
+    Строки отчетов из всех обработчиков накапливаются и сбрасываются одной
+    транзакцией через executemany: по достижении max_batch строк или через
+    max_delay секунд после первой строки в буфере. Корутина add() завершается
+    только после коммита пачки, так что вызывающий код получает гарантию
+    сохранения (или исключение, если запись не удалась).
+    """
+
+    def __init__(self, flush_func: Callable[[List[ReportRow]], Awaitable[None]],
+                 max_batch: int = 100, max_delay: float = 0.05, max_pending_rows: int = 10000):
+        self._flush_func = flush_func
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+
+        self._rows: List[ReportRow] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._pending_slots = asyncio.Semaphore(max_pending_rows)
+
+        # Метрики
+        self.batches_flushed = 0
+        self.rows_flushed = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+        self.last_batch_size = 0
+        self.flush_latency_total = 0.0
+        self.flush_latency_max = 0.0
+        self.last_flush_latency = 0.0
+
+    async def add(self, row: ReportRow):
+        """Добавление строки и ожидание коммита ее пачки"""
+        await self._pending_slots.acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._rows.append(row)
+            self._futures.append(future)
+
+            if len(self._rows) >= self.max_batch:
+                self._start_flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_delay, self._start_flush)
+
+            await future
+        finally:
+            self._pending_slots.release()
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._rows:
+            return
+
+        rows, futures = self._rows, self._futures
+        self._rows, self._futures = [], []
+        task = asyncio.get_running_loop().create_task(self._flush(rows, futures))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, rows: List[ReportRow], futures: List[asyncio.Future]):
+        started = time.perf_counter()
+        try:
+            await self._flush_func(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        latency = time.perf_counter() - started
+        self.batches_flushed += 1
+        self.rows_flushed += len(rows)
+        self.last_batch_size = len(rows)
+        self.max_batch_size = max(self.max_batch_size, len(rows))
+        self.last_flush_latency = latency
+        self.flush_latency_total += latency
+        self.flush_latency_max = max(self.flush_latency_max, latency)
+
+        for future in futures:
+            if not future.done():
+                future.set_result(None)
+
+    async def flush(self):
+        """Немедленный сброс буфера и ожидание всех начатых записей"""
+        self._start_flush()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        """Метрики размеров пачек и задержки сброса"""
+        return {
+            'buffered_rows': len(self._rows),
+            'batches_flushed': self.batches_flushed,
+            'rows_flushed': self.rows_flushed,
+            'failed_batches': self.failed_batches,
+            'last_batch_size': self.last_batch_size,
+            'max_batch_size': self.max_batch_size,
+            'avg_batch_size': self.rows_flushed / self.batches_flushed if self.batches_flushed else 0.0,
+            'last_flush_latency': self.last_flush_latency,
+            'max_flush_latency': self.flush_latency_max,
+            'avg_flush_latency': self.flush_latency_total / self.batches_flushed if self.batches_flushed else 0.0,
+        }
+
+
+class AsyncReportStorage:
+    """Асинхронный фасад над ReportDatabase.
+
+    Все обращения к SQLite выполняются в отдельных потоках: запись идет через
+    единственный поток-писатель (сохраняется порядок операций), чтение - через
+    потоки по числу соединений-читателей. Очередь запросов ограничена: при
+    переполнении корутина-вызывающий ждет свободного места, но цикл событий
+    не блокируется и продолжает принимать обновления.
+
+    Отчеты сохраняются через ReportWriteBuffer: вставки из всех обработчиков
+    объединяются в пачки и коммитятся одной транзакцией. Отметки обработанных
+    сообщений (защита от повторной доставки) пишутся через отдельный буфер.
+    """
+
+    def __init__(self, db, max_pending_writes: int = 1000, max_pending_reads: int = 100,
+                 write_batch_size: int = 100, write_max_delay: float = 0.05):
+        self.db = db
+        self.max_pending_writes = max_pending_writes
+        self.max_pending_reads = max_pending_reads
+
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=db.connections.max_readers, thread_name_prefix='db-reader'
+        )
+        self._write_slots = asyncio.Semaphore(max_pending_writes)
+        self._read_slots = asyncio.Semaphore(max_pending_reads)
+        self.write_buffer = ReportWriteBuffer(
+            self._write_batch, max_batch=write_batch_size, max_delay=write_max_delay
+        )
+        self.processed_buffer = ReportWriteBuffer(
+            self._write_processed, max_batch=write_batch_size, max_delay=write_max_delay
+        )
+
+        self.pending_writes = 0
+        self.pending_reads = 0
+        self.backpressure_waits = 0
+        self._closed = False
+
+    async def _submit_write(self, func: Callable, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("Хранилище отчетов закрыто")
+        if self._write_slots.locked():
+            self.backpressure_waits += 1
+            logger.debug("Очередь записи заполнена (%d), ожидание диска", self.max_pending_writes)
+
+        async with self._write_slots:
+            self.pending_writes += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._write_executor, partial(_timed, func, 'write', *args, **kwargs)
+                )
+            finally:
+                self.pending_writes -= 1
+
+    async def _submit_read(self, func: Callable, *args, **kwargs):
+        if self._closed:
+            raise RuntimeError("Хранилище отчетов закрыто")
+
+        async with self._read_slots:
+            self.pending_reads += 1
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(
+                    self._read_executor, partial(_timed, func, 'read', *args, **kwargs)
+                )
+            finally:
+                self.pending_reads -= 1
+
+    async def save_report(self, chat_id: int, user_tag: str, report_type: str, day_number: int,
+                          submission_time: datetime, username: str, message_id: int, tz: tzinfo = timezone.utc):
+        """Сохранение отчета через буфер группового коммита (tz - часовой пояс группы для даты отчета)"""
+        if self._closed:
+            raise RuntimeError("Хранилище отчетов закрыто")
+        await self.write_buffer.add(
+            self.db.report_row(chat_id, user_tag, report_type, day_number, submission_time, username, message_id, tz)
+        )
+
+    async def _write_batch(self, rows: List[ReportRow]):
+        await self._submit_write(self.db.save_reports, rows)
+
+    async def mark_processed(self, chat_id: int, message_id: int):
+        """Отметка обработанного сообщения через буфер группового коммита"""
+        if self._closed:
+            raise RuntimeError("Хранилище отчетов закрыто")
+        await self.processed_buffer.add((chat_id, message_id, int(time.time())))
+
+    async def _write_processed(self, rows: List[Tuple[int, int, int]]):
+        await self._submit_write(self.db.mark_processed, rows)
+
+    async def get_reports_for_date(self, date: datetime, chat_id: int) -> Dict[str, Dict[str, Dict]]:
+        """Получение отчетов группы за дату в потоке-читателе"""
+        return await self._submit_read(self.db.get_reports_for_date, date, chat_id)
+
+    async def check_db_integrity(self):
+        """Проверка целостности базы данных"""
+        return await self._submit_read(self.db.check_db_integrity)
+
+    async def run_write(self, func: Callable, *args, **kwargs):
+        """Выполнение произвольной операции ReportDatabase в потоке-писателе"""
+        return await self._submit_write(func, *args, **kwargs)
+
+    async def run_read(self, func: Callable, *args, **kwargs):
+        """Выполнение произвольной операции ReportDatabase в потоке-читателе"""
+        return await self._submit_read(func, *args, **kwargs)
+
+    def stats(self) -> Dict[str, float]:
+        """Текущая глубина очередей и метрики буфера записи"""
+        return {
+            'pending_writes': self.pending_writes,
+            'pending_reads': self.pending_reads,
+            'backpressure_waits': self.backpressure_waits,
+            **{f'write_buffer_{key}': value for key, value in self.write_buffer.stats().items()},
+        }
+
+    async def close(self):
+        """Сбрасывает буфер записи, дожидается операций и закрывает базу"""
+        if self._closed:
+            return
+        await self.write_buffer.flush()
+        await self.processed_buffer.flush()
+        self._closed = True
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self._write_executor.shutdown, wait=True))
+        await loop.run_in_executor(None, partial(self._read_executor.shutdown, wait=True))
+        self.db.close()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Восстановление отчетов из JSON-экспорта истории группы (Telegram Desktop).
+
+Файл читается потоково: массив messages разбирается по одному сообщению через
+json.JSONDecoder.raw_decode, поэтому экспорт в сотни мегабайт не загружается
+в память целиком. Каждое сообщение проходит тот же разбор, что и в боте
+(ChatConfig.parser), найденные отчеты вставляются пачками через executemany.
+
+Пример:
+    python backfill_export.py result.json --chat-id -1001234567890 --user-map users.json --dry-run
+"""
+import argparse
+import codecs
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from chat_registry import ChatConfig
+from main import DATABASE_PATH, GROUP_CHAT_ID, PARTICIPANTS, REPORT_TYPES, TIMEZONE, ReportDatabase
+
+READ_CHUNK_SIZE = 1 << 20
+DEFAULT_BATCH_SIZE = 20000
+PROGRESS_EVERY = 10000
+
+# По умолчанию уже сохраненные ботом отчеты не перезаписываются
+SQL_INSERT_REPORT_IGNORE = '''
+    INSERT OR IGNORE INTO reports
+    (chat_id, user_tag, report_type, day_number, datetime, report_date, username, message_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_INSERT_REPORT_REPLACE = '''
+    INSERT OR REPLACE INTO reports
+    (chat_id, user_tag, report_type, day_number, datetime, report_date, username, message_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+
+class ExportReader:
+    """Потоковое чтение массива messages из экспорта"""
+
+    def __init__(self, path: str, chunk_size: int = READ_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+
+    def _chunks(self, f) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            data = f.read(self.chunk_size)
+            self.bytes_read = f.tell()
+            if not data:
+                tail = decoder.decode(b'', final=True)
+                if tail:
+                    yield tail
+                return
+            yield decoder.decode(data)
+
+    def messages(self) -> Iterator[Dict]:
+        """Сообщения экспорта по одному"""
+        json_decoder = json.JSONDecoder()
+        with open(self.path, 'rb') as f:
+            chunks = self._chunks(f)
+
+            # Поиск начала массива "messages"
+            buffer = ''
+            while True:
+                start = buffer.find('"messages"')
+                bracket = buffer.find('[', start) if start != -1 else -1
+                if bracket != -1:
+                    buffer = buffer[bracket + 1:]
+                    break
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                # Хвост оставляется на случай, если ключ разрезан между кусками
+                buffer = (buffer if start != -1 else buffer[-len('"messages"'):]) + chunk
+
+            pos = 0
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos >= len(buffer):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        return
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                if buffer[pos] == ']':
+                    return
+
+                try:
+                    message, end = json_decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Сообщение обрезано границей куска - дочитываем
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        raise
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+
+                yield message
+                pos = end
+                if pos > self.chunk_size:
+                    buffer, pos = buffer[pos:], 0
+
+
+def message_text(message: Dict) -> str:
+    """Текст сообщения: в экспорте это строка или список строк и сущностей"""
+    text = message.get('text', '')
+    if isinstance(text, str):
+        return text
+    return ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+
+
+def message_date(message: Dict) -> datetime:
+    """Время отправки (UTC из date_unixtime; в старых экспортах - местное время из date)"""
+    unixtime = message.get('date_unixtime')
+    if unixtime is not None:
+        return datetime.fromtimestamp(int(unixtime), timezone.utc)
+    return datetime.fromisoformat(message['date'])
+
+
+def load_user_map(path: Optional[str]) -> Dict[str, str]:
+    """Соответствие from_id (или имени) отправителя его @username.
+
+    В экспорте нет username, а без него отчет без тега участника не
+    привязать к отправителю. Формат файла: {"user123456": "@username", ...}.
+    """
+    if not path:
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def chat_config(db: ReportDatabase, chat_id: int) -> ChatConfig:
+    """Настройки группы из базы (или настройки по умолчанию, если группа не зарегистрирована)"""
+    try:
+        configs = db.load_chat_configs(chat_id)
+    except sqlite3.Error as e:
+        # Пробный запуск не создает и не мигрирует базу: ее может не быть или схема может быть старой
+        print(f"⚠️ Не удалось прочитать настройки группы из {db.db_path}: {e}")
+        configs = []
+    if configs:
+        return configs[0]
+    print(f"⚠️ Группа {chat_id} не зарегистрирована, используются участники и типы отчетов по умолчанию")
+    return ChatConfig(chat_id, None, None, 0, PARTICIPANTS, REPORT_TYPES, tz=ChatConfig.parse_timezone(TIMEZONE))
+
+
+def backfill(args) -> Tuple[int, int, int]:
+    """Разбор экспорта и вставка отчетов; возвращает (сообщений, отчетов, вставлено)"""
+    # При пробном запуске база открывается только на чтение, без создания схемы и миграций
+    db = ReportDatabase(args.db, readonly=args.dry_run)
+    config = chat_config(db, args.chat_id)
+    user_map = load_user_map(args.user_map)
+    reader = ExportReader(args.export)
+    sql = SQL_INSERT_REPORT_REPLACE if args.replace else SQL_INSERT_REPORT_IGNORE
+
+    messages = reports = inserted = 0
+    batch: List[Tuple] = []
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal inserted, batch
+        if batch and not args.dry_run:
+            with db.connections.writer() as conn, conn:
+                inserted += conn.executemany(sql, batch).rowcount
+        batch = []
+
+    try:
+        for message in reader.messages():
+            if message.get('type') != 'message':
+                continue
+            messages += 1
+            text = message_text(message)
+            if '#' in text:
+                sender = message.get('from_id') or message.get('from') or ''
+                username = user_map.get(sender) or user_map.get(message.get('from') or '', '')
+                submission_time = message_date(message)
+                for report_type, user_tag, day_number in config.parser.parse(text, username):
+                    batch.append(db.report_row(args.chat_id, user_tag, report_type, day_number, submission_time,
+                                               username, message['id'], config.timezone))
+                    reports += 1
+                if len(batch) >= args.batch_size:
+                    flush()
+
+            if messages % PROGRESS_EVERY == 0:
+                percent = reader.bytes_read * 100 / reader.total_bytes if reader.total_bytes else 100
+                print(f"   {percent:5.1f}%  сообщений: {messages}, отчетов: {reports}, "
+                      f"{time.perf_counter() - started:.1f} с", file=sys.stderr)
+        flush()
+    finally:
+        db.close()
+    return messages, reports, inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Восстановление отчетов из JSON-экспорта истории группы")
+    parser.add_argument('export', help="result.json из Telegram Desktop (Экспорт истории чата, формат JSON)")
+    parser.add_argument('--chat-id', type=int, default=GROUP_CHAT_ID,
+                        help="chat_id группы в боте (по умолчанию GROUP_CHAT_ID)")
+    parser.add_argument('--db', default=DATABASE_PATH, help="путь к базе (по умолчанию DATABASE_PATH)")
+    parser.add_argument('--user-map', help='JSON {"user123": "@username"} для отчетов без тега участника')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="строк в одной транзакции")
+    parser.add_argument('--replace', action='store_true',
+                        help="перезаписывать уже сохраненные отчеты (по умолчанию они сохраняются)")
+    parser.add_argument('--dry-run', action='store_true', help="только разобрать экспорт, ничего не записывать")
+    args = parser.parse_args()
+
+    if not args.chat_id:
+        parser.error("не задан --chat-id (и GROUP_CHAT_ID)")
+
+    print(f"📥 Восстановление отчетов из {args.export} в чат {args.chat_id}"
+          f"{' (пробный запуск)' if args.dry_run else ''}")
+    started = time.perf_counter()
+    messages, reports, inserted = backfill(args)
+    print(f"✅ Сообщений: {messages}, найдено отчетов: {reports}, "
+          f"{'было бы записано' if args.dry_run else 'записано'}: {reports if args.dry_run else inserted}, "
+          f"{time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
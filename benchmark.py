@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Бенчмарки горячих путей бота на синтетических данных.
+
+Измеряются:
+  - parse_message на реалистичной смеси сообщений и на сообщениях около 4 КБ
+    (для сравнения - прежний разбор, report_parser.legacy_parse);
+  - вставка отчетов: save_reports по одной строке (как save_report) и пачками;
+  - get_reports_for_date на базах из 10k, 1M и 10M отчетов (без кэша);
+  - format_report_status для 13, 500 и 5000 участников.
+
+Результаты сохраняются в JSON и сравниваются с базовой линией:
+    python benchmark.py --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+
+Сравнивается медианное время одной операции; при замедлении больше порога
+по любому бенчмарку скрипт завершается с кодом 1. Все базы создаются во
+временном каталоге, рабочая база бота не используется.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+# Бот работает с временной базой и без реального токена; логи горячих путей не измеряются
+_bench_dir = tempfile.TemporaryDirectory(prefix='bot-bench-')
+os.environ['DATABASE_PATH'] = os.path.join(_bench_dir.name, 'bot.db')
+os.environ['GROUP_CHAT_ID'] = '0'
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:benchmark')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from chat_registry import ChatConfig
+from main import PARTICIPANTS, REPORT_TYPES, ReportBot, ReportDatabase
+from report_cache import ReportsCache
+from report_parser import legacy_parse
+
+SEED = 42
+BENCH_CHAT_ID = -1
+ROWS_PER_DAY = len(PARTICIPANTS) * len(REPORT_TYPES)
+DAYS_PER_CHAT = 365
+POPULATE_BATCH = 100000
+
+LONG_MESSAGE_BYTES = 4096
+LONG_MESSAGES = 200
+DEFAULT_SIZES = '10000,1000000,10000000'
+DEFAULT_PARTICIPANTS = '13,500,5000'
+
+
+def measure(func: Callable[[], object], number: int, repeat: int) -> Dict[str, float]:
+    """Время одной операции: repeat замеров по number вызовов"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number)
+    median = statistics.median(samples)
+    return {
+        'median_us': median * 1e6,
+        'min_us': min(samples) * 1e6,
+        'ops_per_sec': 1 / median if median else 0.0,
+        'samples': repeat,
+        'ops_per_sample': number,
+    }
+
+
+def measure_each(funcs: List[Callable[[], object]]) -> Dict[str, float]:
+    """Время каждой операции отдельно (для запросов к базе: медиана и 95-й перцентиль)"""
+    samples = []
+    for func in funcs:
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'median_us': median * 1e6,
+        'p95_us': samples[int(len(samples) * 0.95) - 1] * 1e6,
+        'max_us': samples[-1] * 1e6,
+        'ops_per_sec': 1 / median if median else 0.0,
+        'samples': len(samples),
+    }
+
+
+def message_corpus(rng: random.Random, count: int) -> List[Tuple[str, str]]:
+    """Смесь сообщений: болтовня, одиночные и множественные отчеты, посторонние хэштеги"""
+    usernames = list(PARTICIPANTS)
+    tags = list(PARTICIPANTS.values())
+    types = list(REPORT_TYPES)
+    words = ['сегодня', 'пробежка', 'утро', 'читал', 'книгу', 'спасибо', 'отлично', 'план', 'день', 'вода']
+
+    corpus = []
+    for _ in range(count):
+        kind = rng.random()
+        chatter = ' '.join(rng.choices(words, k=rng.randint(3, 30)))
+        if kind < 0.55:
+            text = chatter
+        elif kind < 0.80:
+            text = f"#{rng.choice(types)}{rng.randint(1, 365)} {rng.choice(tags)} {chatter}"
+        elif kind < 0.90:
+            text = ' '.join(f"#{rng.choice(types)}{rng.randint(1, 365)} {rng.choice(tags)}"
+                            for _ in range(rng.randint(2, 6)))
+        elif kind < 0.95:
+            text = f"#{rng.choice(types)}{rng.randint(1, 365)} {chatter}"
+        else:
+            text = f"{chatter} #мысли #{rng.choice(words)}"
+        corpus.append((text, rng.choice(usernames)))
+    return corpus
+
+
+def long_message_corpus(rng: random.Random, count: int) -> List[Tuple[str, str]]:
+    """Длинные сообщения (около LONG_MESSAGE_BYTES байт в UTF-8): текст с отчетами и посторонними хэштегами"""
+    usernames = list(PARTICIPANTS)
+    tags = list(PARTICIPANTS.values())
+    types = list(REPORT_TYPES)
+    words = ['сегодня', 'пробежка', 'утро', 'читал', 'книгу', 'спасибо', 'отлично', 'план', 'день', 'вода',
+             '#мысли', '#итоги', '10км', '—']
+
+    corpus = []
+    for _ in range(count):
+        parts = []
+        size = 0
+        while size < LONG_MESSAGE_BYTES:
+            kind = rng.random()
+            if kind < 0.04:
+                part = f"#{rng.choice(types)}{rng.randint(1, 365)} {rng.choice(tags)}"
+            elif kind < 0.06:
+                part = f"#{rng.choice(types)}{rng.randint(1, 365)}"
+            else:
+                part = rng.choice(words)
+            parts.append(part)
+            size += len(part.encode('utf-8')) + 1
+        corpus.append((' '.join(parts), rng.choice(usernames)))
+    return corpus
+
+
+def bench_parse_long(bot: ReportBot, rng: random.Random, count: int) -> Dict[str, Dict[str, float]]:
+    """Разбор сообщений около 4 КБ: текущий разбор и прежний"""
+    corpus = long_message_corpus(rng, count)
+    chat_id = BENCH_CHAT_ID
+    report_types = list(REPORT_TYPES)
+
+    def run():
+        for text, username in corpus:
+            bot.parse_message(text, username, chat_id)
+
+    def run_legacy():
+        for text, username in corpus:
+            legacy_parse(text, username, PARTICIPANTS, report_types)
+
+    results = {}
+    for name, func in (('parse_4kb', run), ('parse_4kb_legacy', run_legacy)):
+        result = measure(func, number=1, repeat=5)
+        # Время на одно сообщение
+        for key in ('median_us', 'min_us'):
+            result[key] /= count
+        result['ops_per_sec'] *= count
+        result['messages'] = count
+        result['message_bytes'] = LONG_MESSAGE_BYTES
+        results[name] = result
+    return results
+
+
+def bench_parse(bot: ReportBot, rng: random.Random, count: int) -> Dict[str, float]:
+    corpus = message_corpus(rng, count)
+    chat_id = BENCH_CHAT_ID
+
+    def run():
+        for text, username in corpus:
+            bot.parse_message(text, username, chat_id)
+
+    result = measure(run, number=1, repeat=5)
+    # Время на одно сообщение
+    for key in ('median_us', 'min_us'):
+        result[key] /= count
+    result['ops_per_sec'] *= count
+    result['messages'] = count
+    return result
+
+
+def report_rows(chat_count: int, start: date, rows: int):
+    """Отчеты по (чат, день, участник, тип) в хронологическом порядке внутри чата"""
+    tags = list(PARTICIPANTS.values())
+    produced = 0
+    for chat_index in range(chat_count):
+        chat_id = BENCH_CHAT_ID - chat_index
+        for day in range(DAYS_PER_CHAT):
+            report_date = start + timedelta(days=day)
+            submitted = datetime.combine(report_date, datetime.min.time(), tzinfo=timezone.utc) + timedelta(hours=9)
+            for index, tag in enumerate(tags):
+                for report_type in REPORT_TYPES:
+                    yield (chat_id, tag, report_type, day + 1, submitted.isoformat(), report_date.isoformat(),
+                           '@bench', index)
+                    produced += 1
+                    if produced >= rows:
+                        return
+
+
+def populated_db(path: str, rows: int, start: date) -> Tuple[ReportDatabase, int]:
+    """База с rows отчетами (триггеры daily_status работают как в боте)"""
+    db = ReportDatabase(path)
+    chat_count = -(-rows // (ROWS_PER_DAY * DAYS_PER_CHAT))
+    generator = report_rows(chat_count, start, rows)
+    while True:
+        batch = [row for _, row in zip(range(POPULATE_BATCH), generator)]
+        if not batch:
+            break
+        with db.connections.writer() as conn, conn:
+            conn.executemany('''
+                INSERT INTO reports
+                (chat_id, user_tag, report_type, day_number, datetime, report_date, username, message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+    with db.connections.writer() as conn:
+        conn.execute('ANALYZE')
+    return db, chat_count
+
+
+def bench_insert(workdir: str, rng: random.Random, single: int, batched: int,
+                 batch_size: int) -> Dict[str, Dict[str, float]]:
+    tags = list(PARTICIPANTS.values())
+    types = list(REPORT_TYPES)
+    now = datetime.now(timezone.utc)
+
+    def rows(count: int, offset: int):
+        return [ReportDatabase.report_row(BENCH_CHAT_ID, rng.choice(tags), rng.choice(types), offset + i,
+                                          now, '@bench', i)
+                for i in range(count)]
+
+    db = ReportDatabase(os.path.join(workdir, 'insert.db'))
+    try:
+        # Не меньше одного вызова на замер, даже при маленьких --single-inserts/--batched-inserts
+        single_number = max(1, single // 5)
+        single_rows = iter(rows(single_number * 5, 0))
+        single_result = measure(lambda: db.save_reports([next(single_rows)]), number=single_number, repeat=5)
+
+        batch_number = max(1, batched // batch_size // 5)
+        batches = iter([rows(batch_size, single_number * 5 + i * batch_size) for i in range(batch_number * 5)])
+        batch_result = measure(lambda: db.save_reports(next(batches)), number=batch_number, repeat=5)
+        # Время на одну строку
+        for key in ('median_us', 'min_us'):
+            batch_result[key] /= batch_size
+        batch_result['ops_per_sec'] *= batch_size
+        batch_result['batch_size'] = batch_size
+    finally:
+        db.close()
+    return {'insert_single': single_result, 'insert_batched': batch_result}
+
+
+def bench_reports_for_date(workdir: str, rng: random.Random, rows: int, queries: int) -> Dict[str, float]:
+    start = date(2020, 1, 1)
+    started = time.perf_counter()
+    db, chat_count = populated_db(os.path.join(workdir, f'reports_{rows}.db'), rows, start)
+    populate_seconds = time.perf_counter() - started
+    # Запросы без кэша сводок: измеряется чтение из базы
+    db.cache = ReportsCache(0)
+    days = min(DAYS_PER_CHAT, -(-rows // ROWS_PER_DAY))
+    try:
+        lookups = [
+            (lambda d=datetime.combine(start + timedelta(days=rng.randrange(days)), datetime.min.time()),
+                    chat=BENCH_CHAT_ID - rng.randrange(chat_count): db.get_reports_for_date(d, chat))
+            for _ in range(queries)
+        ]
+        result = measure_each(lookups)
+    finally:
+        db.close()
+        os.remove(os.path.join(workdir, f'reports_{rows}.db'))
+    result['rows'] = rows
+    result['populate_seconds'] = populate_seconds
+    return result
+
+
+def bench_format(bot: ReportBot, rng: random.Random, participants: int) -> Dict[str, float]:
+    chat_id = BENCH_CHAT_ID - participants
+    people = {f'@user_{i}': f'#u{i}' for i in range(participants)}
+    bot.registry.update(chat_id, ChatConfig(chat_id, None, None, 1, people, REPORT_TYPES))
+
+    report_date = datetime.now() - timedelta(days=1)
+    submitted = datetime.combine(report_date.date(), datetime.min.time(), tzinfo=timezone.utc)
+    reports = {}
+    for tag in people.values():
+        for report_type, info in REPORT_TYPES.items():
+            if rng.random() < 0.7:
+                late = rng.random() < 0.2
+                at = submitted + timedelta(hours=info['deadline'].hour + (1 if late else -1))
+                reports.setdefault(tag, {})[report_type] = {
+                    'day_number': rng.randint(1, 365), 'datetime': at.isoformat(), 'username': '@bench'
+                }
+
+    number = max(1, 2000 // participants)
+    result = measure(lambda: bot.format_report_parts(reports, report_date, chat_id), number=number, repeat=5)
+    result['participants'] = participants
+    return result
+
+
+def run_benchmarks(args) -> Dict[str, Dict[str, float]]:
+    rng = random.Random(SEED)
+    bot = ReportBot()
+    bot.registry.update(BENCH_CHAT_ID, ChatConfig(BENCH_CHAT_ID, None, None, 1, PARTICIPANTS, REPORT_TYPES))
+    results: Dict[str, Dict[str, float]] = {}
+
+    def report(name: str, result: Dict[str, float]):
+        results[name] = result
+        print(f"{name:<32} {result['median_us']:>12.2f} мкс  {result['ops_per_sec']:>14.0f} оп/с", file=sys.stderr)
+
+    if 'parse' in args.only:
+        report('parse_message', bench_parse(bot, rng, args.messages))
+        for name, result in bench_parse_long(bot, rng, args.long_messages).items():
+            report(name, result)
+
+    if 'insert' in args.only:
+        for name, result in bench_insert(_bench_dir.name, rng, args.single_inserts, args.batched_inserts,
+                                         args.batch_size).items():
+            report(name, result)
+
+    if 'query' in args.only:
+        for rows in args.sizes:
+            report(f'reports_for_date_{rows}', bench_reports_for_date(_bench_dir.name, rng, rows, args.queries))
+
+    if 'format' in args.only:
+        for participants in args.participants:
+            report(f'format_report_status_{participants}', bench_format(bot, rng, participants))
+
+    bot.db.close()
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> bool:
+    """Сравнение с базовой линией; False, если есть замедление больше порога"""
+    ok = True
+    print(f"\n{'бенчмарк':<32} {'база, мкс':>12} {'сейчас, мкс':>12} {'изменение':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<32} {'-':>12} {result['median_us']:>12.2f} {'новый':>10}")
+            continue
+        change = result['median_us'] / base['median_us'] - 1 if base['median_us'] else 0.0
+        mark = ''
+        if change > threshold:
+            mark = '  ❌ замедление'
+            ok = False
+        elif change < -threshold:
+            mark = '  ✅ ускорение'
+        print(f"{name:<32} {base['median_us']:>12.2f} {result['median_us']:>12.2f} {change:>+9.1%}{mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки разбора, хранения и сводок")
+    parser.add_argument('--output', help="куда сохранить результаты (JSON)")
+    parser.add_argument('--baseline', help="результаты для сравнения (JSON, ранее сохраненный --output)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    parser.add_argument('--only', default='parse,insert,query,format',
+                        help="группы бенчмарков через запятую: parse, insert, query, format")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="размеры баз для get_reports_for_date")
+    parser.add_argument('--participants', default=DEFAULT_PARTICIPANTS, help="число участников для сводки")
+    parser.add_argument('--messages', type=int, default=20000, help="сообщений в корпусе для разбора")
+    parser.add_argument('--long-messages', type=int, default=LONG_MESSAGES, help="сообщений по 4 КБ для разбора")
+    parser.add_argument('--single-inserts', type=int, default=2000, help="вставок по одному отчету")
+    parser.add_argument('--batched-inserts', type=int, default=50000, help="отчетов во вставках пачками")
+    parser.add_argument('--batch-size', type=int, default=100, help="размер пачки")
+    parser.add_argument('--queries', type=int, default=500, help="запросов get_reports_for_date на размер")
+    args = parser.parse_args()
+    args.only = set(args.only.split(','))
+    args.sizes = [int(size) for size in args.sizes.split(',') if size]
+    args.participants = [int(count) for count in args.participants.split(',') if count]
+
+    results = run_benchmarks(args)
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'seed': SEED,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        if not compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
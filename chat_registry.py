@@ -0,0 +1,85 @@
+from datetime import time, timezone, tzinfo
+from typing import Dict, Iterable, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from report_parser import ReportParser
+
+
+class ChatConfig:
+    """Настройки одной группы: участники, типы отчетов, тема для отчетов,
+    часовой пояс, время ежедневной сводки и срок хранения отчетов"""
+
+    def __init__(self, chat_id: int, title: Optional[str], topic_id: Optional[int], version: int,
+                 participants: Dict[str, str], report_types: Dict[str, Dict],
+                 tz: tzinfo = timezone.utc, summary_time: time = time(0, 5), retention_days: int = 0):
+        self.chat_id = chat_id
+        self.title = title
+        self.topic_id = topic_id or None
+        self.version = version
+        # username -> тег участника
+        self.participants = participants
+        # код типа -> {'name', 'deadline', 'emoji'} в порядке вывода в сводке
+        self.report_types = report_types
+        # Дедлайны, дата отчета и время сводки считаются в местном времени группы
+        self.timezone = tz
+        self.summary_time = summary_time
+        # Отчеты старше стольких дней удаляются (0 - хранятся всегда)
+        self.retention_days = retention_days
+
+        self.tag_to_username = {tag: username for username, tag in participants.items()}
+        # Номер участника - бит в масках сданных отчетов (ReportedTracker)
+        self.usernames = list(participants)
+        self.tag_index = {tag: index for index, tag in enumerate(participants.values())}
+        self.parser = ReportParser(participants, report_types)
+
+    @staticmethod
+    def parse_deadline(value: str) -> time:
+        """Дедлайн из строки вида ЧЧ:ММ"""
+        hours, minutes = value.split(':')
+        return time(int(hours), int(minutes))
+
+    @staticmethod
+    def parse_timezone(name: str) -> tzinfo:
+        """Часовой пояс по имени IANA (Europe/Moscow); ValueError, если такого нет"""
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            raise ValueError(f"Неизвестный часовой пояс: {name}") from e
+
+
+class ChatRegistry:
+    """Версионированный кэш настроек групп в памяти.
+
+    Настройки хранятся в базе (chats, chat_participants, chat_report_types) и
+    загружаются сюда целиком при запуске. Поиск по чату - одно обращение к
+    словарю. После правки настроек администратором группа перечитывается из
+    базы, и старая версия заменяется новой.
+    """
+
+    def __init__(self, configs: Iterable[ChatConfig] = ()):
+        self._chats: Dict[int, ChatConfig] = {config.chat_id: config for config in configs}
+
+    def get(self, chat_id: int) -> Optional[ChatConfig]:
+        return self._chats.get(chat_id)
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def chats(self) -> List[ChatConfig]:
+        """Все зарегистрированные группы"""
+        return list(self._chats.values())
+
+    def replace_all(self, configs: Iterable[ChatConfig]):
+        self._chats = {config.chat_id: config for config in configs}
+
+    def update(self, chat_id: int, config: Optional[ChatConfig]):
+        """Замена настроек группы, если версия новее (None - группа удалена)"""
+        if config is None:
+            self._chats.pop(chat_id, None)
+            return
+        current = self._chats.get(chat_id)
+        if current is None or config.version >= current.version:
+            self._chats[chat_id] = config
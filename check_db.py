@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
-import sqlite3
+from contextlib import closing
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+from sqlite_pool import connect_readonly
+
 load_dotenv()
 
 def check_database():
@@ -14,7 +16,7 @@ def check_database():
         print("❌ База данных не найдена!")
         return
 
-    with sqlite3.connect(db_path) as conn:
+    with closing(connect_readonly(db_path)) as conn:
         # Общая статистика
         cursor = conn.execute('SELECT COUNT(*) FROM reports')
         total_reports = cursor.fetchone()[0]
@@ -22,7 +24,7 @@ def check_database():
         cursor = conn.execute('SELECT COUNT(DISTINCT user_tag) FROM reports')
         unique_users = cursor.fetchone()[0]
 
-        cursor = conn.execute('SELECT COUNT(DISTINCT date(datetime)) FROM reports')
+        cursor = conn.execute('SELECT COUNT(DISTINCT report_date) FROM reports')
         unique_dates = cursor.fetchone()[0]
 
         print("📊 Статистика базы данных:")
@@ -50,7 +52,7 @@ def check_database():
 
         # Отчеты за сегодня
         today = datetime.now().date().isoformat()
-        cursor = conn.execute('SELECT COUNT(*) FROM reports WHERE date(datetime) = ?', (today,))
+        cursor = conn.execute('SELECT COUNT(*) FROM reports WHERE report_date = ?', (today,))
         today_count = cursor.fetchone()[0]
 
         print(f"\n📅 Отчетов за сегодня ({today}): {today_count}")
@@ -59,7 +61,7 @@ def check_database():
             cursor = conn.execute('''
                 SELECT user_tag, report_type, datetime
                 FROM reports
-                WHERE date(datetime) = ?
+                WHERE report_date = ?
                 ORDER BY datetime DESC
             ''', (today,))
 
@@ -1,7 +1,9 @@
-import sqlite3
+from contextlib import closing
 import os
 from dotenv import load_dotenv
 
+from sqlite_pool import connect_readonly
+
 # Загрузка переменных окружения
 load_dotenv()
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'reports.db')
@@ -9,7 +11,7 @@ DATABASE_PATH = os.getenv('DATABASE_PATH', 'reports.db')
 def check_server_db():
     """Проверка базы данных на сервере"""
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with closing(connect_readonly(DATABASE_PATH)) as conn:
             cursor = conn.execute('SELECT COUNT(*) FROM reports')
             count = cursor.fetchone()[0]
             print(f"Количество записей в базе данных: {count}")
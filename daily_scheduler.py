@@ -0,0 +1,175 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time as time_module
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from metrics import SCHEDULER_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (время срабатывания UTC, порядковый номер записи, ключ задачи, дата срабатывания)
+TimerEntry = Tuple[float, int, Hashable, date]
+
+# Обработчик срабатывания: ключ задачи и дата, к которой оно относится
+DailyCallback = Callable[[Hashable, date], Awaitable[None]]
+
+# Максимальный сон таймера: защита от перевода системных часов
+MAX_SLEEP = 60.0
+
+
+class DailyScheduler:
+    """Ежедневные задачи всех групп (сводки, напоминания) на одном таймере.
+
+    Ближайшие срабатывания лежат в min-куче по времени UTC, одна задача спит
+    до вершины кучи. Перепланирование задачи - O(log n): в кучу кладется новая
+    запись, а прежняя считается устаревшей и пропускается при извлечении.
+
+    Задача срабатывает каждый день в заданное местное время и получает дату
+    "местный день срабатывания минус day_offset" (сводка в 00:05 с day_offset=1
+    охватывает прошедший день). Если для задачи передана дата последнего
+    выполнения и последнее наступившее срабатывание пропущено (бот был
+    остановлен), оно выполняется сразу при планировании.
+    """
+
+    def __init__(self):
+        self._heap: List[TimerEntry] = []
+        self._current: Dict[Hashable, int] = {}
+        self._schedules: Dict[Hashable, Tuple[tzinfo, time, DailyCallback, int, str]] = {}
+        self._last_dates: Dict[Hashable, date] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+        # Метрики
+        self.fired = 0
+        self.caught_up = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @staticmethod
+    def next_run(tz: tzinfo, at: time, now: datetime) -> datetime:
+        """Ближайшее срабатывание после now (в часовом поясе группы)"""
+        local_now = now.astimezone(tz)
+        run = datetime.combine(local_now.date(), at, tzinfo=tz)
+        if run <= local_now:
+            run = datetime.combine(local_now.date() + timedelta(days=1), at, tzinfo=tz)
+        return run
+
+    def schedule(self, key: Hashable, tz: tzinfo, at: time, callback: DailyCallback,
+                 last_date: Optional[date] = None, day_offset: int = 0, job: str = 'daily'):
+        """Планирование (или перепланирование) ежедневной задачи.
+
+        last_date - дата последнего выполнения; если срабатывание за последний
+        наступивший день пропущено, оно ставится на сейчас. Задачи, для
+        которых дата не передавалась ни разу, пропущенное не наверстывают.
+        job - вид задачи для метрики опоздания срабатывания.
+        """
+        if last_date is not None and last_date > self._last_dates.get(key, date.min):
+            self._last_dates[key] = last_date
+        self._schedules[key] = (tz, at, callback, day_offset, job)
+
+        now = datetime.now(timezone.utc)
+        run = self.next_run(tz, at, now)
+        previous_date = run.date() - timedelta(days=1 + day_offset)
+        known = self._last_dates.get(key)
+        if known is not None and known < previous_date:
+            self.caught_up += 1
+            logger.info(f"Пропущенное срабатывание {key} за {previous_date} будет выполнено сейчас")
+            self._push(key, now.timestamp(), previous_date)
+        else:
+            self._push(key, run.timestamp(), run.date() - timedelta(days=day_offset))
+
+    def unschedule(self, key: Hashable):
+        """Отмена задачи"""
+        self._current.pop(key, None)
+        self._schedules.pop(key, None)
+
+    def _push(self, key: Hashable, timestamp: float, run_date: date):
+        seq = next(self._seq)
+        self._current[key] = seq
+        heapq.heappush(self._heap, (timestamp, seq, key, run_date))
+        # Устаревшие записи не дают куче расти бесконечно
+        if len(self._heap) > 2 * len(self._current) + 64:
+            self._heap = [entry for entry in self._heap if self._current.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def _pop_stale(self):
+        while self._heap and self._current.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._pop_stale()
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time_module.time()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=min(delay, MAX_SLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            timestamp, _, key, run_date = heapq.heappop(self._heap)
+            self._fire(key, timestamp, run_date)
+
+    def _fire(self, key: Hashable, timestamp: float, run_date: date):
+        lag = max(0.0, time_module.time() - timestamp)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+        # Следующее срабатывание планируется сразу, до выполнения
+        tz, at, callback, day_offset, job = self._schedules[key]
+        SCHEDULER_LAG_SECONDS.observe(lag, job)
+        run = self.next_run(tz, at, datetime.now(timezone.utc))
+        self._push(key, run.timestamp(), run.date() - timedelta(days=day_offset))
+
+        if run_date <= self._last_dates.get(key, date.min):
+            return
+        self._last_dates[key] = run_date
+        self.fired += 1
+        task = asyncio.get_running_loop().create_task(self._call(callback, key, run_date))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _call(self, callback: DailyCallback, key: Hashable, run_date: date):
+        try:
+            await callback(key, run_date)
+        except Exception as e:
+            logger.error(f"Ошибка выполнения задачи {key} за {run_date}: {e}")
+
+    def start(self):
+        """Запуск таймера"""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Остановка таймера и незавершенных задач"""
+        tasks = list(self._running)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        """Число задач, срабатывания и опоздание таймера"""
+        return {
+            'scheduled': len(self._current),
+            'heap_size': len(self._heap),
+            'fired': self.fired,
+            'caught_up': self.caught_up,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+        }
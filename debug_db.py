@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
-import sqlite3
+from contextlib import closing
 import os
 
+from sqlite_pool import connect_readonly
+
 db_path = 'reports.db'
 print(f'Путь к БД: {db_path}')
 print(f'Файл существует: {os.path.exists(db_path)}')
 
 if os.path.exists(db_path):
-    with sqlite3.connect(db_path) as conn:
+    with closing(connect_readonly(db_path)) as conn:
         # Проверим таблицу
         cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
         tables = cursor.fetchall()
@@ -20,12 +22,16 @@ if os.path.exists(db_path):
             print(f'Записей в таблице reports: {count}')
 
             # Покажем последние записи
-            cursor = conn.execute('SELECT * FROM reports ORDER BY id DESC LIMIT 3')
+            cursor = conn.execute('''
+                SELECT id, chat_id, user_tag, report_type, day_number, datetime
+                FROM reports ORDER BY id DESC LIMIT 3
+            ''')
             rows = cursor.fetchall()
             if rows:
                 print('Последние записи:')
-                for row in rows:
-                    print(f'  ID: {row[0]}, User: {row[1]}, Type: {row[2]}, Day: {row[3]}, DateTime: {row[4]}')
+                for report_id, chat_id, user_tag, report_type, day_number, report_datetime in rows:
+                    print(f'  ID: {report_id}, Chat: {chat_id}, User: {user_tag}, Type: {report_type}, '
+                          f'Day: {day_number}, DateTime: {report_datetime}')
             else:
                 print('Нет записей в таблице')
 else:
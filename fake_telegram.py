@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""Локальная замена Telegram Bot API для нагрузочных тестов без сети.
+
+Реализует методы, которыми пользуется бот: getMe, getUpdates (long polling
+с подтверждением по offset), sendMessage, setWebhook, deleteWebhook,
+getWebhookInfo и getChatMember. Обновления добавляются в очередь методом
+push_message (или запросом POST /fake/messages, если сервер запущен
+отдельным процессом) и отдаются боту через getUpdates либо, если задан
+вебхук, POST-запросами на его адрес.
+
+Для проверки повторов сервер умеет отвечать ошибками: 429 с retry_after,
+5xx и обрывом соединения ("drop") - случайно с долей fail_rate для методов
+из fail_methods или по расписанию на метод (первые вызовы метода получают
+ошибки из списка по порядку). Ошибка возвращается до выполнения метода,
+поэтому сообщение при ней не отправляется. Для доставки на вебхук
+(метод "webhook") ошибка означает неудачную попытку и повтор позже, а
+"drop" - доставленное обновление, ответ на которое потерялся (Telegram
+пришлет его снова).
+
+Пример:
+    python fake_telegram.py --port 8081
+    python fake_telegram.py --fail-rate 0.1 --fail-methods sendMessage,getUpdates --retry-after 2
+    python fake_telegram.py --error-schedule sendMessage=429,502,drop
+    TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8081
+WEBHOOK_RETRY_DELAY = 0.5
+WEBHOOK_MAX_ATTEMPTS = 5
+DEFAULT_FAIL_CODES = ('429', '502', 'drop')
+ERROR_DESCRIPTIONS = {
+    429: 'Too Many Requests: retry after {retry_after}',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class TelegramError(Exception):
+    """Ошибка метода в формате Bot API"""
+
+    def __init__(self, code: int, description: str, parameters: Optional[Dict] = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
+
+
+def parse_error_schedule(spec: str) -> Dict[str, List[str]]:
+    """Расписание ошибок из строки вида "sendMessage=429,502;getUpdates=drop" """
+    schedule = {}
+    for part in filter(None, (part.strip() for part in spec.split(';'))):
+        method, _, codes = part.partition('=')
+        schedule[method.strip()] = [code.strip() for code in codes.split(',') if code.strip()]
+    return schedule
+
+
+class FakeTelegramServer:
+    """Bot API в памяти: очередь обновлений, отправленные сообщения и вебхук"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, api_latency: float = 0.0,
+                 fail_rate: float = 0.0, fail_methods: Iterable[str] = ('sendMessage',),
+                 fail_codes: Iterable[str] = DEFAULT_FAIL_CODES, retry_after: int = 1,
+                 error_schedule: Optional[Dict[str, List[str]]] = None, seed: Optional[int] = None):
+        self.host = host
+        self.port = port
+        # Искусственная задержка каждого ответа (имитация сети до api.telegram.org)
+        self.api_latency = api_latency
+
+        # Внедрение ошибок: случайные для fail_methods и расписание на метод
+        self.fail_rate = fail_rate
+        self.fail_methods = frozenset(fail_methods)
+        self.fail_codes = list(fail_codes)
+        self.retry_after = retry_after
+        self._error_schedule = {method: deque(codes) for method, codes in (error_schedule or {}).items()}
+        self._rng = random.Random(seed)
+
+        self._update_ids = itertools.count(1)
+        self._message_ids: Dict[int, itertools.count] = {}
+        self._updates: Deque[Dict] = deque()
+        self._new_updates = asyncio.Event()
+
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self._webhook_queue: Optional[asyncio.Queue] = None
+        self._webhook_workers: List[asyncio.Task] = []
+        self._http: Optional[ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+
+        self.sent: List[Dict] = []
+
+        # Метрики
+        self.calls: Dict[str, int] = {}
+        self.pushed = 0
+        self.delivered = 0
+        self.webhook_failures = 0
+        self.injected: Dict[str, int] = {}
+
+    @property
+    def base_url(self) -> str:
+        """Адрес для TELEGRAM_API_URL"""
+        return f"http://{self.host}:{self.port}"
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self._handle_api)
+        app.router.add_post('/fake/messages', self._handle_push)
+        app.router.add_get('/fake/stats', self._handle_stats)
+        return app
+
+    async def start(self):
+        self._http = ClientSession(timeout=ClientTimeout(total=30))
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"Тестовый Bot API слушает {self.base_url}")
+
+    async def stop(self):
+        await self._stop_webhook()
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._http is not None:
+            await self._http.close()
+
+    # Входящие обновления
+
+    def push_update(self, update: Dict) -> int:
+        """Добавление обновления (без update_id) в очередь; возвращает его update_id"""
+        update_id = next(self._update_ids)
+        update = {'update_id': update_id, **update}
+        self.pushed += 1
+        if self._webhook_queue is not None:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+        return update_id
+
+    def push_message(self, chat_id: int, text: str, user_id: int, username: Optional[str] = None,
+                     thread_id: Optional[int] = None, chat_title: str = 'Test group') -> Dict:
+        """Сообщение участника в группе; возвращает объект Message"""
+        message = self._message(chat_id, text, chat_title, thread_id)
+        message['from'] = {'id': user_id, 'is_bot': False, 'first_name': username or str(user_id)}
+        if username:
+            message['from']['username'] = username
+        self.push_update({'message': message})
+        return message
+
+    def _message(self, chat_id: int, text: str, chat_title: str = 'Test group',
+                 thread_id: Optional[int] = None) -> Dict:
+        message_ids = self._message_ids.setdefault(chat_id, itertools.count(1))
+        message = {
+            'message_id': next(message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': chat_title},
+            'text': text,
+        }
+        if thread_id:
+            message['message_thread_id'] = thread_id
+            message['is_topic_message'] = True
+        return message
+
+    # HTTP
+
+    async def _handle_api(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        params = await self._params(request)
+        handler = getattr(self, f"api_{method}", None)
+        try:
+            if handler is None:
+                raise TelegramError(404, 'Not Found: method not found')
+            if self.api_latency:
+                await asyncio.sleep(self.api_latency)
+            fault = self._next_fault(method)
+            if fault == 'drop':
+                # Обрыв соединения без ответа: клиент получает сетевую ошибку
+                request.transport.close()
+                return web.Response(status=500)
+            if fault is not None:
+                raise self._fault_error(int(fault))
+            result = await handler(request.match_info['token'], params)
+        except TelegramError as e:
+            body = {'ok': False, 'error_code': e.code, 'description': e.description}
+            if e.parameters:
+                body['parameters'] = e.parameters
+            return web.json_response(body, status=e.code)
+        return web.json_response({'ok': True, 'result': result})
+
+    def _next_fault(self, method: str) -> Optional[str]:
+        """Ошибка для очередного вызова метода: сначала по расписанию, затем случайная"""
+        scheduled = self._error_schedule.get(method)
+        if scheduled:
+            fault = scheduled.popleft()
+        elif self.fail_rate and method in self.fail_methods and self._rng.random() < self.fail_rate:
+            fault = self._rng.choice(self.fail_codes)
+        else:
+            return None
+        self.injected[method] = self.injected.get(method, 0) + 1
+        return fault
+
+    def _fault_error(self, code: int) -> TelegramError:
+        description = ERROR_DESCRIPTIONS.get(code, 'Bad Request: injected error')
+        if code == 429:
+            return TelegramError(code, description.format(retry_after=self.retry_after),
+                                 {'retry_after': self.retry_after})
+        return TelegramError(code, description)
+
+    @staticmethod
+    async def _params(request: web.Request) -> Dict[str, Any]:
+        """Параметры метода: query, form-data (так шлет aiogram) или JSON"""
+        params: Dict[str, Any] = dict(request.query)
+        if request.content_type == 'application/json':
+            params.update(await request.json())
+        elif request.can_read_body:
+            params.update(await request.post())
+        return params
+
+    async def _handle_push(self, request: web.Request) -> web.Response:
+        data = await request.json()
+        message = self.push_message(
+            int(data['chat_id']), data['text'], int(data.get('user_id', 1)),
+            data.get('username'), data.get('thread_id'),
+        )
+        return web.json_response({'ok': True, 'result': message})
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    # Методы Bot API
+
+    async def api_getMe(self, token: str, params: Dict) -> Dict:
+        bot_id = int(token.split(':', 1)[0]) if token.split(':', 1)[0].isdigit() else 1
+        return {'id': bot_id, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_report_bot',
+                'can_join_groups': True, 'can_read_all_group_messages': True, 'supports_inline_queries': False}
+
+    async def api_getUpdates(self, token: str, params: Dict) -> List[Dict]:
+        if self.webhook_url:
+            raise TelegramError(409, "Conflict: can't use getUpdates method while webhook is active; "
+                                     "use deleteWebhook to delete the webhook first")
+        offset = int(params.get('offset') or 0)
+        limit = min(max(int(params.get('limit') or 100), 1), 100)
+        timeout = float(params.get('timeout') or 0)
+
+        # Обновления с update_id меньше offset подтверждены и больше не отдаются
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        updates = list(itertools.islice(self._updates, limit))
+        self.delivered += len(updates)
+        return updates
+
+    async def api_sendMessage(self, token: str, params: Dict) -> Dict:
+        if not params.get('text'):
+            raise TelegramError(400, 'Bad Request: message text is empty')
+        chat_id = int(params['chat_id'])
+        thread_id = params.get('message_thread_id')
+        message = self._message(chat_id, params['text'], thread_id=int(thread_id) if thread_id else None)
+        message['from'] = await self.api_getMe(token, {})
+        self.sent.append(message)
+        return message
+
+    async def api_getChatMember(self, token: str, params: Dict) -> Dict:
+        # Любой участник считается владельцем группы: административные команды доступны
+        user_id = int(params['user_id'])
+        return {'status': 'creator', 'is_anonymous': False,
+                'user': {'id': user_id, 'is_bot': False, 'first_name': str(user_id)}}
+
+    async def api_setWebhook(self, token: str, params: Dict) -> bool:
+        url = params.get('url') or ''
+        if not url:
+            return await self.api_deleteWebhook(token, params)
+        await self._stop_webhook()
+        self.webhook_url = url
+        self.webhook_secret = params.get('secret_token') or None
+        self._webhook_queue = asyncio.Queue()
+        if str(params.get('drop_pending_updates')).lower() == 'true':
+            self._updates.clear()
+        # Накопленные обновления уходят на вебхук
+        while self._updates:
+            self._webhook_queue.put_nowait(self._updates.popleft())
+        workers = int(params.get('max_connections') or 40)
+        self._webhook_workers = [asyncio.create_task(self._webhook_worker()) for _ in range(workers)]
+        logger.info(f"Вебхук установлен: {url} ({workers} соединений)")
+        return True
+
+    async def api_deleteWebhook(self, token: str, params: Dict) -> bool:
+        pending = await self._stop_webhook()
+        if str(params.get('drop_pending_updates')).lower() != 'true':
+            self._updates.extend(pending)
+            if pending:
+                self._new_updates.set()
+        return True
+
+    async def api_getWebhookInfo(self, token: str, params: Dict) -> Dict:
+        pending = self._webhook_queue.qsize() if self._webhook_queue is not None else len(self._updates)
+        return {'url': self.webhook_url or '', 'has_custom_certificate': False, 'pending_update_count': pending}
+
+    # Доставка на вебхук
+
+    async def _webhook_worker(self):
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+        while True:
+            update = await self._webhook_queue.get()
+            try:
+                for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+                    fault = self._next_fault('webhook')
+                    try:
+                        if fault is not None and fault != 'drop':
+                            raise ConnectionError(f"внедренная ошибка {fault}")
+                        async with self._http.post(self.webhook_url, json=update, headers=headers) as response:
+                            if response.status < 300 and fault is None:
+                                self.delivered += 1
+                                break
+                            # "drop": бот обновление получил, но ответ потерялся
+                            error = f"HTTP {response.status}" if fault is None else "ответ потерян"
+                    except Exception as e:
+                        error = str(e)
+                    if attempt == WEBHOOK_MAX_ATTEMPTS:
+                        self.webhook_failures += 1
+                        logger.warning(f"Обновление {update['update_id']} не доставлено на вебхук: {error}")
+                    else:
+                        await asyncio.sleep(WEBHOOK_RETRY_DELAY)
+            except asyncio.CancelledError:
+                # Вебхук сняли во время доставки: как в Telegram, обновление остается ожидающим
+                self._webhook_queue.put_nowait(update)
+                raise
+
+    async def _stop_webhook(self) -> List[Dict]:
+        """Остановка доставки; возвращает недоставленные обновления"""
+        for task in self._webhook_workers:
+            task.cancel()
+        await asyncio.gather(*self._webhook_workers, return_exceptions=True)
+        self._webhook_workers = []
+        pending = []
+        if self._webhook_queue is not None:
+            while not self._webhook_queue.empty():
+                pending.append(self._webhook_queue.get_nowait())
+            pending.sort(key=lambda update: update['update_id'])
+        self._webhook_queue = None
+        self.webhook_url = None
+        self.webhook_secret = None
+        return pending
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pushed': self.pushed,
+            'delivered': self.delivered,
+            'queued': len(self._updates) + (self._webhook_queue.qsize() if self._webhook_queue is not None else 0),
+            'sent_messages': len(self.sent),
+            'webhook_failures': self.webhook_failures,
+            'injected_errors': dict(self.injected),
+            'calls': dict(self.calls),
+        }
+
+
+def add_fault_arguments(parser: argparse.ArgumentParser):
+    """Параметры внедрения ошибок (общие с load_test.py)"""
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="доля вызовов fail-methods с ошибкой")
+    parser.add_argument('--fail-methods', default='sendMessage',
+                        help="методы со случайными ошибками через запятую (webhook - доставка на вебхук)")
+    parser.add_argument('--fail-codes', default=','.join(DEFAULT_FAIL_CODES),
+                        help="случайные ошибки: коды HTTP и drop (обрыв соединения)")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after в ответах 429, с")
+    parser.add_argument('--error-schedule', default='',
+                        help="ошибки первых вызовов метода, например sendMessage=429,502;getUpdates=drop")
+
+
+async def serve(args):
+    server = FakeTelegramServer(
+        args.host, args.port, api_latency=args.api_latency_ms / 1000,
+        fail_rate=args.fail_rate, fail_methods=args.fail_methods.split(','), fail_codes=args.fail_codes.split(','),
+        retry_after=args.retry_after, error_schedule=parse_error_schedule(args.error_schedule),
+    )
+    await server.start()
+    print(f"TELEGRAM_API_URL={server.base_url}")
+    print(f"Сообщение в группу: curl -X POST {server.base_url}/fake/messages "
+          f"-d '{json.dumps({'chat_id': -100, 'text': '#ос1 #ан', 'username': 'A_N_yaki'})}'")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный тестовый Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="задержка каждого ответа")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
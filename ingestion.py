@@ -0,0 +1,184 @@
+import heapq
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Повторная доставка возвращает обновления чуть ниже отметки; обновление ниже нее
+# больше чем на столько значит, что Telegram начал нумерацию заново (так бывает
+# после недели без обновлений - следующий update_id выбирается случайно)
+UPDATE_ID_RESET_GAP = 100000
+
+# Сколько секунд ждать пропущенное обновление, прежде чем сдвинуть отметку через разрыв
+# (вебхук повторяет неудачные доставки, и обновление может прийти заметно позже следующих)
+UPDATE_GAP_TIMEOUT = 300.0
+
+
+class UpdateWatermark:
+    """Учет обработанных обновлений и отметка для перезапуска.
+
+    Повтором считается обновление не старше отметки, загруженной при запуске
+    (floor), или уже виденное в этом процессе (набор недавних update_id).
+    Обновления могут приходить и завершаться не по порядку (вебхук доставляет
+    их параллельно и повторяет неудачные доставки), поэтому пропущенный
+    update_id ниже уже виденного повтором не считается.
+
+    Сохраняемая отметка (value) сдвигается только по непрерывной цепочке
+    виденных и обработанных update_id. Разрыв в цепочке (обновление так и не
+    пришло) пропускается, если он держится дольше gap_timeout секунд: в режиме
+    polling getUpdates отдает обновления по порядку, и там разрыв настоящий
+    сразу (gap_timeout=0). Обновление из пропущенного разрыва, пришедшее
+    позже, все равно обрабатывается.
+
+    Если пришло обновление намного ниже отметки (больше чем на reset_gap), а
+    обработка ничего не ждет, Telegram сбросил нумерацию: отметка переносится
+    на это обновление, иначе все новые обновления отбрасывались бы как повторы.
+    """
+
+    def __init__(self, last_update_id: int = 0, reset_gap: int = UPDATE_ID_RESET_GAP,
+                 gap_timeout: float = UPDATE_GAP_TIMEOUT, seen_limit: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.reset_gap = reset_gap
+        self.gap_timeout = gap_timeout
+        self.seen_limit = seen_limit
+        self._clock = clock
+        self.resets = 0
+        self.gaps_skipped = 0
+        self._floor = last_update_id
+        self._value = last_update_id
+        # Виденные update_id: выше отметки - все, не выше - последние seen_limit
+        self._seen: Set[int] = set()
+        self._passed: Deque[int] = deque()
+        self._ahead: List[int] = []
+        self._in_flight: Set[int] = set()
+        self._gap_since: Optional[float] = None
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def is_processed(self, update_id: int) -> bool:
+        return update_id <= self._floor or update_id in self._seen
+
+    def check_reset(self, update_id: int) -> bool:
+        """Перенос отметки, если update_id говорит о новой нумерации; True, если отметка сброшена"""
+        if self._in_flight or update_id >= self._value - self.reset_gap:
+            return False
+        logger.warning(f"update_id {update_id} намного меньше отметки {self._value}: "
+                       f"нумерация обновлений началась заново, отметка сброшена")
+        self._floor = self._value = update_id - 1
+        self._seen.clear()
+        self._passed.clear()
+        self._ahead = []
+        self._gap_since = None
+        self.resets += 1
+        return True
+
+    def begin(self, update_id: int):
+        self._seen.add(update_id)
+        self._in_flight.add(update_id)
+        if update_id > self._value:
+            heapq.heappush(self._ahead, update_id)
+        else:
+            # Обновление из пропущенного разрыва: отметка его уже прошла
+            self._passed.append(update_id)
+        self.advance()
+
+    def done(self, update_id: int):
+        self._in_flight.discard(update_id)
+        self.advance()
+
+    def advance(self):
+        """Сдвиг отметки по непрерывной цепочке обработанных update_id (и через разрывы старше gap_timeout)"""
+        ahead = self._ahead
+        while ahead:
+            head = ahead[0]
+            if head <= self._value:
+                heapq.heappop(ahead)
+                continue
+            if head != self._value + 1:
+                # До первого обновления после запуска с пустой базой разрыва нет
+                if self._value and not self._gap_expired():
+                    break
+                if self._value:
+                    self.gaps_skipped += 1
+                self._value = head - 1
+                self._gap_since = None
+            if head in self._in_flight:
+                break
+            heapq.heappop(ahead)
+            self._value = head
+            self._passed.append(head)
+        if not ahead or ahead[0] == self._value + 1:
+            self._gap_since = None
+        while len(self._passed) > self.seen_limit:
+            self._seen.discard(self._passed.popleft())
+
+    def _gap_expired(self) -> bool:
+        now = self._clock()
+        if self._gap_since is None:
+            self._gap_since = now
+        return now - self._gap_since >= self.gap_timeout
+
+    def pending(self) -> int:
+        return len(self._in_flight)
+
+
+class UpdateCheckpointMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: пропуск повторов и учет отметки"""
+
+    def __init__(self, watermark: UpdateWatermark):
+        self.watermark = watermark
+        self.replays = 0
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        update_id = event.update_id
+        self.watermark.check_reset(update_id)
+        if self.watermark.is_processed(update_id):
+            self.replays += 1
+            return None
+        self.watermark.begin(update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            self.watermark.done(update_id)
+
+
+class ProcessedMessages:
+    """Ограниченный LRU-набор недавно обработанных сообщений (chat_id, message_id).
+
+    Повторно доставленное сообщение с отчетом отбрасывается до разбора, поэтому
+    INSERT OR REPLACE не перезапишет более новый отчет старым. Набор
+    восстанавливается из таблицы processed_messages при запуске.
+    """
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._keys: "OrderedDict[Hashable, None]" = OrderedDict()
+        self.duplicates = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        if key in self._keys:
+            self.duplicates += 1
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(self, key: Hashable):
+        self._keys[key] = None
+        self._keys.move_to_end(key)
+        while len(self._keys) > self.maxsize:
+            self._keys.popitem(last=False)
+
+    def load(self, keys: Iterable[Hashable]):
+        """Заполнение из базы (ключи от старых к новым)"""
+        for key in keys:
+            self.add(key)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""Нагрузочный тест бота на локальном тестовом Bot API (fake_telegram.py).
+
+Бот запускается в этом же процессе с TELEGRAM_API_URL, указывающим на
+тестовый сервер, и временной базой. Генератор с заданной скоростью кладет
+в очередь сервера сообщения с отчетами; задержка считается от постановки
+сообщения в очередь до завершения обработчика, то есть до коммита отчетов
+и отметки обработанного сообщения. В конце проверяется, что в базе есть
+все уникальные отчеты.
+
+С --sends N бот после приема сообщений отправляет N сообщений через
+outbox, и проверяется, что каждое дошло до сервера ровно один раз. Вместе с
+параметрами внедрения ошибок (--fail-rate, --error-schedule и другие, как у
+fake_telegram.py) это проверяет повторы на 429, 5xx и обрывах соединения.
+
+Пример:
+    python load_test.py --messages 20000 --rate 2000
+    python load_test.py --mode webhook --chats 5 --output load.json
+    python load_test.py --sends 200 --fail-rate 0.2 --fail-methods sendMessage,getUpdates
+    python load_test.py --mode webhook --sends 200 --fail-rate 0.1 --fail-methods sendMessage,webhook
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Message
+
+from fake_telegram import FakeTelegramServer, add_fault_arguments, parse_error_schedule
+
+SEED = 42
+BASE_CHAT_ID = -1000000000000
+DRAIN_TIMEOUT = 60
+PUSH_TICK = 0.005
+# Задержка повторов отправки в тесте: экспоненциальная от 50 мс, не больше 1 с
+SEND_BACKOFF = 0.05
+SEND_MAX_BACKOFF = 1.0
+
+
+class CommitLatencyMiddleware(BaseMiddleware):
+    """Время от постановки сообщения в очередь Bot API до завершения обработчика"""
+
+    def __init__(self, pushed_at: Dict[Tuple[int, int], float]):
+        self.pushed_at = pushed_at
+        self.latencies: List[float] = []
+        self.completed_at = 0.0
+        self.all_done = asyncio.Event()
+        self.expected = 0
+
+    async def __call__(self, handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+                       event: Message, data: Dict[str, Any]) -> Any:
+        result = await handler(event, data)
+        pushed_at = self.pushed_at.pop((event.chat.id, event.message_id), None)
+        if pushed_at is not None:
+            self.completed_at = time.perf_counter()
+            self.latencies.append(self.completed_at - pushed_at)
+            if len(self.latencies) >= self.expected:
+                self.all_done.set()
+        return result
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def report_corpus(rng: random.Random, count: int, chat_ids: List[int], participants: Dict[str, str],
+                  report_types: Dict[str, Dict], users: int) -> Tuple[List[Tuple], Set[Tuple]]:
+    """Сообщения (chat_id, user_id, username, text) с 1-3 отчетами и множество уникальных отчетов"""
+    usernames = list(participants)
+    types = list(report_types)
+    messages = []
+    expected = set()
+    for _ in range(count):
+        chat_id = rng.choice(chat_ids)
+        user_id = rng.randrange(users) + 1
+        username = usernames[user_id % len(usernames)]
+        parts = []
+        for _ in range(rng.choice((1, 1, 1, 2, 3))):
+            report_type, tag, day = rng.choice(types), rng.choice(list(participants.values())), rng.randint(1, 365)
+            parts.append(f"#{report_type}{day} {tag}")
+            expected.add((chat_id, tag, report_type, day))
+        messages.append((chat_id, user_id, username.lstrip('@'), ' '.join(parts) + ' отчет за день'))
+    return messages, expected
+
+
+async def generate(server: FakeTelegramServer, messages: List[Tuple], rate: float,
+                   pushed_at: Dict[Tuple[int, int], float]) -> float:
+    """Постановка сообщений в очередь со скоростью rate в секунду; возвращает время начала"""
+    started = time.perf_counter()
+    sent = 0
+    while sent < len(messages):
+        due = len(messages) if rate <= 0 else min(len(messages), int((time.perf_counter() - started) * rate) + 1)
+        for chat_id, user_id, username, text in messages[sent:due]:
+            message = server.push_message(chat_id, text, user_id, username)
+            pushed_at[(chat_id, message['message_id'])] = time.perf_counter()
+        sent = due
+        await asyncio.sleep(PUSH_TICK)
+    return started
+
+
+async def run_load(args) -> Dict[str, Any]:
+    server = FakeTelegramServer(
+        port=args.api_port, api_latency=args.api_latency_ms / 1000,
+        fail_rate=args.fail_rate, fail_methods=args.fail_methods.split(','), fail_codes=args.fail_codes.split(','),
+        retry_after=args.retry_after, error_schedule=parse_error_schedule(args.error_schedule), seed=SEED,
+    )
+    await server.start()
+
+    # Настройки бота читаются из окружения при импорте main
+    workdir = tempfile.TemporaryDirectory(prefix='bot-load-')
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '1:loadtest',
+        'TELEGRAM_API_URL': server.base_url,
+        'DATABASE_PATH': os.path.join(workdir.name, 'load.db'),
+        'GROUP_CHAT_ID': str(BASE_CHAT_ID),
+        'REPORTS_TOPIC_ID': '0',
+        'BOT_MODE': args.mode,
+        'WEBHOOK_BASE_URL': f"http://127.0.0.1:{args.webhook_port}",
+        'WEBHOOK_HOST': '127.0.0.1',
+        'WEBHOOK_PORT': str(args.webhook_port),
+        'WEBHOOK_SECRET': 'load-test',
+        'LOG_LEVEL': os.getenv('LOG_LEVEL', 'WARNING'),
+    })
+    # Лимиты отправки не должны растягивать проверку доставки на минуты
+    os.environ.setdefault('SEND_GLOBAL_RATE', '1000')
+    os.environ.setdefault('SEND_CHAT_RATE_PER_MIN', '60000')
+    from main import PARTICIPANTS, REPORT_TYPES, ReportBot
+
+    chat_ids = [BASE_CHAT_ID - i for i in range(args.chats)]
+    bot = ReportBot()
+    bot.sender.base_backoff = SEND_BACKOFF
+    bot.sender.max_backoff = SEND_MAX_BACKOFF
+    bot.sender.chat_burst = 100
+    for chat_id in chat_ids[1:]:
+        bot.db.register_chat(chat_id, None, None, PARTICIPANTS, REPORT_TYPES)
+    bot.registry.replace_all(bot.db.load_chat_configs())
+
+    rng = random.Random(SEED)
+    messages, expected = report_corpus(rng, args.messages, chat_ids, PARTICIPANTS, REPORT_TYPES, args.users)
+    pushed_at: Dict[Tuple[int, int], float] = {}
+    latency = CommitLatencyMiddleware(pushed_at)
+    latency.expected = len(messages)
+    bot.dp.message.middleware(latency)
+
+    ready = asyncio.Event()
+    bot.dp.startup.register(ready.set)
+    bot_task = asyncio.create_task(bot.run())
+    await ready.wait()
+    if args.mode == 'webhook':
+        # Вебхук регистрируется после остальных обработчиков запуска
+        while server.webhook_url is None:
+            await asyncio.sleep(0.01)
+
+    print(f"🚀 {len(messages)} сообщений в {args.chats} чат(ов), режим {args.mode}, "
+          f"скорость {args.rate or 'без ограничения'} в секунду", file=sys.stderr)
+    started = await generate(server, messages, args.rate, pushed_at)
+    pushed = time.perf_counter() - started
+    try:
+        await asyncio.wait_for(latency.all_done.wait(), args.drain_timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️ Не дождались обработки {len(pushed_at)} сообщений за {args.drain_timeout} с", file=sys.stderr)
+    elapsed = (latency.completed_at or time.perf_counter()) - started
+
+    # Исходящие сообщения: все через outbox, по очереди на чат
+    sends = [f"load-send-{i}" for i in range(args.sends)]
+    send_ok = True
+    if sends:
+        try:
+            results = await asyncio.wait_for(asyncio.gather(*(
+                bot.sender.send_many(chat_id, sends[i::len(chat_ids)])
+                for i, chat_id in enumerate(chat_ids)
+            )), args.drain_timeout)
+            send_ok = all(results)
+        except asyncio.TimeoutError:
+            send_ok = False
+            print(f"⚠️ Не дождались отправки сообщений за {args.drain_timeout} с", file=sys.stderr)
+    sent_counts = Counter(message['text'] for message in server.sent)
+    delivered_once = sum(1 for text in sends if sent_counts[text] == 1)
+    duplicated = sum(1 for text in sends if sent_counts[text] > 1)
+
+    stats = {
+        'sender': bot.sender.stats(),
+        'updates': {'replays': bot.update_checkpoint.replays, 'duplicate_messages': bot.processed.duplicates},
+        'write_buffer': bot.storage.write_buffer.stats(),
+        'handlers': bot.handler_pool.stats(),
+        'prefilter': bot.prefilter.stats(),
+    }
+    if args.mode == 'webhook':
+        bot_task.cancel()
+    else:
+        await bot.dp.stop_polling()
+    await asyncio.gather(bot_task, return_exceptions=True)
+    await server.stop()
+
+    with sqlite3.connect(os.environ['DATABASE_PATH']) as conn:
+        stored = conn.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+    workdir.cleanup()
+
+    samples = sorted(latency.latencies)
+    return {
+        'meta': {
+            'mode': args.mode,
+            'messages': len(messages),
+            'chats': args.chats,
+            'users': args.users,
+            'rate': args.rate,
+            'api_latency_ms': args.api_latency_ms,
+        },
+        'committed': len(samples),
+        'lost_messages': len(messages) - len(samples),
+        'unique_reports': len(expected),
+        'stored_reports': stored,
+        'push_seconds': pushed,
+        'elapsed_seconds': elapsed,
+        'throughput_per_sec': len(samples) / elapsed if elapsed else 0.0,
+        'sends': {
+            'requested': len(sends),
+            'delivered_once': delivered_once,
+            'duplicated': duplicated,
+            'missing': len(sends) - delivered_once - duplicated,
+            'all_confirmed': send_ok,
+        },
+        'latency_ms': {
+            'p50': percentile(samples, 0.50) * 1000,
+            'p90': percentile(samples, 0.90) * 1000,
+            'p99': percentile(samples, 0.99) * 1000,
+            'max': samples[-1] * 1000 if samples else 0.0,
+        },
+        'server': server.stats(),
+        'bot': stats,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальном Bot API")
+    parser.add_argument('--messages', type=int, default=10000, help="всего сообщений с отчетами")
+    parser.add_argument('--rate', type=float, default=1000, help="сообщений в секунду (0 - все сразу)")
+    parser.add_argument('--chats', type=int, default=1, help="число групп")
+    parser.add_argument('--users', type=int, default=200, help="число отправителей (ключей очереди обработчиков)")
+    parser.add_argument('--mode', choices=('polling', 'webhook'), default='polling')
+    parser.add_argument('--api-port', type=int, default=8081, help="порт тестового Bot API")
+    parser.add_argument('--webhook-port', type=int, default=8082, help="порт вебхука бота")
+    parser.add_argument('--api-latency-ms', type=float, default=0.0, help="задержка каждого ответа Bot API")
+    parser.add_argument('--sends', type=int, default=0, help="сообщений для отправки ботом через outbox")
+    add_fault_arguments(parser)
+    parser.add_argument('--drain-timeout', type=float, default=DRAIN_TIMEOUT,
+                        help="сколько ждать обработки после отправки последнего сообщения, с")
+    parser.add_argument('--output', help="файл для результатов в JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_load(args))
+
+    latency = result['latency_ms']
+    print(f"Обработано: {result['committed']}/{result['meta']['messages']} сообщений "
+          f"за {result['elapsed_seconds']:.2f} с ({result['throughput_per_sec']:.0f} в секунду)")
+    print(f"Задержка до коммита, мс: p50 {latency['p50']:.1f}, p90 {latency['p90']:.1f}, "
+          f"p99 {latency['p99']:.1f}, max {latency['max']:.1f}")
+    print(f"Отчетов в базе: {result['stored_reports']} из {result['unique_reports']} уникальных")
+    print(f"Запись: {result['bot']['write_buffer']}")
+    if result['server']['injected_errors']:
+        print(f"Внедрено ошибок: {result['server']['injected_errors']}, повторы обновлений: {result['bot']['updates']}")
+    sends = result['sends']
+    if sends['requested']:
+        print(f"Отправка: ровно один раз {sends['delivered_once']}/{sends['requested']}, "
+              f"повторно {sends['duplicated']}, не дошло {sends['missing']}; {result['bot']['sender']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+
+    if result['lost_messages'] or result['stored_reports'] != result['unique_reports']:
+        sys.exit(1)
+    if sends['delivered_once'] != sends['requested'] or not sends['all_confirmed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Dict, Hashable, Optional
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничение частоты и выборка записей по виду события.
+
+    Вид события - extra={'event': ...} в вызове логгера, а без него - место
+    вызова (файл и строка). На каждый вид - ведро токенов: не больше rate
+    записей в секунду с запасом burst; о пропущенных сообщает следующая
+    прошедшая запись этого вида. sample_rates задает долю записей, которые
+    вообще проходят, для отдельных событий (например, {'report_saved': 0.1}).
+    Записи уровня ERROR и выше не выборочно отбрасываются, но тоже ограничены.
+    """
+
+    def __init__(self, rate: float = 0.0, burst: Optional[float] = None,
+                 sample_rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.sample_rates = sample_rates or {}
+        # вид события -> [токены, время обновления, пропущено записей]
+        self._buckets: Dict[Hashable, list] = {}
+        self._lock = threading.Lock()
+
+        # Метрики
+        self.sampled_out = 0
+        self.rate_limited = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, 'event', None)
+        if event is not None and record.levelno < logging.ERROR:
+            sample_rate = self.sample_rates.get(event)
+            if sample_rate is not None and random.random() >= sample_rate:
+                self.sampled_out += 1
+                return False
+        if self.rate <= 0:
+            return True
+
+        key = event if event is not None else (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                self.rate_limited += 1
+                return False
+            bucket[0] -= 1
+            suppressed, bucket[2] = bucket[2], 0
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} (пропущено похожих записей: {suppressed})"
+            record.args = None
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'sampled_out': self.sampled_out, 'rate_limited': self.rate_limited}
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Стандартный QueueHandler.prepare() собирает сообщение сразу (в цикле
+    событий); здесь запись уходит в очередь как есть, и msg % args
+    выполняется в потоке QueueListener. Очередь живет в том же процессе,
+    поэтому аргументы не сериализуются, но и не копируются: в горячих местах
+    в лог передаются только неизменяемые значения.
+    """
+
+    def __init__(self, log_queue: queue.Queue, rate_filter: RateLimitFilter):
+        super().__init__(log_queue)
+        self.rate_filter = rate_filter
+        self.addFilter(rate_filter)
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Диск не успевает: запись теряется, но цикл событий не ждет
+            self.dropped += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.rate_filter.stats(), 'dropped': self.dropped, 'queued': self.queue.qsize()}
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Доли выборки из строки вида "report_saved=0.1,batch_saved=0.01" """
+    rates = {}
+    for part in value.replace(' ', '').split(','):
+        if part:
+            event, rate = part.split('=', 1)
+            rates[event] = float(rate)
+    return rates
+
+
+def setup_logging(level: str = 'INFO', rate: float = 0.0, burst: Optional[float] = None,
+                  sample_rates: Optional[Dict[str, float]] = None,
+                  max_queue: int = 10000) -> LazyQueueHandler:
+    """Корневой логгер пишет через очередь: вывод в stderr идет в отдельном потоке.
+
+    Возвращает обработчик корневого логгера (его stats() - счетчики
+    отброшенных записей); поток записи останавливается с досылкой очереди
+    при выходе из процесса.
+    """
+    log_queue: queue.Queue = queue.Queue(max_queue)
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+
+    handler = LazyQueueHandler(log_queue, RateLimitFilter(rate, burst, sample_rates))
+    handler.listener = listener
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level.upper()))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return handler
@@ -1,27 +1,127 @@
 import asyncio
 import logging
-import sqlite3
-from datetime import datetime, time, timedelta
-from typing import Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta, timezone, tzinfo
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import os
 from dotenv import load_dotenv
 from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.enums import ChatMemberStatus
+from aiogram.filters import Command, CommandObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from async_storage import AsyncReportStorage
+from message_filters import ReportPrefilter
+from chat_registry import ChatConfig, ChatRegistry
+from daily_scheduler import DailyScheduler
+from ingestion import ProcessedMessages, UpdateCheckpointMiddleware, UpdateWatermark
+from logging_setup import parse_sample_rates, setup_logging
+from metrics import (
+    PARSE_SECONDS, REGISTRY, RETENTION_LOCK_SECONDS, START_TIME, HandlerMetricsMiddleware, start_metrics_server
+)
+from migrate_db import (
+    create_reports_table, local_report_date, migrate_chat_retention, migrate_chat_schedule, migrate_daily_status,
+    migrate_message_index, migrate_multi_chat, migrate_report_date
+)
+from outbox import OutboundSender
+from profiling import Profiler, ProfilingMiddleware
+from reminders import ReportedTracker, parse_offsets, reminder_times
+from retention import RetentionCleaner
+from report_cache import ReportsCache
+from sqlite_pool import SQLiteConnectionManager
+from summary_render import SummaryLine, SummarySection, render_summary, split_summary
+from task_pool import KeyedTaskPool, release_slot
 
 # Загрузка переменных окружения
 load_dotenv()
 
 # Конфигурация
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# Адрес Bot API (например, локальный тестовый сервер); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
 GROUP_CHAT_ID = int(os.getenv('GROUP_CHAT_ID', 0))
+REPORTS_TOPIC_ID = int(os.getenv('REPORTS_TOPIC_ID', 0))
+# Часовой пояс групп и время ежедневной сводки за прошедший день по умолчанию
+# (у каждой группы можно задать свои командами /set_timezone и /set_summary_time)
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
+SUMMARY_TIME = os.getenv('SUMMARY_TIME', '00:05')
+# За сколько минут до дедлайна напоминать не сдавшим отчет (через запятую; пусто - без напоминаний)
+REMINDER_OFFSETS = parse_offsets(os.getenv('REMINDER_OFFSETS', '30'))
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', 8080)))
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'reports.db')
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Логи пишутся в отдельном потоке через очередь; одинаковых записей - не больше
+# LOG_RATE_LIMIT в секунду (0 - без ограничения), LOG_SAMPLING - доли для событий
+LOG_RATE_LIMIT = float(os.getenv('LOG_RATE_LIMIT', 50))
+LOG_RATE_BURST = float(os.getenv('LOG_RATE_BURST', 200))
+LOG_SAMPLING = parse_sample_rates(os.getenv('LOG_SAMPLING', ''))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+
+# Настройки соединений с SQLite
+DB_READERS = int(os.getenv('DB_READERS', 4))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+DB_CACHE_SIZE_KIB = int(os.getenv('DB_CACHE_SIZE_KIB', 16384))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_MAX_PENDING_WRITES = int(os.getenv('DB_MAX_PENDING_WRITES', 1000))
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', 100))
+WRITE_MAX_DELAY_MS = int(os.getenv('WRITE_MAX_DELAY_MS', 50))
+REPORTS_CACHE_SIZE = int(os.getenv('REPORTS_CACHE_SIZE', 32))
+
+# Параллельная обработка сообщений (порядок сохраняется для одного пользователя)
+HANDLER_WORKERS = int(os.getenv('HANDLER_WORKERS', 8))
+HANDLER_MAX_QUEUE = int(os.getenv('HANDLER_MAX_QUEUE', 1000))
+
+# Защита от повторной доставки: отметка update_id сохраняется не чаще раза в интервал,
+# обработанные сообщения помнятся в памяти (LRU) и в базе (TTL)
+UPDATE_CHECKPOINT_INTERVAL_MS = int(os.getenv('UPDATE_CHECKPOINT_INTERVAL_MS', 1000))
+PROCESSED_MESSAGES_LIMIT = int(os.getenv('PROCESSED_MESSAGES_LIMIT', 50000))
+PROCESSED_MESSAGES_TTL_HOURS = int(os.getenv('PROCESSED_MESSAGES_TTL_HOURS', 72))
+UPDATE_GAP_TIMEOUT_SEC = float(os.getenv('UPDATE_GAP_TIMEOUT_SEC', 300))
+
+# Ограничения исходящих сообщений (лимиты Telegram: ~30/с всего, ~20/мин в группу)
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', 25))
+SEND_CHAT_RATE_PER_MIN = float(os.getenv('SEND_CHAT_RATE_PER_MIN', 20))
+SEND_MAX_ATTEMPTS = int(os.getenv('SEND_MAX_ATTEMPTS', 8))
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 - выключено)
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Профилирование по запросу (по умолчанию выключено): доля обновлений под cProfile,
+# порог медленной обработки, период снимков tracemalloc; файлы пишутся в PROFILE_DIR
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+SLOW_HANDLER_MS = int(os.getenv('SLOW_HANDLER_MS', 0))
+TRACEMALLOC_INTERVAL_MIN = float(os.getenv('TRACEMALLOC_INTERVAL_MIN', 0))
+TRACEMALLOC_FRAMES = int(os.getenv('TRACEMALLOC_FRAMES', 1))
+
+# Хранение отчетов: срок по умолчанию в днях (у группы - команда /set_retention; 0 - без ограничения),
+# размер пачки удаления, пауза между пачками и сколько страниц за шаг возвращать файлу базы
+REPORT_RETENTION_DAYS = int(os.getenv('REPORT_RETENTION_DAYS', 30))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 500))
+RETENTION_PAUSE_MS = int(os.getenv('RETENTION_PAUSE_MS', 50))
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', 256))
+OUTBOX_FAILED_RETENTION_DAYS = int(os.getenv('OUTBOX_FAILED_RETENTION_DAYS', 7))
+
+# Через сколько секунд после готовности к приему обновлений запускаются фоновые этапы
+# запуска (проверка базы, прогрев кэшей, очистка старых данных)
+STARTUP_DEFER_SEC = float(os.getenv('STARTUP_DEFER_SEC', 5))
 
 # Настройка логирования
-logging.basicConfig(level=getattr(logging, LOG_LEVEL.upper()))
+log_handler = setup_logging(LOG_LEVEL, LOG_RATE_LIMIT, LOG_RATE_BURST, LOG_SAMPLING, LOG_QUEUE_SIZE)
 logger = logging.getLogger(__name__)
 
 # Словарь участников и их тегов
@@ -43,44 +143,180 @@ PARTICIPANTS = {
 
 # Типы отчетов (теперь поддерживают номера дней)
 REPORT_TYPES = {
-    'ос': {'name': 'Спорт', 'deadline': time(23, 59)},
-    'оу': {'name': 'Утренний отчёт', 'deadline': time(10, 0)},
-    'ов': {'name': 'Вечерний отчёт', 'deadline': time(23, 59)},
-    'гсд': {'name': 'Главное событие дня', 'deadline': time(23, 59)}
+    'ос': {'name': 'Спорт', 'deadline': time(23, 59), 'emoji': '🏃'},
+    'оу': {'name': 'Утренний отчёт', 'deadline': time(10, 0), 'emoji': '🌅'},
+    'ов': {'name': 'Вечерний отчёт', 'deadline': time(23, 59), 'emoji': '🌙'},
+    'гсд': {'name': 'Главное событие дня', 'deadline': time(23, 59), 'emoji': '⭐'}
 }
 
+# Типы отчетов, которые после дедлайна попадают в "Опоздали"; остальные считаются сданными вовремя
+# в течение всего дня, а дедлайн для них только определяет, когда отсутствие отчета показывается как "Не сдали"
+LATE_REPORT_TYPES = frozenset({'оу'})
+
+# PARTICIPANTS и REPORT_TYPES - настройки по умолчанию: ими заполняется группа
+# GROUP_CHAT_ID при первом запуске и каждая новая группа (/setup). Дальше
+# настройки каждой группы хранятся в базе и правятся командами администраторов.
+
+# SQL-запросы вынесены в константы: одинаковая строка позволяет
+# переиспользовать подготовленное выражение из кэша соединения
+SQL_INSERT_REPORT = '''
+    INSERT OR REPLACE INTO reports
+    (chat_id, user_tag, report_type, day_number, datetime, report_date, username, message_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SQL_SELECT_REPORT_DATE = '''
+    SELECT report_date FROM reports
+    WHERE chat_id = ? AND user_tag = ? AND report_type = ? AND day_number = ?
+'''
+
+# Сводка за дату читается из daily_status одним поиском по первичному ключу
+SQL_SELECT_REPORTS_FOR_DATE = '''
+    SELECT user_tag, report_type, day_number, datetime, username
+    FROM daily_status
+    WHERE chat_id = ? AND report_date = ?
+'''
+
+# Отчеты, привязанные к сообщению (для применения правок), - поиск по idx_reports_chat_message
+SQL_SELECT_MESSAGE_REPORTS = '''
+    SELECT id, user_tag, report_type, day_number, report_date
+    FROM reports
+    WHERE chat_id = ? AND message_id = ?
+'''
+
+SQL_MESSAGE_HAS_REPORTS = 'SELECT 1 FROM reports WHERE chat_id = ? AND message_id = ? LIMIT 1'
+
+# Пачка старых отчетов группы - по idx_reports_chat_date, без просмотра всей таблицы
+SQL_DELETE_OLD_REPORTS_BATCH = '''
+    DELETE FROM reports
+    WHERE id IN (
+        SELECT id FROM reports
+        WHERE chat_id = ? AND report_date < ?
+        ORDER BY report_date
+        LIMIT ?
+    )
+'''
+
+# Отчеты без report_date (datetime не разобрался при заполнении колонки): дата
+# берется из datetime средствами SQLite, а если и так не выходит - первые 10 символов
+SQL_DELETE_UNDATED_REPORTS_BATCH = '''
+    DELETE FROM reports
+    WHERE id IN (
+        SELECT id FROM reports
+        WHERE chat_id = ? AND report_date IS NULL
+          AND COALESCE(date(datetime), substr(datetime, 1, 10)) < ?
+        LIMIT ?
+    )
+'''
+
+SQL_INSERT_PROCESSED = '''
+    INSERT OR IGNORE INTO processed_messages (chat_id, message_id, processed_at)
+    VALUES (?, ?, ?)
+'''
+
+SQL_DELETE_FAILED_OUTBOX_BATCH = '''
+    DELETE FROM outbox
+    WHERE id IN (
+        SELECT id FROM outbox
+        WHERE status = 'failed' AND created_at < ?
+        LIMIT ?
+    )
+'''
+
+SQL_INSERT_OUTBOX = '''
+    INSERT INTO outbox (chat_id, text, parse_mode, created_at)
+    VALUES (?, ?, ?, ?)
+'''
+
+SQL_SELECT_PENDING_OUTBOX = '''
+    SELECT id, chat_id, text, parse_mode, attempts
+    FROM outbox
+    WHERE status = 'pending'
+    ORDER BY id
+'''
+
+
 class ReportDatabase:
     """Класс для работы с базой данных отчетов"""
 
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, readonly: bool = False):
+        """readonly=True - только чтение: без соединения-писателя, создания и миграции схемы
+        (например, пробный запуск backfill_export.py)"""
         self.db_path = db_path
-        self.init_db()
+        self.connections = SQLiteConnectionManager(
+            db_path,
+            readers=DB_READERS,
+            busy_timeout_ms=DB_BUSY_TIMEOUT_MS,
+            cache_size_kib=DB_CACHE_SIZE_KIB,
+            mmap_size=DB_MMAP_SIZE,
+            synchronous=DB_SYNCHRONOUS,
+            readonly=readonly,
+        )
+        self.cache = ReportsCache(REPORTS_CACHE_SIZE)
+        if not readonly:
+            self.init_db()
 
     def init_db(self):
         """Инициализация базы данных"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.writer() as conn, conn:
+                create_reports_table(conn)
+                # Исходящие сообщения, ожидающие отправки (переживают перезапуск)
                 conn.execute('''
-                    CREATE TABLE IF NOT EXISTS reports (
+                    CREATE TABLE IF NOT EXISTS outbox (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_tag TEXT NOT NULL,
-                        report_type TEXT NOT NULL,
-                        day_number INTEGER NOT NULL,
-                        datetime TEXT NOT NULL,
-                        username TEXT,
-                        message_id INTEGER,
-                        UNIQUE(user_tag, report_type, day_number)
+                        chat_id INTEGER NOT NULL,
+                        text TEXT NOT NULL,
+                        parse_mode TEXT,
+                        created_at TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        last_error TEXT
+                    )
+                ''')
+                # Служебное состояние бота (последний обработанный update_id)
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS bot_state (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
                     )
                 ''')
-                conn.commit()
+                # Недавно обработанные сообщения для отбрасывания повторной доставки
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS processed_messages (
+                        chat_id INTEGER NOT NULL,
+                        message_id INTEGER NOT NULL,
+                        processed_at INTEGER NOT NULL,
+                        PRIMARY KEY (chat_id, message_id)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_processed_messages_time
+                    ON processed_messages(processed_at)
+                ''')
+            with self.connections.writer() as conn:
+                if migrate_multi_chat(conn, GROUP_CHAT_ID):
+                    logger.info(f"Таблица reports перестроена для нескольких групп (старые отчеты -> чат {GROUP_CHAT_ID})")
+                migrate_chat_schedule(conn)
+                migrate_chat_retention(conn)
+                filled = migrate_report_date(conn, default_tz=ChatConfig.parse_timezone(TIMEZONE))
+                if filled:
+                    logger.info(f"Заполнена колонка report_date для {filled} записей")
+                migrate_message_index(conn)
+                filled = migrate_daily_status(conn)
+                if filled:
+                    logger.info(f"Заполнена таблица daily_status: {filled} записей")
                 logger.info("База данных инициализирована успешно")
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
 
     def check_db_integrity(self):
-        """Проверка целостности базы данных"""
+        """Проверка целостности базы данных (читает всю базу - выполняется в фоне после запуска)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.reader() as conn:
+                problems = [row[0] for row in conn.execute("PRAGMA quick_check(10)")]
+                if problems != ['ok']:
+                    logger.error(f"Нарушена целостность базы данных: {'; '.join(problems)}")
                 cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='reports'")
                 if cursor.fetchone():
                     logger.info("Таблица reports существует")
@@ -93,35 +329,96 @@ class ReportDatabase:
         except Exception as e:
             logger.error(f"Ошибка проверки базы данных: {e}")
 
-    def save_report(self, user_tag: str, report_type: str, day_number: int, submission_time: datetime,
-                   username: str, message_id: int):
+    @staticmethod
+    def report_row(chat_id: int, user_tag: str, report_type: str, day_number: int, submission_time: datetime,
+                   username: str, message_id: int,
+                   tz: tzinfo = timezone.utc) -> Tuple[int, str, str, int, str, str, str, int]:
+        """Строка для вставки в reports (порядок полей как в SQL_INSERT_REPORT)"""
+        report_date = local_report_date(submission_time, tz)
+        return (chat_id, user_tag, report_type, day_number, submission_time.isoformat(),
+                report_date.isoformat(), username, message_id)
+
+    def save_report(self, chat_id: int, user_tag: str, report_type: str, day_number: int,
+                    submission_time: datetime, username: str, message_id: int, tz: tzinfo = timezone.utc):
         """Сохранение отчета в базу данных"""
-        dt_str = submission_time.isoformat()
+        row = self.report_row(chat_id, user_tag, report_type, day_number, submission_time, username, message_id, tz)
 
         try:
-            logger.info(f"Попытка сохранения отчета: {user_tag} - {report_type}{day_number} в {dt_str}")
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute('''
-                    INSERT OR REPLACE INTO reports
-                    (user_tag, report_type, day_number, datetime, username, message_id)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (user_tag, report_type, day_number, dt_str, username, message_id))
-                conn.commit()
-                logger.info(f"Отчет успешно сохранен: {user_tag} - {report_type}{day_number}")
+            logger.debug("Попытка сохранения отчета: %s - %s%s в %s", user_tag, report_type, day_number, row[4])
+            self.save_reports([row])
+            logger.debug("Отчет успешно сохранен: %s - %s%s", user_tag, report_type, day_number)
         except Exception as e:
-            logger.error(f"Ошибка при сохранении отчета {user_tag} - {report_type}{day_number}: {e}")
+            logger.error("Ошибка при сохранении отчета %s - %s%s: %s", user_tag, report_type, day_number, e)
 
-    def get_reports_for_date(self, date: datetime) -> Dict[str, Dict[str, Dict]]:
-        """Получение всех отчетов за указанную дату"""
+    def save_reports(self, rows: List[Tuple[int, str, str, int, str, str, str, int]]):
+        """Сохранение пачки отчетов одной транзакцией"""
+        try:
+            touched_dates = {(row[0], row[5]) for row in rows}
+            with self.connections.writer() as conn, conn:
+                # INSERT OR REPLACE может перенести отчет с другой даты - ее кэш тоже сбрасывается
+                for chat_id, user_tag, report_type, day_number, *_ in rows:
+                    old = conn.execute(SQL_SELECT_REPORT_DATE, (chat_id, user_tag, report_type, day_number)).fetchone()
+                    if old:
+                        touched_dates.add((chat_id, old[0]))
+                conn.executemany(SQL_INSERT_REPORT, rows)
+            self.cache.invalidate(touched_dates)
+            logger.debug("Сохранена пачка отчетов: %d", len(rows), extra={'event': 'batch_saved'})
+        except Exception as e:
+            logger.error("Ошибка при сохранении пачки из %d отчетов: %s", len(rows), e)
+            raise
+
+    def message_has_reports(self, chat_id: int, message_id: int) -> bool:
+        """Есть ли сохраненные отчеты из сообщения (поиск по idx_reports_chat_message)"""
+        with self.connections.reader() as conn:
+            return conn.execute(SQL_MESSAGE_HAS_REPORTS, (chat_id, message_id)).fetchone() is not None
+
+    def apply_message_edit(self, chat_id: int, message_id: int,
+                           rows: List[Tuple[int, str, str, int, str, str, str, int]]) -> Tuple[int, int, int]:
+        """Приведение отчетов сообщения к новому разбору одной транзакцией.
+
+        Сравнивает отчеты, привязанные к message_id, с rows (разбор исправленного
+        текста): исчезнувшие удаляются, новые вставляются, остальные не
+        трогаются. Смена номера дня считается изменением (удаление + вставка,
+        daily_status обновляют триггеры). Возвращает (добавлено, удалено, изменено).
+        """
+        new_rows = {(row[1], row[2], row[3]): row for row in rows}
+        with self.connections.writer() as conn, conn:
+            existing = {
+                (user_tag, report_type, day_number): (report_id, report_date)
+                for report_id, user_tag, report_type, day_number, report_date
+                in conn.execute(SQL_SELECT_MESSAGE_REPORTS, (chat_id, message_id))
+            }
+            removed = [existing[key] for key in existing.keys() - new_rows.keys()]
+            added = [new_rows[key] for key in new_rows.keys() - existing.keys()]
+            if not removed and not added:
+                return 0, 0, 0
+
+            touched_dates = {(chat_id, report_date) for _, report_date in removed}
+            touched_dates.update((chat_id, row[5]) for row in added)
+            conn.executemany('DELETE FROM reports WHERE id = ?', [(report_id,) for report_id, _ in removed])
+            for _, user_tag, report_type, day_number, *_ in added:
+                old = conn.execute(SQL_SELECT_REPORT_DATE, (chat_id, user_tag, report_type, day_number)).fetchone()
+                if old:
+                    touched_dates.add((chat_id, old[0]))
+            conn.executemany(SQL_INSERT_REPORT, added)
+        self.cache.invalidate(touched_dates)
+
+        updated = len({key[:2] for key in existing.keys() - new_rows.keys()}
+                      & {key[:2] for key in new_rows.keys() - existing.keys()})
+        return len(added) - updated, len(removed) - updated, updated
+
+    def get_reports_for_date(self, date: datetime, chat_id: int) -> Dict[str, Dict[str, Dict]]:
+        """Получение всех отчетов группы за указанную дату (результат кэшируется, не изменять)"""
         date_str = date.date().isoformat()
+        cache_key = (chat_id, date_str)
+
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = self.cache.generation()
 
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute('''
-                SELECT user_tag, report_type, day_number, datetime, username
-                FROM reports
-                WHERE date(datetime) = ?
-                ORDER BY user_tag, report_type
-            ''', (date_str,))
+        with self.connections.reader() as conn:
+            cursor = conn.execute(SQL_SELECT_REPORTS_FOR_DATE, (chat_id, date_str))
 
             reports = {}
             for row in cursor.fetchall():
@@ -134,271 +431,822 @@ class ReportDatabase:
                     'username': username
                 }
 
-            return reports
+        self.cache.put(cache_key, reports, generation)
+        return reports
+
+    def delete_old_reports_batch(self, chat_id: int, cutoff: str, limit: int) -> int:
+        """Удаление не больше limit отчетов группы с датой раньше cutoff одной транзакцией
+        (включая отчеты без report_date - по дате из datetime); возвращает число удаленных строк"""
+        with self.connections.writer() as conn:
+            started = perf_counter()
+            with conn:
+                deleted = conn.execute(SQL_DELETE_OLD_REPORTS_BATCH, (chat_id, cutoff, limit)).rowcount
+                if deleted < limit:
+                    deleted += conn.execute(SQL_DELETE_UNDATED_REPORTS_BATCH, (chat_id, cutoff, limit - deleted)).rowcount
+            RETENTION_LOCK_SECONDS.observe(perf_counter() - started, 'delete')
+        if deleted:
+            self.cache.invalidate_matching(lambda key: key[0] == chat_id and key[1] < cutoff)
+        return deleted
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Возврат файлу до pages свободных страниц; возвращает число возвращенных"""
+        with self.connections.writer() as conn:
+            before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            started = perf_counter()
+            # execute() выполняет один шаг PRAGMA и освобождает одну страницу, executescript - все
+            conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+            RETENTION_LOCK_SECONDS.observe(perf_counter() - started, 'vacuum')
+            return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+    def auto_vacuum_mode(self) -> int:
+        """PRAGMA auto_vacuum: 0 - выключен, 1 - FULL, 2 - INCREMENTAL"""
+        with self.connections.reader() as conn:
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+    def load_chat_configs(self, chat_id: Optional[int] = None) -> List[ChatConfig]:
+        """Настройки всех групп (или одной группы) из базы"""
+        where, params = ('WHERE chat_id = ?', (chat_id,)) if chat_id is not None else ('', ())
+        with self.connections.reader() as conn:
+            chats = conn.execute(
+                f'SELECT chat_id, title, topic_id, version, timezone, summary_time, retention_days FROM chats {where}',
+                params
+            ).fetchall()
+            participants: Dict[int, Dict[str, str]] = {}
+            for row_chat_id, username, tag in conn.execute(
+                f'SELECT chat_id, username, tag FROM chat_participants {where} ORDER BY username', params
+            ):
+                participants.setdefault(row_chat_id, {})[username] = tag
+            report_types: Dict[int, Dict[str, Dict]] = {}
+            for row_chat_id, code, name, deadline, emoji in conn.execute(
+                f'SELECT chat_id, code, name, deadline, emoji FROM chat_report_types {where} ORDER BY position, code',
+                params
+            ):
+                report_types.setdefault(row_chat_id, {})[code] = {
+                    'name': name,
+                    'deadline': ChatConfig.parse_deadline(deadline),
+                    'emoji': emoji,
+                }
+
+        return [
+            ChatConfig(row_chat_id, title, topic_id, version,
+                       participants.get(row_chat_id, {}), report_types.get(row_chat_id, {}),
+                       tz=ChatConfig.parse_timezone(tz_name or TIMEZONE),
+                       summary_time=ChatConfig.parse_deadline(summary_time or SUMMARY_TIME),
+                       retention_days=REPORT_RETENTION_DAYS if retention_days is None else retention_days)
+            for row_chat_id, title, topic_id, version, tz_name, summary_time, retention_days in chats
+        ]
+
+    def register_chat(self, chat_id: int, title: Optional[str], topic_id: Optional[int],
+                      participants: Dict[str, str], report_types: Dict[str, Dict]) -> bool:
+        """Регистрация группы с настройками по умолчанию; False, если уже есть"""
+        with self.connections.writer() as conn, conn:
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO chats (chat_id, title, topic_id) VALUES (?, ?, ?)',
+                (chat_id, title, topic_id or None)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.executemany(
+                'INSERT INTO chat_participants (chat_id, username, tag) VALUES (?, ?, ?)',
+                [(chat_id, username, tag) for username, tag in participants.items()]
+            )
+            conn.executemany(
+                'INSERT INTO chat_report_types (chat_id, code, name, deadline, emoji, position) VALUES (?, ?, ?, ?, ?, ?)',
+                [(chat_id, code, info['name'], info['deadline'].strftime('%H:%M'), info.get('emoji', '📌'), position)
+                 for position, (code, info) in enumerate(report_types.items())]
+            )
+            return True
+
+    def _bump_chat_version(self, conn, chat_id: int):
+        conn.execute('UPDATE chats SET version = version + 1 WHERE chat_id = ?', (chat_id,))
+
+    def set_participant(self, chat_id: int, username: str, tag: str):
+        """Добавление участника или смена его тега"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('DELETE FROM chat_participants WHERE chat_id = ? AND tag = ?', (chat_id, tag))
+            conn.execute(
+                'INSERT OR REPLACE INTO chat_participants (chat_id, username, tag) VALUES (?, ?, ?)',
+                (chat_id, username, tag)
+            )
+            self._bump_chat_version(conn, chat_id)
 
-    def cleanup_old_reports(self, days_to_keep: int = 30):
-        """Очистка старых отчетов"""
-        cutoff_date = datetime.now() - timedelta(days=days_to_keep)
-        cutoff_str = cutoff_date.date().isoformat()
+    def remove_participant(self, chat_id: int, username: str) -> bool:
+        """Удаление участника; False, если его не было"""
+        with self.connections.writer() as conn, conn:
+            cursor = conn.execute(
+                'DELETE FROM chat_participants WHERE chat_id = ? AND username = ?', (chat_id, username)
+            )
+            self._bump_chat_version(conn, chat_id)
+            return cursor.rowcount > 0
+
+    def set_report_type(self, chat_id: int, code: str, name: str, deadline: time, emoji: str):
+        """Добавление или изменение типа отчета"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('''
+                INSERT INTO chat_report_types (chat_id, code, name, deadline, emoji, position)
+                VALUES (?, ?, ?, ?, ?, (SELECT COALESCE(MAX(position), -1) + 1 FROM chat_report_types WHERE chat_id = ?))
+                ON CONFLICT (chat_id, code) DO UPDATE SET name = excluded.name, deadline = excluded.deadline,
+                                                         emoji = excluded.emoji
+            ''', (chat_id, code, name, deadline.strftime('%H:%M'), emoji, chat_id))
+            self._bump_chat_version(conn, chat_id)
+
+    def remove_report_type(self, chat_id: int, code: str) -> bool:
+        """Удаление типа отчета; False, если его не было"""
+        with self.connections.writer() as conn, conn:
+            cursor = conn.execute(
+                'DELETE FROM chat_report_types WHERE chat_id = ? AND code = ?', (chat_id, code)
+            )
+            self._bump_chat_version(conn, chat_id)
+            return cursor.rowcount > 0
+
+    def set_chat_topic(self, chat_id: int, topic_id: Optional[int]):
+        """Тема группы, из которой принимаются отчеты (None - любая)"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('UPDATE chats SET topic_id = ? WHERE chat_id = ?', (topic_id, chat_id))
+            self._bump_chat_version(conn, chat_id)
+
+    def set_chat_timezone(self, chat_id: int, tz_name: Optional[str]):
+        """Часовой пояс группы (None - по умолчанию)"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('UPDATE chats SET timezone = ? WHERE chat_id = ?', (tz_name, chat_id))
+            self._bump_chat_version(conn, chat_id)
+
+    def set_summary_time(self, chat_id: int, summary_time: Optional[time]):
+        """Время ежедневной сводки группы (None - по умолчанию)"""
+        value = summary_time.strftime('%H:%M') if summary_time else None
+        with self.connections.writer() as conn, conn:
+            conn.execute('UPDATE chats SET summary_time = ? WHERE chat_id = ?', (value, chat_id))
+            self._bump_chat_version(conn, chat_id)
+
+    def set_retention_days(self, chat_id: int, days: Optional[int]):
+        """Срок хранения отчетов группы в днях (None - по умолчанию, 0 - без ограничения)"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('UPDATE chats SET retention_days = ? WHERE chat_id = ?', (days, chat_id))
+            self._bump_chat_version(conn, chat_id)
+
+    def last_summary_dates(self) -> Dict[int, date]:
+        """Даты последних отправленных сводок по группам"""
+        with self.connections.reader() as conn:
+            return {
+                chat_id: date.fromisoformat(value)
+                for chat_id, value in conn.execute(
+                    'SELECT chat_id, last_summary_date FROM chats WHERE last_summary_date IS NOT NULL'
+                )
+            }
+
+    def set_last_summary_date(self, chat_id: int, summary_date: date):
+        """Отметка об отправленной сводке (для досылки пропущенных после простоя)"""
+        with self.connections.writer() as conn, conn:
+            conn.execute(
+                'UPDATE chats SET last_summary_date = ? WHERE chat_id = ?', (summary_date.isoformat(), chat_id)
+            )
+
+    def get_state(self, key: str) -> Optional[str]:
+        """Значение из bot_state"""
+        with self.connections.reader() as conn:
+            row = conn.execute('SELECT value FROM bot_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        """Запись значения в bot_state"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)', (key, value))
+
+    def mark_processed(self, rows: List[Tuple[int, int, int]]):
+        """Отметка пачки обработанных сообщений (chat_id, message_id, время)"""
+        with self.connections.writer() as conn, conn:
+            conn.executemany(SQL_INSERT_PROCESSED, rows)
+
+    def recent_processed(self, limit: int) -> List[Tuple[int, int]]:
+        """Последние обработанные сообщения (от старых к новым)"""
+        with self.connections.reader() as conn:
+            rows = conn.execute('''
+                SELECT chat_id, message_id FROM processed_messages
+                ORDER BY processed_at DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        rows.reverse()
+        return rows
+
+    def prune_processed(self, older_than: int) -> int:
+        """Удаление отметок старше older_than (unix-время)"""
+        with self.connections.writer() as conn, conn:
+            cursor = conn.execute('DELETE FROM processed_messages WHERE processed_at < ?', (older_than,))
+        return cursor.rowcount
+
+    def outbox_add(self, chat_id: int, texts: List[str], parse_mode: Optional[str]) -> List[int]:
+        """Добавление исходящих сообщений в outbox одной транзакцией"""
+        created_at = datetime.now().isoformat()
+        with self.connections.writer() as conn, conn:
+            return [
+                conn.execute(SQL_INSERT_OUTBOX, (chat_id, text, parse_mode, created_at)).lastrowid
+                for text in texts
+            ]
+
+    def outbox_pending(self) -> List[Tuple[int, int, str, Optional[str], int]]:
+        """Неотправленные сообщения в порядке постановки"""
+        with self.connections.reader() as conn:
+            return conn.execute(SQL_SELECT_PENDING_OUTBOX).fetchall()
+
+    def outbox_update(self, outbox_id: int, attempts: int, status: str, last_error: Optional[str]):
+        """Обновление числа попыток и статуса сообщения"""
+        with self.connections.writer() as conn, conn:
+            conn.execute(
+                'UPDATE outbox SET attempts = ?, status = ?, last_error = ? WHERE id = ?',
+                (attempts, status, last_error, outbox_id)
+            )
 
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('DELETE FROM reports WHERE date(datetime) < ?', (cutoff_str,))
-            conn.commit()
+    def outbox_delete(self, outbox_id: int):
+        """Удаление доставленного сообщения"""
+        with self.connections.writer() as conn, conn:
+            conn.execute('DELETE FROM outbox WHERE id = ?', (outbox_id,))
+
+    def delete_failed_outbox_batch(self, cutoff: str, limit: int) -> int:
+        """Удаление не больше limit неотправленных (status='failed') сообщений, созданных раньше cutoff"""
+        with self.connections.writer() as conn:
+            started = perf_counter()
+            with conn:
+                deleted = conn.execute(SQL_DELETE_FAILED_OUTBOX_BATCH, (cutoff, limit)).rowcount
+            RETENTION_LOCK_SECONDS.observe(perf_counter() - started, 'outbox')
+        return deleted
+
+    def close(self):
+        """Закрытие соединений с базой данных"""
+        self.connections.close()
 
 class ReportBot:
     """Основной класс бота"""
 
     def __init__(self):
-        self.bot = Bot(token=TELEGRAM_BOT_TOKEN)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+        self.bot = Bot(token=TELEGRAM_BOT_TOKEN, session=session)
         self.dp = Dispatcher()
-        self.db = ReportDatabase(DATABASE_PATH)
-        self.scheduler = AsyncIOScheduler()
+        # Длительность этапов запуска, секунды; прием обновлений ждет только схему базы,
+        # отметки обработанных сообщений и расписание, остальное выполняется в фоне
+        self.startup_timings: Dict[str, float] = {}
+        self._startup_started = perf_counter()
+        self.ready = asyncio.Event()
+        self._deferred_task: Optional[asyncio.Task] = None
+        with self._startup_stage('schema'):
+            self.db = ReportDatabase(DATABASE_PATH)
+        self.storage = AsyncReportStorage(
+            self.db,
+            max_pending_writes=DB_MAX_PENDING_WRITES,
+            write_batch_size=WRITE_BATCH_SIZE,
+            write_max_delay=WRITE_MAX_DELAY_MS / 1000,
+        )
+        # Сводки и напоминания всех групп на одном таймере
+        self.scheduler = DailyScheduler()
+        self.reported = ReportedTracker()
+        self._reminder_keys: Dict[int, List[Tuple]] = {}
+
+        # Отметка обработанных обновлений и недавние сообщения: повторы после перезапуска отбрасываются
+        # getUpdates отдает обновления по порядку, и разрыв в update_id там не заполнится;
+        # вебхук доставляет параллельно и с повторами, пропущенное обновление может прийти позже
+        self.watermark = UpdateWatermark(
+            int(self.db.get_state('last_update_id') or 0),
+            gap_timeout=UPDATE_GAP_TIMEOUT_SEC if BOT_MODE == 'webhook' else 0,
+        )
+        self._saved_update_id = self.watermark.value
+        self._checkpoint_task: Optional[asyncio.Task] = None
+        self.processed = ProcessedMessages(PROCESSED_MESSAGES_LIMIT)
+        self.update_checkpoint = UpdateCheckpointMiddleware(self.watermark)
+        self.dp.update.outer_middleware(self.update_checkpoint)
+        self.profiler = Profiler(
+            PROFILE_DIR,
+            sample_rate=PROFILE_SAMPLE_RATE,
+            slow_threshold=SLOW_HANDLER_MS / 1000,
+            tracemalloc_interval=TRACEMALLOC_INTERVAL_MIN * 60,
+            tracemalloc_frames=TRACEMALLOC_FRAMES,
+        )
+        if self.profiler.enabled:
+            self.dp.update.outer_middleware(ProfilingMiddleware(self.profiler))
+        self.registry = ChatRegistry(self.db.load_chat_configs())
+        if GROUP_CHAT_ID and GROUP_CHAT_ID not in self.registry:
+            # Первый запуск: группа из .env получает настройки по умолчанию
+            self.db.register_chat(GROUP_CHAT_ID, None, REPORTS_TOPIC_ID, PARTICIPANTS, REPORT_TYPES)
+            self.registry.replace_all(self.db.load_chat_configs())
+        self.handler_pool = KeyedTaskPool(workers=HANDLER_WORKERS, max_queue=HANDLER_MAX_QUEUE)
+        self.sender = OutboundSender(
+            self.bot,
+            self.storage,
+            global_rate=SEND_GLOBAL_RATE,
+            chat_rate_per_minute=SEND_CHAT_RATE_PER_MIN,
+            max_attempts=SEND_MAX_ATTEMPTS,
+        )
+        self.retention = RetentionCleaner(
+            self.storage,
+            batch_size=RETENTION_BATCH_SIZE,
+            pause=RETENTION_PAUSE_MS / 1000,
+            vacuum_pages=RETENTION_VACUUM_PAGES,
+            outbox_failed_days=OUTBOX_FAILED_RETENTION_DAYS,
+        )
 
-        # Регистрация обработчиков
-        self.dp.message.register(self.handle_message, lambda msg: msg.chat.id == GROUP_CHAT_ID)
+        # Регистрация обработчиков: сообщения не из зарегистрированных групп и их тем,
+        # команды и сообщения без хэштегов отсекаются префильтром до вызова обработчика
+        self.prefilter = ReportPrefilter(self.registry)
+        self.dp.message.register(self.handle_message, self.prefilter)
+        # Исправленный текст может больше не содержать хэштегов - тогда отчеты сообщения удаляются
+        self.edit_prefilter = ReportPrefilter(self.registry, require_hashtag=False)
+        # Правки сообщений без отчетов, отброшенные после чтения по индексу
+        self.edits_skipped = 0
+        self.dp.edited_message.register(self.handle_edited_message, self.edit_prefilter)
+        # Время и ошибки обработчиков; остальное - гистограммы в хранилище, отправке и планировщике
+        self.dp.message.middleware(HandlerMetricsMiddleware())
+        self.dp.edited_message.middleware(HandlerMetricsMiddleware())
+        self._metrics_runner: Optional[web.AppRunner] = None
+        self._register_stats()
         self.dp.startup.register(self.on_startup)
         self.dp.shutdown.register(self.on_shutdown)
 
-    async def on_startup(self):
-        """Действия при запуске бота"""
-        logger.info("Бот запущен")
+    def _register_stats(self):
+        """Счетчики stats() компонентов отдаются вместе с метриками"""
+        REGISTRY.add_stats('storage', self.storage.stats)
+        REGISTRY.add_stats('processed_buffer', self.storage.processed_buffer.stats)
+        REGISTRY.add_stats('prefilter', self.prefilter.stats)
+        REGISTRY.add_stats('edit_prefilter', self.edit_prefilter.stats)
+        REGISTRY.add_stats('reports_cache', self.db.cache.stats)
+        REGISTRY.add_stats('handler_pool', self.handler_pool.stats)
+        REGISTRY.add_stats('sender', self.sender.stats)
+        REGISTRY.add_stats('scheduler', self.scheduler.stats)
+        REGISTRY.add_stats('reported', self.reported.stats)
+        REGISTRY.add_stats('logging', log_handler.stats)
+        REGISTRY.add_stats('startup', self.startup_stats)
+        REGISTRY.add_stats('retention', self.retention.stats)
+        if self.profiler.enabled:
+            REGISTRY.add_stats('profiler', self.profiler.stats)
+        REGISTRY.add_stats('updates', lambda: {
+            'last_update_id': self.watermark.value,
+            'in_flight': self.watermark.pending(),
+            'replays': self.update_checkpoint.replays,
+            'update_id_resets': self.watermark.resets,
+            'update_id_gaps_skipped': self.watermark.gaps_skipped,
+            'duplicate_messages': self.processed.duplicates,
+            'edits_skipped': self.edits_skipped,
+        })
+
+    @contextmanager
+    def _startup_stage(self, name: str) -> Iterator[None]:
+        """Замер этапа запуска"""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = perf_counter() - started
 
-        # Проверка базы данных
-        self.db.check_db_integrity()
+    def _format_timings(self, names: List[str]) -> str:
+        return ', '.join(f"{name} {self.startup_timings[name] * 1000:.0f}"
+                         for name in names if name in self.startup_timings)
 
-        # Временный лог для проверки данных в БД
-        try:
-            today = datetime.now().date().isoformat()
-            reports = self.db.get_reports_for_date(datetime.now() - timedelta(days=1))  # За вчера
-            logger.info(f"Количество отчетов за вчера ({datetime.now().date() - timedelta(days=1)}): {len(reports)}")
-            for user_tag, user_reports in reports.items():
-                for report_type, details in user_reports.items():
-                    logger.info(f"Отчет: {user_tag} - {report_type}{details['day_number']} от {details['username']}")
-        except Exception as e:
-            logger.error(f"Ошибка при проверке отчетов: {e}")
+    def startup_stats(self) -> Dict[str, float]:
+        """Готовность и длительность этапов запуска"""
+        return {'ready': int(self.ready.is_set()),
+                **{f'{name}_seconds': value for name, value in self.startup_timings.items()}}
 
-        # Временная вставка отчетов за сегодня (удалить после использования)
-        try:
-            today = datetime.now().date()
-            existing_reports = self.db.get_reports_for_date(datetime.combine(today, datetime.min.time()))
-            if not existing_reports:
-                logger.info("Вставка временных отчетов за сегодня...")
-                temp_reports = [
-                    {'user_tag': '#нася', 'report_type': 'оу', 'day_number': 4, 'username': '@mix_nastya'},
-                    {'user_tag': '#арк', 'report_type': 'оу', 'day_number': 4, 'username': '@bleffucio'},
-                    {'user_tag': '#ан', 'report_type': 'оу', 'day_number': 4, 'username': '@A_N_yaki'},
-                    {'user_tag': '#надя', 'report_type': 'оу', 'day_number': 4, 'username': '@nadezhda_efremova123'},
-                    {'user_tag': '#никита', 'report_type': 'оу', 'day_number': 4, 'username': '@FenolIFtalein'},
-                    {'user_tag': '#любовь', 'report_type': 'оу', 'day_number': 4, 'username': '@travellove_krd'},
-                    {'user_tag': '#оля', 'report_type': 'оу', 'day_number': 4, 'username': '@helga_sigy'},
-                    {'user_tag': '#ал', 'report_type': 'оу', 'day_number': 4, 'username': '@Melnikova_Alena'},
-                    {'user_tag': '#ден', 'report_type': 'оу', 'day_number': 4, 'username': '@Dev_Jones'},
-                    {'user_tag': '#игорь', 'report_type': 'оу', 'day_number': 4, 'username': '@Igor_Lucklett'},
-                    {'user_tag': '#поли', 'report_type': 'оу', 'day_number': 4, 'username': '@Polyhakayna0'},
-                    {'user_tag': '#тор', 'report_type': 'оу', 'day_number': 4, 'username': '@Mikhailovmind'},
-                    {'user_tag': '#в', 'report_type': 'оу', 'day_number': 4, 'username': '@Wlad_is_law'},
-                    {'user_tag': '#надя', 'report_type': 'ос', 'day_number': 4, 'username': '@nadezhda_efremova123'},
-                ]
-                for report in temp_reports:
-                    self.db.save_report(
-                        user_tag=report['user_tag'],
-                        report_type=report['report_type'],
-                        day_number=report['day_number'],
-                        submission_time=datetime.now(),
-                        username=report['username'],
-                        message_id=99999
-                    )
-                logger.info(f"Вставлено {len(temp_reports)} временных отчетов за сегодня.")
-        except Exception as e:
-            logger.error(f"Ошибка при вставке временных отчетов: {e}")
-
-        # Настройка планировщика
-        self.scheduler.add_job(
-            self.send_daily_report,
-            CronTrigger(hour=21, minute=5),
-            id='daily_report',
-            replace_existing=True
-        )
-        self.scheduler.start()
+    async def on_startup(self):
+        """Действия при запуске бота.
 
-        # Очистка старых данных при запуске
-        self.db.cleanup_old_reports()
+        До готовности выполняется только то, без чего нельзя принимать обновления:
+        схема базы (в конструкторе), недавно обработанные сообщения для отсева
+        повторов, подтверждение обновлений, outbox и расписание. Проверка базы,
+        прогрев кэшей и очистка старых данных - в фоне после готовности.
+        """
+        logger.info("Бот запущен")
+        START_TIME.set(datetime.now().timestamp())
+        with self._startup_stage('metrics'):
+            try:
+                self._metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+            except OSError as e:
+                logger.error(f"Не удалось запустить сервер метрик на {METRICS_HOST}:{METRICS_PORT}: {e}")
+            self.profiler.start()
+
+        # Недавно обработанные сообщения; в режиме polling Telegram подтверждается
+        # последний сохраненный update_id, чтобы обработанные обновления не пришли снова
+        with self._startup_stage('processed'):
+            self.processed.load(await self.storage.run_read(self.db.recent_processed, PROCESSED_MESSAGES_LIMIT))
+        if BOT_MODE != 'webhook' and self.watermark.value:
+            with self._startup_stage('ack_updates'):
+                await self._ack_processed_updates()
+        logger.info(f"Продолжение с update_id {self.watermark.value}, помнится сообщений: {len(self.processed)}")
+        self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
+        self.scheduler.schedule('maintenance', timezone.utc, time(3, 0), self.run_maintenance, job='maintenance')
+
+        # Досылка сводок, не отправленных до перезапуска: до расписания, чтобы
+        # пропущенные за простой сводки не обогнали ранее поставленные в outbox
+        with self._startup_stage('outbox'):
+            await self.sender.start()
+
+        # Ежедневные сводки и напоминания всех групп; пропущенные за время простоя сводки досылаются сразу
+        with self._startup_stage('schedule'):
+            last_dates = await self.storage.run_read(self.db.last_summary_dates)
+            for config in self.registry.chats():
+                self._schedule_chat(config, last_dates.get(config.chat_id))
+            self.scheduler.start()
+
+        self.startup_timings['ready'] = perf_counter() - self._startup_started
+        self.ready.set()
+        logger.info(f"Бот готов к приему обновлений за {self.startup_timings['ready'] * 1000:.0f} мс "
+                    f"(этапы, мс: {self._format_timings(['schema', 'metrics', 'processed', 'ack_updates', 'outbox', 'schedule'])})")
+        self._deferred_task = asyncio.create_task(self._deferred_startup())
+
+    async def _deferred_startup(self):
+        """Фоновая часть запуска: этапы идут по очереди, ошибка одного не отменяет остальные"""
+        await asyncio.sleep(STARTUP_DEFER_SEC)
+        started = perf_counter()
+        stages = [
+            ('integrity', self.storage.check_db_integrity),
+            ('warmup', self._warm_up),
+            ('prune_processed', self._prune_processed),
+            ('retention', lambda: self.retention.run(self.registry.chats())),
+        ]
+        for name, stage in stages:
+            with self._startup_stage(name):
+                try:
+                    await stage()
+                except Exception as e:
+                    logger.error(f"Ошибка фонового этапа запуска {name}: {e}")
+        self.startup_timings['deferred'] = perf_counter() - started
+        logger.info(f"Фоновые этапы запуска завершены за {self.startup_timings['deferred'] * 1000:.0f} мс "
+                    f"(этапы, мс: {self._format_timings([name for name, _ in stages])})")
+
+    async def _warm_up(self):
+        """Прогрев кэша сводок и масок напоминаний за сегодня, кэша сводок за вчера"""
+        for config in self.registry.chats():
+            today = datetime.now(config.timezone)
+            date_str = today.date().isoformat()
+            warming = not self.reported.is_warm(config.chat_id, date_str)
+            if warming:
+                self.reported.begin_warm(config.chat_id, date_str)
+            reports = await self.storage.get_reports_for_date(today, config.chat_id)
+            if warming:
+                self.reported.warm(config.chat_id, date_str, reports, config.tag_index)
+            yesterday = await self.storage.get_reports_for_date(today - timedelta(days=1), config.chat_id)
+            logger.info(f"Отчетов в чате {config.chat_id}: сегодня {len(reports)}, вчера {len(yesterday)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                for user_tag, user_reports in yesterday.items():
+                    for report_type, details in user_reports.items():
+                        logger.debug("Отчет: %s - %s%s от %s", user_tag, report_type, details['day_number'],
+                                     details['username'])
+
+    async def _prune_processed(self) -> int:
+        """Удаление отметок обработанных сообщений старше PROCESSED_MESSAGES_TTL_HOURS"""
+        return await self.storage.run_write(
+            self.db.prune_processed, int(datetime.now().timestamp()) - PROCESSED_MESSAGES_TTL_HOURS * 3600
+        )
 
     async def on_shutdown(self):
         """Действия при остановке бота"""
         logger.info("Бот остановлен")
-        self.scheduler.shutdown()
-
-    def parse_message(self, text: str, username: str) -> List[Tuple[str, str, int]]:
+        if self._deferred_task is not None:
+            self._deferred_task.cancel()
+            await asyncio.gather(self._deferred_task, return_exceptions=True)
+        await self.scheduler.stop()
+        await self.handler_pool.join()
+        await self.profiler.stop()
+        if self._checkpoint_task is not None:
+            self._checkpoint_task.cancel()
+            await asyncio.gather(self._checkpoint_task, return_exceptions=True)
+        await self._save_checkpoint()
+        await self.sender.stop()
+        # Сброс буфера отложенной записи перед остановкой
+        await self.storage.close()
+        logger.info(f"Статистика записи: {self.storage.write_buffer.stats()}")
+        logger.info(f"Статистика префильтра: {self.prefilter.stats()}")
+        logger.info(f"Статистика префильтра правок: {self.edit_prefilter.stats()}")
+        logger.info(f"Статистика кэша отчетов: {self.db.cache.stats()}")
+        logger.info(f"Статистика обработчиков: {self.handler_pool.stats()}")
+        logger.info(f"Статистика отправки: {self.sender.stats()}")
+        logger.info(f"Статистика планировщика: {self.scheduler.stats()}")
+        if self.profiler.enabled:
+            logger.info(f"Статистика профилирования: {self.profiler.stats()}")
+        logger.info(f"Повторы: обновлений {self.update_checkpoint.replays}, сообщений {self.processed.duplicates}")
+        logger.info(f"Статистика логирования: {log_handler.stats()}")
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+
+    async def _ack_processed_updates(self):
+        """Подтверждение в Telegram обновлений до сохраненной отметки.
+
+        Сначала первое неподтвержденное обновление читается без offset (это ничего
+        не подтверждает): если нумерация началась заново, getUpdates с offset выше
+        отметки подтвердил бы и потерял все новые обновления.
+        """
+        try:
+            pending = await self.bot.get_updates(limit=1, timeout=0)
+            if pending and not self.watermark.check_reset(pending[0].update_id) \
+                    and self.watermark.is_processed(pending[0].update_id):
+                await self.bot.get_updates(offset=self.watermark.value + 1, limit=1, timeout=0)
+        except Exception as e:
+            logger.warning(f"Не удалось подтвердить обновления до {self.watermark.value}: {e}")
+
+    async def _save_checkpoint(self):
+        """Сохранение отметки обработанных обновлений, если она сдвинулась"""
+        self.watermark.advance()
+        value = self.watermark.value
+        if value != self._saved_update_id:
+            await self.storage.run_write(self.db.set_state, 'last_update_id', str(value))
+            self._saved_update_id = value
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(UPDATE_CHECKPOINT_INTERVAL_MS / 1000)
+            try:
+                await self._save_checkpoint()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения update_id: {e}")
+
+    async def run_maintenance(self, key: str, run_date: date):
+        """Ежедневное обслуживание: удаление старых отметок обработанных сообщений и старых отчетов"""
+        removed = await self._prune_processed()
+        logger.info(f"Удалено старых отметок обработанных сообщений: {removed}")
+        await self.retention.run(self.registry.chats())
+
+    def parse_message(self, text: str, username: str, chat_id: int) -> List[Tuple[str, str, int]]:
         """Парсинг сообщения для извлечения отчетов с номерами дней"""
-        reports = []
-        words = text.lower().split()
-
-        logger.info(f"Парсинг сообщения: '{text}' от пользователя '{username}'")
-
-        i = 0
-        while i < len(words):
-            word = words[i]
-
-            # Ищем хэштег типа отчета
-            if word.startswith('#') and len(word) > 3:
-                # Проверяем возможные типы отчетов (2 или 3 символа)
-                potential_type = None
-                number_part = None
-
-                # Сначала пробуем 3 символа
-                if word[1:4] in REPORT_TYPES:
-                    potential_type = word[1:4]
-                    number_part = word[4:]
-                # Затем пробуем 2 символа
-                elif word[1:3] in REPORT_TYPES:
-                    potential_type = word[1:3]
-                    number_part = word[3:]
-
-                if potential_type and number_part.isdigit():
-                    day_number = int(number_part)
-                    logger.info(f"Найден потенциальный отчет: тип={potential_type}, день={day_number}, слово={word}")
-
-                    # Ищем следующий хэштег как участника (может быть несколько)
-                    participant_tag = None
-                    j = i + 1
-                    while j < len(words):
-                        next_word = words[j]
-                        if next_word.startswith('#') and next_word in PARTICIPANTS.values():
-                            participant_tag = next_word
-                            logger.info(f"Найден участник: {participant_tag} для типа {potential_type}")
-                            break
-                        j += 1
-
-                    # Если не нашли в сообщении, используем username
-                    if not participant_tag and username in PARTICIPANTS:
-                        participant_tag = PARTICIPANTS[username]
-                        logger.info(f"Используем username как участника: {participant_tag}")
-
-                    if participant_tag:
-                        reports.append((potential_type, participant_tag, day_number))
-                        logger.info(f"Добавлен отчет: {potential_type}, {participant_tag}, день {day_number}")
-                        i = j  # Пропускаем обработанный участок
-                        continue
-                    else:
-                        logger.warning(f"Не найден участник для отчета: тип={potential_type}, день={day_number}")
+        config = self.registry.get(chat_id)
+        if config is None:
+            return []
+        with PARSE_SECONDS.time():
+            return config.parser.parse(text, username)
 
-            i += 1
+    async def handle_message(self, message: types.Message):
+        """Обработка входящих сообщений
+
+        Сообщения разных пользователей обрабатываются параллельно, сообщения
+        одного пользователя - строго по очереди: INSERT OR REPLACE по
+        (user_tag, report_type, day_number) зависит от порядка. Повторно
+        доставленное сообщение (например, после перезапуска) отбрасывается по
+        (chat_id, message_id) до разбора.
+        """
+        key = (message.chat.id, message.message_id)
+        if key in self.processed:
+            logger.debug("Повторная доставка сообщения %s пропущена", key, extra={'event': 'duplicate'})
+            return
 
-        logger.info(f"Итого распознано отчетов: {len(reports)}")
-        return reports
+        user_id = message.from_user.id if message.from_user else 0
+        if await self.handler_pool.run((message.chat.id, user_id), self.process_message, message):
+            self.processed.add(key)
+            await self.storage.mark_processed(*key)
 
-    async def handle_message(self, message: types.Message):
-        """Обработка входящих сообщений"""
+    async def process_message(self, message: types.Message) -> bool:
+        """Разбор сообщения и сохранение найденных отчетов; False, если не все отчеты сохранены"""
         if not message.text:
-            return
+            return True
 
         username = f"@{message.from_user.username}" if message.from_user.username else ""
-        parsed_reports = self.parse_message(message.text, username)
+        parsed_reports = self.parse_message(message.text, username, message.chat.id)
 
         if parsed_reports:
             submission_time = message.date
+            config = self.registry.get(message.chat.id)
+            tz = config.timezone
+
+            # Все отчеты сообщения попадают в одну пачку группового коммита; на время ожидания
+            # коммита слот пула обработчиков отдается другим сообщениям, иначе пачку наполняют
+            # не больше HANDLER_WORKERS сообщений за WRITE_MAX_DELAY_MS
+            release_slot()
+            results = await asyncio.gather(*(
+                self.storage.save_report(
+                    chat_id=message.chat.id,
+                    user_tag=user_tag,
+                    report_type=report_type,
+                    day_number=day_number,
+                    submission_time=submission_time,
+                    username=username,
+                    message_id=message.message_id,
+                    tz=tz
+                )
+                for report_type, user_tag, day_number in parsed_reports
+            ), return_exceptions=True)
+
+            for (report_type, user_tag, day_number), result in zip(parsed_reports, results):
+                if isinstance(result, Exception):
+                    logger.error("Ошибка при обработке отчета %s - %s%s: %s", user_tag, report_type, day_number, result)
+                else:
+                    logger.debug("Сохранен отчет: %s - %s%s в %s", user_tag, report_type, day_number, submission_time,
+                                 extra={'event': 'report_saved'})
+                    self._mark_reported(config, submission_time, report_type, user_tag)
+            return not any(isinstance(result, Exception) for result in results)
+        return True
+
+    async def handle_edited_message(self, message: types.Message):
+        """Обработка исправленного сообщения: повторный разбор только этого сообщения"""
+        # Тот же ключ, что у исходного сообщения: правка применяется после его сохранения
+        user_id = message.from_user.id if message.from_user else 0
+        await self.handler_pool.run((message.chat.id, user_id), self.process_edit, message)
+
+    async def process_edit(self, message: types.Message):
+        """Применение разницы между отчетами сообщения и разбором исправленного текста"""
+        config = self.registry.get(message.chat.id)
+        if config is None:
+            return
+        username = f"@{message.from_user.username}" if message.from_user and message.from_user.username else ""
+        parsed_reports = self.parse_message(message.text or '', username, message.chat.id)
+        if not parsed_reports and not await self.storage.run_read(
+                self.db.message_has_reports, message.chat.id, message.message_id):
+            # Правка обычного сообщения без отчетов: ни сброса буфера записи, ни транзакции
+            self.edits_skipped += 1
+            return
+        rows = [
+            self.db.report_row(message.chat.id, user_tag, report_type, day_number, message.date, username,
+                               message.message_id, config.timezone)
+            for report_type, user_tag, day_number in parsed_reports
+        ]
+        # Отчеты этого сообщения, еще ожидающие группового коммита, должны попасть в базу до сравнения
+        await self.storage.write_buffer.flush()
+        try:
+            added, removed, updated = await self.storage.run_write(
+                self.db.apply_message_edit, message.chat.id, message.message_id, rows
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при применении правки сообщения {message.message_id}: {e}")
+            return
 
-            for report_type, user_tag, day_number in parsed_reports:
-                try:
-                    self.db.save_report(
-                        user_tag=user_tag,
-                        report_type=report_type,
-                        day_number=day_number,
-                        submission_time=submission_time,
-                        username=username,
-                        message_id=message.message_id
-                    )
+        if added or removed or updated:
+            logger.info(f"Правка сообщения {message.message_id} в чате {message.chat.id}: "
+                        f"добавлено {added}, удалено {removed}, изменено {updated}")
+            if removed or updated:
+                # Маски напоминаний только пополняются - после удаления они прогреются заново
+                self.reported.reset_chat(message.chat.id)
+            else:
+                for report_type, user_tag, _ in parsed_reports:
+                    self._mark_reported(config, message.date, report_type, user_tag)
 
-                    logger.info(f"Сохранен отчет: {user_tag} - {report_type}{day_number} в {submission_time}")
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке отчета {user_tag} - {report_type}{day_number}: {e}")
+    def _mark_reported(self, config: ChatConfig, submission_time: datetime, report_type: str, user_tag: str):
+        """Отметка сданного отчета в масках напоминаний (если маски за эту дату прогреты или прогреваются)"""
+        index = config.tag_index.get(user_tag)
+        local_time = submission_time.astimezone(config.timezone) if submission_time.tzinfo else submission_time
+        date_str = local_time.date().isoformat()
+        if index is not None:
+            self.reported.record(config.chat_id, date_str, report_type, index)
 
     def escape_markdown(self, text: str) -> str:
         """Экранирование специальных символов для Markdown"""
         escape_chars = r'_*[]()~`>#+-=|{}.!'
         return ''.join(f'\\{char}' if char in escape_chars else char for char in text)
 
-    def format_report_status(self, reports: Dict, date: datetime) -> str:
-        date_str = self.escape_markdown(date.strftime("%d.%m.%Y"))
+    def build_report_sections(self, reports: Dict, date: datetime,
+                              chat_id: int) -> Tuple[str, List[SummarySection]]:
+        """Заголовок и разделы сводки группы (по одному на тип отчета)"""
+        config = self.registry.get(chat_id)
+        participants = config.participants if config else PARTICIPANTS
+        report_types = config.report_types if config else REPORT_TYPES
+        tz = config.timezone if config else ChatConfig.parse_timezone(TIMEZONE)
 
-        message_parts = [f"📊 **Сводка отчетов за {date_str}**\n"]
+        date_str = self.escape_markdown(date.strftime("%d.%m.%Y"))
+        header = f"📊 **Сводка отчетов за {date_str}**\n"
 
-        # Определяем всех участников и создаем обратное сопоставление
-        all_users = list(PARTICIPANTS.values())
-        tag_to_username = {v: k for k, v in PARTICIPANTS.items()}
+        # Экранированные имена участников считаются один раз на сводку
+        display_names = {tag: self.escape_markdown(username) for username, tag in participants.items()}
+        now = datetime.now(tz)
 
-        # Для каждого типа отчета
-        for report_type, info in REPORT_TYPES.items():
+        sections = []
+        for report_type, info in report_types.items():
             submitted_users = []
             late_users = []
             missing_users = []
+            deadline = datetime.combine(date.date(), info['deadline'], tzinfo=tz)
 
-            # Проверяем дедлайн для утренних отчетов
-            if report_type == 'оу':
-                deadline = datetime.combine(date.date(), info['deadline'])
-            else:
-                deadline = datetime.combine(date.date(), info['deadline'])
-
-            for user_tag in all_users:
-                if user_tag in reports and report_type in reports[user_tag]:
-                    submission_time = datetime.fromisoformat(reports[user_tag][report_type]['datetime'])
-                    day_number = reports[user_tag][report_type]['day_number']
+            for user_tag, display_name in display_names.items():
+                user_reports = reports.get(user_tag)
+                if user_reports and report_type in user_reports:
+                    submission_time = datetime.fromisoformat(user_reports[report_type]['datetime'])
+                    if submission_time.tzinfo is not None:
+                        submission_time = submission_time.astimezone(tz)
+                    day_number = user_reports[report_type]['day_number']
 
                     # Проверяем, был ли отчет сдан вовремя
-                    if report_type == 'оу' and submission_time.time() > info['deadline']:
-                        late_users.append(f"{self.escape_markdown(tag_to_username.get(user_tag, user_tag))}({day_number})")
-                    else:
-                        submitted_users.append(f"{self.escape_markdown(tag_to_username.get(user_tag, user_tag))}({day_number})")
-                else:
-                    # Определяем, пропущен ли дедлайн
-                    if report_type == 'оу':
-                        if datetime.now().time() > info['deadline']:
-                            missing_users.append(self.escape_markdown(tag_to_username.get(user_tag, user_tag)))
+                    if report_type in LATE_REPORT_TYPES and submission_time.time() > info['deadline']:
+                        late_users.append(f"{display_name}({day_number})")
                     else:
-                        # Для вечерних отчетов дедлайн в 23:59
-                        if datetime.now().date() > date.date():
-                            missing_users.append(self.escape_markdown(tag_to_username.get(user_tag, user_tag)))
-
-            # Форматируем результат для типа отчета
-            emoji = {'ос': '🏃', 'оу': '🌅', 'ов': '🌙', 'гсд': '⭐'}[report_type]
-            message_parts.append(f"\n{emoji} **{self.escape_markdown(info['name'])}:**")
+                        submitted_users.append(f"{display_name}({day_number})")
+                elif now > deadline:
+                    # Дедлайн прошел, а отчета нет
+                    missing_users.append(display_name)
 
+            lines = []
             if submitted_users:
-                message_parts.append(f"✅ Вовремя: {', '.join(submitted_users)}")
-
+                lines.append(SummaryLine("✅ Вовремя: ", submitted_users))
             if late_users:
-                message_parts.append(f"⚠️ Опоздали: {', '.join(late_users)}")
-
+                lines.append(SummaryLine("⚠️ Опоздали: ", late_users))
             if missing_users:
-                message_parts.append(f"❌ Не сдали: {', '.join(missing_users)}")
-
-        return "\n".join(message_parts)
-
-    async def send_daily_report(self):
-        """Отправка ежедневной сводки"""
+                lines.append(SummaryLine("❌ Не сдали: ", missing_users))
+
+            emoji = info.get('emoji', '📌')
+            sections.append(SummarySection(f"\n{emoji} **{self.escape_markdown(info['name'])}:**", lines))
+
+        return header, sections
+
+    def format_report_status(self, reports: Dict, date: datetime, chat_id: int) -> str:
+        """Сводка одним сообщением"""
+        return render_summary(*self.build_report_sections(reports, date, chat_id))
+
+    def format_report_parts(self, reports: Dict, date: datetime, chat_id: int) -> List[str]:
+        """Сводка, разбитая на сообщения в пределах лимита Telegram"""
+        return split_summary(*self.build_report_sections(reports, date, chat_id))
+
+    async def send_daily_report(self, chat_id: Optional[int] = None):
+        """Отправка сводки за вчера (по местному времени группы) во все группы или в одну"""
+        configs = [self.registry.get(chat_id)] if chat_id is not None else self.registry.chats()
+        async with self.profiler.observe('daily_report', always=True):
+            await asyncio.gather(*(
+                self.send_chat_summary(config.chat_id, datetime.now(config.timezone) - timedelta(days=1))
+                for config in configs if config is not None
+            ))
+
+    def _schedule_chat(self, config: ChatConfig, last_summary_date: Optional[date] = None):
+        """Планирование сводки и напоминаний группы (прежние задачи группы заменяются)"""
+        self.scheduler.schedule(config.chat_id, config.timezone, config.summary_time, self.send_scheduled_summary,
+                                last_date=last_summary_date, day_offset=1, job='daily_report')
+        for key in self._reminder_keys.pop(config.chat_id, []):
+            self.scheduler.unschedule(key)
+        keys = []
+        for remind_at in reminder_times(config.report_types, REMINDER_OFFSETS):
+            key = ('reminder', config.chat_id, remind_at)
+            self.scheduler.schedule(key, config.timezone, remind_at, self.send_reminder, job='reminder')
+            keys.append(key)
+        self._reminder_keys[config.chat_id] = keys
+
+    def _unschedule_chat(self, chat_id: int):
+        self.scheduler.unschedule(chat_id)
+        for key in self._reminder_keys.pop(chat_id, []):
+            self.scheduler.unschedule(key)
+
+    async def send_reminder(self, key: Tuple, reminder_date: date):
+        """Напоминание о приближающемся дедлайне: одно сообщение на группу со всеми типами отчетов,
+        у которых наступило время напоминания, и только с теми, кто их еще не сдал"""
+        _, chat_id, remind_at = key
+        config = self.registry.get(chat_id)
+        if config is None:
+            return
+        date_str = reminder_date.isoformat()
+        # Один запрос к daily_status на группу в день; дальше маски пополняются при сохранении.
+        # Повтор - если маски группы сбросили (правка с удалением отчета), пока шло чтение
+        for _ in range(3):
+            if self.reported.is_warm(chat_id, date_str):
+                break
+            self.reported.begin_warm(chat_id, date_str)
+            reports = await self.storage.get_reports_for_date(datetime.combine(reminder_date, time.min), chat_id)
+            self.reported.warm(chat_id, date_str, reports, config.tag_index)
+
+        sections = []
+        for report_type, offset in reminder_times(config.report_types, REMINDER_OFFSETS).get(remind_at, []):
+            info = config.report_types[report_type]
+            reported = self.reported.mask(chat_id, date_str, report_type)
+            missing = [username for index, username in enumerate(config.usernames) if not reported >> index & 1]
+            if not missing:
+                continue
+            title = (f"\n{info.get('emoji', '📌')} {info['name']} — дедлайн в "
+                     f"{info['deadline'].strftime('%H:%M')} (через {offset} мин)")
+            sections.append(SummarySection(title, [SummaryLine("Еще не сдали: ", missing)]))
+
+        if not sections:
+            return
+        parts = split_summary("⏰ Напоминание об отчетах", sections)
+        await self.sender.send_many(chat_id, parts, parse_mode=None, wait=False)
+        logger.info(f"Отправлено напоминание в чат {chat_id} ({len(sections)} типов отчетов)")
+
+    async def send_scheduled_summary(self, chat_id: int, summary_date: date):
+        """Сводка по расписанию; после постановки в outbox дата отмечается как отправленная"""
+        async with self.profiler.observe(f"summary-{chat_id}", always=True):
+            sent = await self.send_chat_summary(chat_id, datetime.combine(summary_date, time.min))
+        if sent:
+            await self.storage.run_write(self.db.set_last_summary_date, chat_id, summary_date)
+
+    async def send_chat_summary(self, chat_id: int, date: datetime) -> bool:
+        """Отправка сводки за дату в группу; False, если сводку не удалось сформировать"""
         try:
-            yesterday = datetime.now() - timedelta(days=1)
-            reports = self.db.get_reports_for_date(yesterday)
+            reports = await self.storage.get_reports_for_date(date, chat_id)
 
             # Временный лог для проверки данных в БД сервера
-            logger.info(f"Количество отчетов за {yesterday.strftime('%d.%m.%Y')}: {len(reports)}")
-            for user_tag, user_reports in reports.items():
-                for report_type, details in user_reports.items():
-                    logger.info(f"Отчет сервера: {user_tag} - {report_type}{details['day_number']} от {details['username']}")
+            logger.info(f"Количество отчетов за {date.strftime('%d.%m.%Y')} в чате {chat_id}: {len(reports)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                for user_tag, user_reports in reports.items():
+                    for report_type, details in user_reports.items():
+                        logger.debug("Отчет сервера: %s - %s%s от %s", user_tag, report_type, details['day_number'],
+                                     details['username'])
 
-            report_message = self.format_report_status(reports, yesterday)
+            report_parts = self.format_report_parts(reports, date, chat_id)
 
-            await self.bot.send_message(
-                chat_id=GROUP_CHAT_ID,
-                text=report_message,
-                parse_mode=None
-            )
+            # Сводка сохраняется в outbox и доставляется с повторами даже после перезапуска;
+            # части уходят по порядку без ожидания доставки предыдущей
+            delivered = await self.sender.send_many(chat_id, report_parts, parse_mode=None)
 
-            logger.info(f"Отправлена сводка за {yesterday.strftime('%d.%m.%Y')}")
+            if delivered:
+                logger.info(f"Отправлена сводка за {date.strftime('%d.%m.%Y')} в чат {chat_id}")
+            else:
+                logger.error(f"Сводка за {date.strftime('%d.%m.%Y')} в чат {chat_id} не доставлена")
+            return True
 
         except Exception as e:
-            logger.error(f"Ошибка при отправке ежедневной сводки: {e}")
+            logger.error(f"Ошибка при отправке ежедневной сводки в чат {chat_id}: {e}")
+            return False
+
+    async def handle_status(self, message: types.Message):
+        """Обработка команды /status - сводка за сегодня на текущий момент"""
+        today = datetime.now(self.registry.get(message.chat.id).timezone)
+        reports = await self.storage.get_reports_for_date(today, message.chat.id)
+        for part in self.format_report_parts(reports, today, message.chat.id):
+            await message.reply(part, parse_mode=None)
 
     async def handle_start(self, message: types.Message):
         """Обработка команды /start"""
@@ -414,46 +1262,253 @@ class ReportBot:
 
     async def handle_help(self, message: types.Message):
         """Обработка команды /help"""
+        config = self.registry.get(message.chat.id)
+        participants = config.participants if config else PARTICIPANTS
+        report_types = config.report_types if config else REPORT_TYPES
+        example_user, example_tag = next(iter(participants.items()), ('@username', '#тег'))
+        example_type = next(iter(report_types), 'ос')
+
+        types_text = "".join(f"• `{code}` - {info['name']}\n" for code, info in report_types.items())
+        participants_text = "".join(f"{username} → {tag}\n" for username, tag in participants.items())
         await message.reply(
             "📋 **Формат отчетов:**\n"
             "`#типномер #участник`\n\n"
             "🏷️ **Типы отчетов:**\n"
-            "• `ос` - Спорт\n"
-            "• `оу` - Утренний отчёт\n" 
-            "• `ов` - Вечерний отчёт\n"
-            "• `гсд` - Главное событие дня\n\n"
+            f"{types_text}\n"
             "👥 **Участники:**\n"
-            "@A_N_yaki → #ан\n"
-            "@Dev_Jones → #ден\n"
-            "@FenolIFtalein → #никита\n"
-            "@Igor_Lucklett → #игорь\n"
-            "@Melnikova_Alena → #ал\n"
-            "@Mikhailovmind → #тор\n"
-            "@Polyhakayna0 → #поли\n"
-            "@Wlad_is_law → #в\n"
-            "@bleffucio → #арк\n"
-            "@helga_sigy → #оля\n"
-            "@mix_nastya → #нася\n"
-            "@nadezhda_efremova123 → #надя\n"
-            "@travellove_krd → #любовь\n\n"
+            f"{participants_text}\n"
             "📅 **Пример:**\n"
-            "`#ос100 #тор` = спорт за 100-й день от @Mikhailovmind"
+            f"`#{example_type}100 {example_tag}` = отчет за 100-й день от {example_user}\n\n"
+            "/status - сводка за сегодня на текущий момент\n\n"
+            "⚙️ **Для администраторов группы:**\n"
+            "/setup - подключить группу с настройками по умолчанию\n"
+            "/add\\_participant @username #тег\n"
+            "/remove\\_participant @username\n"
+            "/set\\_report\\_type код ЧЧ:ММ эмодзи Название\n"
+            "/remove\\_report\\_type код\n"
+            "/set\\_topic - принимать отчеты только из текущей темы\n"
+            "/set\\_timezone Europe/Moscow\n"
+            "/set\\_summary\\_time ЧЧ:ММ - время сводки за прошедший день\n"
+            "/set\\_retention N - сколько дней хранить отчеты (0 - всегда)"
         )
 
+    async def _is_chat_admin(self, message: types.Message) -> bool:
+        """Проверка, что команду отправил администратор группы"""
+        if message.chat.type not in ('group', 'supergroup') or not message.from_user:
+            return False
+        member = await self.bot.get_chat_member(message.chat.id, message.from_user.id)
+        if member.status in (ChatMemberStatus.CREATOR, ChatMemberStatus.ADMINISTRATOR):
+            return True
+        await message.reply("Команда доступна только администраторам группы")
+        return False
+
+    async def _reload_chat(self, chat_id: int):
+        """Перечитывание настроек группы после правки"""
+        configs = await self.storage.run_read(self.db.load_chat_configs, chat_id)
+        self.registry.update(chat_id, configs[0] if configs else None)
+        # Номера участников в масках могли измениться - маски прогреются заново
+        self.reported.reset_chat(chat_id)
+        config = self.registry.get(chat_id)
+        if config is None:
+            self._unschedule_chat(chat_id)
+        else:
+            self._schedule_chat(config)
+
+    async def handle_setup(self, message: types.Message):
+        """Обработка команды /setup - подключение группы"""
+        if not await self._is_chat_admin(message):
+            return
+        created = await self.storage.run_write(
+            self.db.register_chat, message.chat.id, message.chat.title, None, PARTICIPANTS, REPORT_TYPES
+        )
+        await self._reload_chat(message.chat.id)
+        await message.reply("Группа подключена" if created else "Группа уже подключена")
+
+    async def handle_add_participant(self, message: types.Message, command: CommandObject):
+        """Обработка команды /add_participant @username #тег"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        args = (command.args or '').split()
+        if len(args) != 2 or not args[0].startswith('@') or not args[1].startswith('#'):
+            await message.reply("Формат: /add_participant @username #тег")
+            return
+        username, tag = args[0], args[1].lower()
+        await self.storage.run_write(self.db.set_participant, message.chat.id, username, tag)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Участник {username} → {tag} сохранен")
+
+    async def handle_remove_participant(self, message: types.Message, command: CommandObject):
+        """Обработка команды /remove_participant @username"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        username = (command.args or '').strip()
+        removed = await self.storage.run_write(self.db.remove_participant, message.chat.id, username)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Участник {username} удален" if removed else f"Участник {username} не найден")
+
+    async def handle_set_report_type(self, message: types.Message, command: CommandObject):
+        """Обработка команды /set_report_type код ЧЧ:ММ эмодзи Название"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        args = (command.args or '').split(maxsplit=3)
+        try:
+            code, deadline, emoji, name = args
+            deadline_time = ChatConfig.parse_deadline(deadline)
+        except ValueError:
+            await message.reply("Формат: /set_report_type код ЧЧ:ММ эмодзи Название")
+            return
+        code = code.lower().lstrip('#')
+        if len(code) not in (2, 3):
+            await message.reply("Код типа отчета должен состоять из 2 или 3 символов")
+            return
+        await self.storage.run_write(self.db.set_report_type, message.chat.id, code, name, deadline_time, emoji)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Тип отчета {code} сохранен")
+
+    async def handle_remove_report_type(self, message: types.Message, command: CommandObject):
+        """Обработка команды /remove_report_type код"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        code = (command.args or '').strip().lower().lstrip('#')
+        removed = await self.storage.run_write(self.db.remove_report_type, message.chat.id, code)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Тип отчета {code} удален" if removed else f"Тип отчета {code} не найден")
+
+    async def handle_set_topic(self, message: types.Message):
+        """Обработка команды /set_topic - отчеты принимаются только из текущей темы"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        topic_id = message.message_thread_id if message.is_topic_message else None
+        await self.storage.run_write(self.db.set_chat_topic, message.chat.id, topic_id)
+        await self._reload_chat(message.chat.id)
+        await message.reply("Отчеты принимаются только из этой темы" if topic_id else "Отчеты принимаются из всей группы")
+
+    async def handle_set_timezone(self, message: types.Message, command: CommandObject):
+        """Обработка команды /set_timezone Europe/Moscow"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        tz_name = (command.args or '').strip()
+        try:
+            ChatConfig.parse_timezone(tz_name)
+        except ValueError:
+            await message.reply("Формат: /set_timezone Europe/Moscow (часовой пояс IANA)")
+            return
+        await self.storage.run_write(self.db.set_chat_timezone, message.chat.id, tz_name)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Часовой пояс группы: {tz_name}")
+
+    async def handle_set_summary_time(self, message: types.Message, command: CommandObject):
+        """Обработка команды /set_summary_time ЧЧ:ММ"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        try:
+            summary_time = ChatConfig.parse_deadline((command.args or '').strip())
+        except ValueError:
+            await message.reply("Формат: /set_summary_time ЧЧ:ММ")
+            return
+        await self.storage.run_write(self.db.set_summary_time, message.chat.id, summary_time)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Сводка за прошедший день будет приходить в {summary_time.strftime('%H:%M')}")
+
+    async def handle_set_retention(self, message: types.Message, command: CommandObject):
+        """Обработка команды /set_retention N - срок хранения отчетов в днях (0 - без ограничения)"""
+        if not await self._is_chat_admin(message) or message.chat.id not in self.registry:
+            return
+        try:
+            days = int((command.args or '').strip())
+            if days < 0:
+                raise ValueError(days)
+        except ValueError:
+            await message.reply("Формат: /set_retention N (дней, 0 - хранить всегда)")
+            return
+        await self.storage.run_write(self.db.set_retention_days, message.chat.id, days)
+        await self._reload_chat(message.chat.id)
+        await message.reply(f"Отчеты старше {days} дн. будут удаляться" if days else "Отчеты хранятся без ограничения срока")
+
     async def run(self):
         """Запуск бота"""
         # Регистрация обработчиков (старый синтаксис для совместимости)
         self.dp.message.register(self.handle_start, Command(commands=["start"]))
         self.dp.message.register(self.handle_help, Command(commands=["help"]))
-        self.dp.message.register(self.handle_message)
+        self.dp.message.register(
+            self.handle_status, Command(commands=["status"]), lambda msg: msg.chat.id in self.registry
+        )
+        self.dp.message.register(self.handle_setup, Command(commands=["setup"]))
+        self.dp.message.register(self.handle_add_participant, Command(commands=["add_participant"]))
+        self.dp.message.register(self.handle_remove_participant, Command(commands=["remove_participant"]))
+        self.dp.message.register(self.handle_set_report_type, Command(commands=["set_report_type"]))
+        self.dp.message.register(self.handle_remove_report_type, Command(commands=["remove_report_type"]))
+        self.dp.message.register(self.handle_set_topic, Command(commands=["set_topic"]))
+        self.dp.message.register(self.handle_set_timezone, Command(commands=["set_timezone"]))
+        self.dp.message.register(self.handle_set_summary_time, Command(commands=["set_summary_time"]))
+        self.dp.message.register(self.handle_set_retention, Command(commands=["set_retention"]))
 
         try:
-            await self.dp.start_polling(self.bot)
+            if BOT_MODE == 'webhook':
+                await self.run_webhook()
+            else:
+                await self.delete_webhook()
+                await self.dp.start_polling(self.bot)
         except Exception as e:
             logger.error(f"Ошибка при запуске бота: {e}")
         finally:
             await self.bot.session.close()
 
+    async def set_webhook(self):
+        """Регистрация вебхука в Telegram (если задан внешний адрес)"""
+        if not WEBHOOK_BASE_URL:
+            logger.info("WEBHOOK_BASE_URL не задан, вебхук в Telegram не регистрируется")
+            return
+        url = WEBHOOK_BASE_URL.rstrip('/') + WEBHOOK_PATH
+        await self.bot.set_webhook(url, secret_token=WEBHOOK_SECRET or None)
+        logger.info(f"Вебхук зарегистрирован: {url}")
+
+    async def delete_webhook(self):
+        """Снятие вебхука перед long polling: пока он зарегистрирован, getUpdates получает 409 Conflict.
+        Ожидающие обновления сохраняются и приходят через polling"""
+        try:
+            info = await self.bot.get_webhook_info()
+            if info.url:
+                await self.bot.delete_webhook(drop_pending_updates=False)
+                logger.info(f"Вебхук {info.url} снят, обновления принимаются через polling")
+        except Exception as e:
+            logger.warning(f"Не удалось снять вебхук: {e}")
+
+    def create_webhook_app(self) -> web.Application:
+        """aiohttp-приложение, принимающее обновления на WEBHOOK_PATH"""
+        if not WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET не задан: запросы к вебхуку не проверяются")
+
+        app = web.Application()
+        # Запросы без правильного заголовка X-Telegram-Bot-Api-Secret-Token получают 401
+        SimpleRequestHandler(
+            dispatcher=self.dp,
+            bot=self.bot,
+            secret_token=WEBHOOK_SECRET or None,
+        ).register(app, path=WEBHOOK_PATH)
+        # Запуск и остановка диспетчера (on_startup/on_shutdown) привязаны к приложению
+        setup_application(app, self.dp, bot=self.bot)
+        return app
+
+    async def run_webhook(self):
+        """Прием обновлений через вебхук вместо long polling"""
+        if not WEBHOOK_SECRET and WEBHOOK_HOST not in ('127.0.0.1', 'localhost', '::1'):
+            # Без секрета любой, кто достучится до порта, может прислать поддельные обновления
+            raise RuntimeError(f"WEBHOOK_SECRET не задан: вебхук без проверки запросов слушает только "
+                               f"локальный адрес, а не {WEBHOOK_HOST}")
+        self.dp.startup.register(self.set_webhook)
+
+        runner = web.AppRunner(self.create_webhook_app())
+        await runner.setup()
+        site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+        await site.start()
+        logger.info(f"Вебхук слушает {WEBHOOK_HOST}:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
 async def main():
     """Главная функция"""
     bot = ReportBot()
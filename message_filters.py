@@ -0,0 +1,54 @@
+from typing import Dict
+
+from aiogram import types
+
+from chat_registry import ChatRegistry
+
+
+class ReportPrefilter:
+    """Быстрый фильтр сообщений на уровне диспетчера.
+
+    Отсекает сообщения до вызова обработчика за O(1): группа не
+    зарегистрирована, не та тема (если у группы задан topic_id), команда или
+    в тексте нет ни одного хэштега (проверка отключается require_hashtag=False,
+    например для правок, убравших отчеты). Для каждого этапа ведется счетчик
+    отброшенных обновлений.
+    """
+
+    STAGES = ('wrong_chat', 'wrong_topic', 'no_text', 'command', 'no_hashtag')
+
+    def __init__(self, registry: ChatRegistry, require_hashtag: bool = True):
+        self.registry = registry
+        self.require_hashtag = require_hashtag
+        self.rejected: Dict[str, int] = dict.fromkeys(self.STAGES, 0)
+        self.passed = 0
+
+    def __call__(self, message: types.Message) -> bool:
+        config = self.registry.get(message.chat.id)
+        if config is None:
+            self.rejected['wrong_chat'] += 1
+            return False
+
+        if config.topic_id is not None and message.message_thread_id != config.topic_id:
+            self.rejected['wrong_topic'] += 1
+            return False
+
+        text = message.text
+        if not text:
+            self.rejected['no_text'] += 1
+            return False
+
+        if text[0] == '/':
+            self.rejected['command'] += 1
+            return False
+
+        if self.require_hashtag and '#' not in text:
+            self.rejected['no_hashtag'] += 1
+            return False
+
+        self.passed += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики отброшенных и пропущенных сообщений"""
+        return {**{f'rejected_{stage}': count for stage, count in self.rejected.items()}, 'passed': self.passed}
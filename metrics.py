@@ -0,0 +1,245 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 60.0, 300.0, 3600.0, 86400.0)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовая метрика: значения по наборам меток. Запись возможна из потоков базы"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield f"{self.name}_total", _format_labels(self.labelnames, labels), value
+
+
+class Gauge(Metric):
+    """Текущее значение"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def samples(self):
+        for labels, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами: запись - поиск корзины и два сложения"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по корзинам (последняя - +Inf), сумма, количество]
+        self._series: Dict[Labels, List] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels: str) -> '_Timer':
+        """Контекстный менеджер: длительность блока в секундах"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, labels, le), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, labels), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, labels), count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: Histogram, labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса и источников stats() существующих компонентов"""
+
+    def __init__(self, namespace: str = 'bot'):
+        self.namespace = namespace
+        self._metrics: Dict[str, Metric] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        full_name = f"{self.namespace}_{name}"
+        metric = self._metrics.get(full_name)
+        if metric is None:
+            metric = self._metrics[full_name] = cls(full_name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def add_stats(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        """Числовые значения stats() отдаются как bot_<prefix>_<ключ> при каждом запросе"""
+        self._stats[prefix] = stats
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for prefix, stats in self._stats.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Не удалось получить статистику {prefix}: {e}")
+                continue
+            for key, value in values.items():
+                if not isinstance(value, (int, float)):
+                    continue
+                name = re.sub(r'[^a-zA-Z0-9_]', '_', f"{self.namespace}_{prefix}_{key}")
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'handler_seconds', "Время обработчиков aiogram (включая ожидание очереди и коммита)", ('handler',))
+HANDLER_ERRORS = REGISTRY.counter('handler_errors', "Исключения в обработчиках aiogram", ('handler',))
+PARSE_SECONDS = REGISTRY.histogram('parse_seconds', "Время разбора сообщения с отчетами")
+DB_SECONDS = REGISTRY.histogram(
+    'db_seconds', "Время выполнения методов ReportDatabase в потоках базы", ('method', 'mode'))
+DB_ERRORS = REGISTRY.counter('db_errors', "Исключения в методах ReportDatabase", ('method',))
+SEND_SECONDS = REGISTRY.histogram(
+    'send_seconds', "Время вызова sendMessage (result: ok, retry_after, error)", ('result',))
+START_TIME = REGISTRY.gauge('start_time_seconds', "Время запуска бота, unixtime")
+SCHEDULER_LAG_SECONDS = REGISTRY.histogram(
+    'scheduler_lag_seconds', "Опоздание срабатывания ежедневной задачи относительно плана", ('job',),
+    buckets=LAG_BUCKETS)
+RETENTION_LOCK_SECONDS = REGISTRY.histogram(
+    'retention_lock_seconds', "Удержание блокировки записи одной пачкой очистки (step: delete, vacuum)", ('step',))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время и ошибки каждого обработчика по имени"""
+
+    async def __call__(self, handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+                       event: Any, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+
+
+async def start_metrics_server(host: str, port: int, registry: MetricsRegistry = REGISTRY) -> Optional[web.AppRunner]:
+    """HTTP-сервер с GET /metrics; None, если port не задан"""
+    if not port:
+        return None
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
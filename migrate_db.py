@@ -1,8 +1,341 @@
+import logging
 import sqlite3
 import os
-from datetime import datetime
+from datetime import date, datetime, tzinfo
+from typing import Dict, Optional
+
+from chat_registry import ChatConfig
+
+logger = logging.getLogger(__name__)
 
 DATABASE_PATH = os.getenv('DATABASE_PATH', 'reports.db')
+# Чат, к которому относятся отчеты, сохраненные до поддержки нескольких групп
+GROUP_CHAT_ID = int(os.getenv('GROUP_CHAT_ID', 0))
+
+# Часовой пояс групп без своего (как TIMEZONE в main.py)
+TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
+
+# Размер пачки при заполнении новых колонок, чтобы не держать блокировку записи долго
+BACKFILL_BATCH_SIZE = 5000
+# Версия правила заполнения report_date; при смене все строки пересчитываются один раз
+REPORT_DATE_VERSION = 'local'
+
+def local_report_date(submission_time: datetime, tz: tzinfo) -> date:
+    """Дата отчета - местная дата группы: время с часовым поясом приводится к tz, наивное берется как есть"""
+    if submission_time.tzinfo is not None:
+        return submission_time.astimezone(tz).date()
+    return submission_time.date()
+
+def create_reports_table(conn: sqlite3.Connection, name: str = 'reports'):
+    """Создание таблицы отчетов в актуальной схеме"""
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            user_tag TEXT NOT NULL,
+            report_type TEXT NOT NULL,
+            day_number INTEGER NOT NULL,
+            datetime TEXT NOT NULL,
+            username TEXT,
+            message_id INTEGER,
+            report_date TEXT,
+            UNIQUE(chat_id, user_tag, report_type, day_number)
+        )
+    ''')
+
+def migrate_multi_chat(conn: sqlite3.Connection, default_chat_id: int = GROUP_CHAT_ID) -> bool:
+    """Поддержка нескольких групп: реестр чатов и колонка chat_id в reports
+
+    Создает таблицы chats, chat_participants и chat_report_types. Если в reports
+    еще нет chat_id, таблица пересоздается (уникальность теперь в пределах чата),
+    существующие отчеты относятся к default_chat_id; daily_status и его триггеры
+    удаляются и затем создаются заново migrate_daily_status.
+    Возвращает True, если reports была пересоздана.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id INTEGER PRIMARY KEY,
+            title TEXT,
+            topic_id INTEGER,
+            version INTEGER NOT NULL DEFAULT 1
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_participants (
+            chat_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (chat_id, username),
+            UNIQUE (chat_id, tag)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_report_types (
+            chat_id INTEGER NOT NULL,
+            code TEXT NOT NULL,
+            name TEXT NOT NULL,
+            deadline TEXT NOT NULL,
+            emoji TEXT NOT NULL DEFAULT '📌',
+            position INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (chat_id, code)
+        )
+    ''')
+    conn.commit()
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+    if not columns or 'chat_id' in columns:
+        return False
+
+    report_date = 'report_date' if 'report_date' in columns else 'NULL'
+    conn.execute('BEGIN')
+    try:
+        conn.execute('DROP TRIGGER IF EXISTS trg_reports_status_insert')
+        conn.execute('DROP TRIGGER IF EXISTS trg_reports_status_delete')
+        conn.execute('DROP TABLE IF EXISTS daily_status')
+        create_reports_table(conn, 'reports_new')
+        conn.execute(f'''
+            INSERT INTO reports_new
+            (id, chat_id, user_tag, report_type, day_number, datetime, username, message_id, report_date)
+            SELECT id, ?, user_tag, report_type, day_number, datetime, username, message_id, {report_date}
+            FROM reports
+        ''', (default_chat_id,))
+        conn.execute('DROP TABLE reports')
+        conn.execute('ALTER TABLE reports_new RENAME TO reports')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+def migrate_chat_schedule(conn: sqlite3.Connection):
+    """Часовой пояс, время сводки и дата последней отправленной сводки группы
+
+    NULL в timezone и summary_time означает значения по умолчанию (TIMEZONE и
+    SUMMARY_TIME из окружения). last_summary_date позволяет после простоя
+    отправить пропущенную сводку.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+    for column in ('timezone', 'summary_time', 'last_summary_date'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE chats ADD COLUMN {column} TEXT')
+    conn.commit()
+
+def migrate_chat_retention(conn: sqlite3.Connection):
+    """Срок хранения отчетов группы в днях (NULL - REPORT_RETENTION_DAYS из окружения, 0 - без ограничения)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+    if 'retention_days' not in columns:
+        conn.execute('ALTER TABLE chats ADD COLUMN retention_days INTEGER')
+    conn.commit()
+
+def migrate_auto_vacuum(conn: sqlite3.Connection) -> bool:
+    """Перевод базы в auto_vacuum=INCREMENTAL, чтобы после очистки файл уменьшался
+
+    Для существующей базы режим меняется только через VACUUM - полную
+    перезапись файла, поэтому бот этого не делает, а скрипт миграции нужно
+    запускать при остановленном боте. Возвращает True, если база переведена.
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return False
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('VACUUM')
+    return True
+
+def migrate_report_date(conn: sqlite3.Connection, batch_size: int = BACKFILL_BATCH_SIZE,
+                        default_tz: Optional[tzinfo] = None) -> int:
+    """Добавление индексируемой колонки report_date вместо date(datetime)
+
+    Заполняет колонку пачками по batch_size строк (каждая пачка - отдельная
+    транзакция, проход по возрастанию id) и создает составной индекс
+    (chat_id, report_date, user_tag, report_type). Дата считается так же, как
+    при вставке (local_report_date): местная дата в часовом поясе группы из
+    chats.timezone, а без него - в default_tz (по умолчанию TIMEZONE).
+
+    Ранние версии заполняли колонку датой по UTC, поэтому все строки
+    пересчитываются, а при изменениях daily_status строится заново. Это
+    делается один раз: после прохода в bot_state записывается отметка
+    REPORT_DATE_VERSION, и при следующих запусках таблица не просматривается
+    (новые строки получают report_date при вставке). Строки, datetime которых
+    не разбирается, остаются с NULL и попадают в предупреждение в логе.
+    Возвращает количество заполненных или исправленных строк.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(reports)")}
+    if not columns:
+        return 0
+
+    if 'report_date' not in columns:
+        conn.execute('ALTER TABLE reports ADD COLUMN report_date TEXT')
+        conn.commit()
+
+    if default_tz is None:
+        default_tz = ChatConfig.parse_timezone(TIMEZONE)
+    conn.execute('CREATE TABLE IF NOT EXISTS bot_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    state = conn.execute('SELECT value FROM bot_state WHERE key = ?', ('report_date_version',)).fetchone()
+    if state is not None and state[0] == REPORT_DATE_VERSION:
+        return 0
+    timezones = chat_timezones(conn, default_tz)
+
+    total = 0
+    last_id = 0
+    batches = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, chat_id, datetime, report_date FROM reports
+            WHERE id > ?
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        updates = []
+        for report_id, chat_id, dt_str, old_date in rows:
+            try:
+                new_date = local_report_date(datetime.fromisoformat(dt_str), timezones.get(chat_id, default_tz))
+            except (TypeError, ValueError):
+                continue
+            if new_date.isoformat() != old_date:
+                updates.append((new_date.isoformat(), report_id))
+        if updates:
+            conn.executemany('UPDATE reports SET report_date = ? WHERE id = ?', updates)
+        conn.commit()
+        total += len(updates)
+        # Следующая пачка - после последнего id (строки с неразбираемой датой не выбираются повторно)
+        last_id = rows[-1][0]
+        batches += 1
+        if batches % 10 == 0:
+            logger.info(f"Заполнено report_date: {total}")
+
+    if total:
+        rebuild_daily_status(conn)
+
+    unparsed = conn.execute(
+        'SELECT id, datetime FROM reports WHERE report_date IS NULL ORDER BY id LIMIT 10'
+    ).fetchall()
+    if unparsed:
+        count = conn.execute('SELECT COUNT(*) FROM reports WHERE report_date IS NULL').fetchone()[0]
+        logger.warning(f"report_date не заполнена у {count} отчетов с неразбираемым datetime "
+                       f"(первые id и значения: {unparsed})")
+
+    conn.execute('DROP INDEX IF EXISTS idx_reports_date_user_type')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reports_chat_date
+        ON reports(chat_id, report_date, user_tag, report_type)
+    ''')
+    conn.execute('INSERT OR REPLACE INTO bot_state (key, value) VALUES (?, ?)',
+                 ('report_date_version', REPORT_DATE_VERSION))
+    conn.commit()
+    return total
+
+
+def chat_timezones(conn: sqlite3.Connection, default_tz: tzinfo) -> Dict[int, tzinfo]:
+    """Часовые пояса групп из chats.timezone (без него или с неизвестным - default_tz)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+    if 'timezone' not in columns:
+        return {}
+    timezones = {}
+    for chat_id, tz_name in conn.execute('SELECT chat_id, timezone FROM chats'):
+        try:
+            timezones[chat_id] = ChatConfig.parse_timezone(tz_name) if tz_name else default_tz
+        except ValueError:
+            timezones[chat_id] = default_tz
+    return timezones
+
+
+def rebuild_daily_status(conn: sqlite3.Connection):
+    """Перестроение daily_status из reports (после массового изменения report_date)"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_status'"
+    ).fetchone()
+    if not exists:
+        return
+    conn.execute('DELETE FROM daily_status')
+    conn.execute('''
+        INSERT OR REPLACE INTO daily_status
+        (chat_id, report_date, user_tag, report_type, report_id, day_number, datetime, username)
+        SELECT chat_id, report_date, user_tag, report_type, id, day_number, datetime, username
+        FROM reports
+        WHERE report_date IS NOT NULL
+        ORDER BY id
+    ''')
+    conn.commit()
+
+
+def migrate_message_index(conn: sqlite3.Connection):
+    """Индекс (chat_id, message_id): отчеты сообщения находятся при его редактировании"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reports_chat_message
+        ON reports(chat_id, message_id)
+    ''')
+    conn.commit()
+
+
+def migrate_daily_status(conn: sqlite3.Connection) -> int:
+    """Материализованная таблица daily_status для мгновенных сводок
+
+    Таблица хранит последний отчет каждого участника по каждому типу за дату
+    и поддерживается триггерами на reports. Для замены строк через
+    INSERT OR REPLACE соединение-писатель должно включать recursive_triggers.
+    При первом создании таблица заполняется из reports; возвращает
+    количество перенесенных строк.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='daily_status'"
+    ).fetchone()
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_status (
+            chat_id INTEGER NOT NULL,
+            report_date TEXT NOT NULL,
+            user_tag TEXT NOT NULL,
+            report_type TEXT NOT NULL,
+            report_id INTEGER NOT NULL,
+            day_number INTEGER NOT NULL,
+            datetime TEXT NOT NULL,
+            username TEXT,
+            PRIMARY KEY (chat_id, report_date, user_tag, report_type)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reports_status_insert
+        AFTER INSERT ON reports
+        WHEN NEW.report_date IS NOT NULL
+        BEGIN
+            INSERT OR REPLACE INTO daily_status
+            (chat_id, report_date, user_tag, report_type, report_id, day_number, datetime, username)
+            VALUES (NEW.chat_id, NEW.report_date, NEW.user_tag, NEW.report_type, NEW.id,
+                    NEW.day_number, NEW.datetime, NEW.username);
+        END
+    ''')
+    # После удаления отчета статус берется из оставшегося последнего отчета за ту же дату
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_reports_status_delete
+        AFTER DELETE ON reports
+        BEGIN
+            DELETE FROM daily_status
+            WHERE chat_id = OLD.chat_id AND report_date = OLD.report_date AND user_tag = OLD.user_tag
+              AND report_type = OLD.report_type AND report_id = OLD.id;
+            INSERT OR IGNORE INTO daily_status
+            (chat_id, report_date, user_tag, report_type, report_id, day_number, datetime, username)
+            SELECT chat_id, report_date, user_tag, report_type, id, day_number, datetime, username
+            FROM reports
+            WHERE chat_id = OLD.chat_id AND report_date = OLD.report_date AND user_tag = OLD.user_tag
+              AND report_type = OLD.report_type
+            ORDER BY id DESC
+            LIMIT 1;
+        END
+    ''')
+
+    filled = 0
+    if not exists:
+        cursor = conn.execute('''
+            INSERT OR REPLACE INTO daily_status
+            (chat_id, report_date, user_tag, report_type, report_id, day_number, datetime, username)
+            SELECT chat_id, report_date, user_tag, report_type, id, day_number, datetime, username
+            FROM reports
+            WHERE report_date IS NOT NULL
+            ORDER BY id
+        ''')
+        filled = cursor.rowcount
+    conn.commit()
+    return filled
 
 def migrate_database():
     """Миграция базы данных к новой схеме"""
@@ -64,5 +397,24 @@ def migrate_database():
         else:
             print("База данных уже использует новую схему.")
 
+        if migrate_multi_chat(conn):
+            print(f"Таблица reports перестроена для нескольких групп (старые отчеты -> чат {GROUP_CHAT_ID}).")
+        migrate_chat_schedule(conn)
+        migrate_chat_retention(conn)
+
+        filled = migrate_report_date(conn)
+        if filled:
+            print(f"Колонка report_date заполнена для {filled} записей.")
+
+        migrate_message_index(conn)
+
+        filled = migrate_daily_status(conn)
+        if filled:
+            print(f"Таблица daily_status заполнена: {filled} записей.")
+
+        if migrate_auto_vacuum(conn):
+            print("Включен auto_vacuum=INCREMENTAL: место после очистки старых отчетов возвращается файлу.")
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     migrate_database()
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from metrics import SEND_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (id в outbox, чат, текст, parse_mode, число попыток, future ожидающего или None)
+OutboxItem = Tuple[int, int, str, Optional[str], int, Optional[asyncio.Future]]
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Ожидание и списание одного токена"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OutboundSender:
+    """Очередь исходящих сообщений с ограничением скорости и повторами.
+
+    Каждое сообщение сначала записывается в таблицу outbox, поэтому
+    неотправленные сводки переживают перезапуск (start() загружает их снова).
+    Отправка ограничена общим ведром токенов и ведром на каждый чат; сообщения
+    одного чата уходят строго по порядку. На 429 выдерживается retry_after,
+    на сетевые и серверные ошибки - экспоненциальная задержка. Доставка
+    гарантируется "хотя бы один раз": при падении между отправкой и удалением
+    строки сообщение уйдет повторно.
+
+    Ошибка самой очереди (например, базы при обновлении строки outbox) не
+    останавливает обработчик чата: сообщение снимается с очереди, ожидающий
+    получает False, а строка остается в outbox и отправится после перезапуска.
+    """
+
+    def __init__(self, bot: Bot, storage, global_rate: float = 25.0, chat_rate_per_minute: float = 20.0,
+                 chat_burst: int = 5, max_attempts: int = 8, base_backoff: float = 1.0, max_backoff: float = 300.0):
+        self.bot = bot
+        self.storage = storage
+        self.chat_rate = chat_rate_per_minute / 60
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._queues: Dict[int, Deque[OutboxItem]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._queued_ids: Set[int] = set()
+        self._started = False
+
+        # Метрики
+        self.sent = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.errors = 0
+
+    async def start(self):
+        """Загрузка неотправленных сообщений из outbox"""
+        if self._started:
+            return
+        self._started = True
+        pending = await self.storage.run_read(self.storage.db.outbox_pending)
+        for outbox_id, chat_id, text, parse_mode, attempts in pending:
+            if outbox_id not in self._queued_ids:
+                self._enqueue((outbox_id, chat_id, text, parse_mode, attempts, None))
+        if pending:
+            logger.info(f"Загружено неотправленных сообщений из outbox: {len(pending)}")
+
+    async def send(self, chat_id: int, text: str, parse_mode: Optional[str] = None, wait: bool = True) -> bool:
+        """Постановка сообщения в очередь.
+
+        При wait=True ждет доставки и возвращает True, если сообщение отправлено,
+        и False, если от него пришлось отказаться.
+        """
+        return await self.send_many(chat_id, [text], parse_mode, wait)
+
+    async def send_many(self, chat_id: int, texts: List[str], parse_mode: Optional[str] = None,
+                        wait: bool = True) -> bool:
+        """Постановка нескольких сообщений в очередь чата с сохранением порядка.
+
+        Сообщения записываются в outbox одной транзакцией и отправляются подряд,
+        не дожидаясь подтверждения предыдущего. При wait=True возвращает True,
+        только если доставлены все.
+        """
+        outbox_ids = await self.storage.run_write(self.storage.db.outbox_add, chat_id, texts, parse_mode)
+        loop = asyncio.get_running_loop()
+        futures = []
+        for outbox_id, text in zip(outbox_ids, texts):
+            future = loop.create_future() if wait else None
+            self._enqueue((outbox_id, chat_id, text, parse_mode, 0, future))
+            if future is not None:
+                futures.append(future)
+        if not futures:
+            return True
+        return all(await asyncio.gather(*futures))
+
+    def _enqueue(self, item: OutboxItem):
+        chat_id = item[1]
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        queue.append(item)
+        self._queued_ids.add(item[0])
+        if chat_id not in self._workers:
+            task = asyncio.get_running_loop().create_task(self._chat_worker(chat_id, queue))
+            self._workers[chat_id] = task
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    async def _chat_worker(self, chat_id: int, queue: Deque[OutboxItem]):
+        try:
+            while queue:
+                item = queue[0]
+                try:
+                    delivered = await self._deliver(item)
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"Ошибка очереди отправки сообщения {item[0]} в чат {chat_id}: {e}")
+                    delivered = False
+                queue.popleft()
+                self._queued_ids.discard(item[0])
+                future = item[5]
+                if future is not None and not future.done():
+                    future.set_result(delivered)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                self._queues.pop(chat_id, None)
+
+    async def _deliver(self, item: OutboxItem) -> bool:
+        outbox_id, chat_id, text, parse_mode, attempts, _ = item
+        bucket = self._chat_bucket(chat_id)
+
+        while True:
+            await bucket.acquire()
+            await self._global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            except TelegramRetryAfter as e:
+                SEND_SECONDS.observe(time.perf_counter() - started, 'retry_after')
+                self.rate_limited += 1
+                logger.warning(f"Лимит Telegram для чата {chat_id}, повтор через {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError) as e:
+                SEND_SECONDS.observe(time.perf_counter() - started, 'error')
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    return await self._give_up(outbox_id, chat_id, attempts, e)
+                self.retries += 1
+                delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.0)
+                logger.warning(f"Ошибка отправки в чат {chat_id} (попытка {attempts}): {e}, повтор через {delay:.1f} с")
+                await self.storage.run_write(self.storage.db.outbox_update, outbox_id, attempts, 'pending', str(e))
+                await asyncio.sleep(delay)
+                continue
+            except Exception as e:
+                SEND_SECONDS.observe(time.perf_counter() - started, 'error')
+                # Ошибки запроса (неверный чат, нет прав, неверная разметка) повтором не исправить
+                return await self._give_up(outbox_id, chat_id, attempts + 1, e)
+
+            SEND_SECONDS.observe(time.perf_counter() - started, 'ok')
+            self.sent += 1
+            try:
+                await self.storage.run_write(self.storage.db.outbox_delete, outbox_id)
+            except Exception as e:
+                # Сообщение уже доставлено; строка останется и уйдет повторно только после перезапуска
+                self.errors += 1
+                logger.error(f"Сообщение {outbox_id} доставлено, но не удалено из outbox: {e}")
+            return True
+
+    async def _give_up(self, outbox_id: int, chat_id: int, attempts: int, error: Exception) -> bool:
+        self.failed += 1
+        logger.error(f"Сообщение {outbox_id} в чат {chat_id} не отправлено после {attempts} попыток: {error}")
+        await self.storage.run_write(self.storage.db.outbox_update, outbox_id, attempts, 'failed', str(error))
+        return False
+
+    async def stop(self):
+        """Остановка отправки; неотправленные сообщения остаются в outbox"""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for *_, future in queue:
+                if future is not None and not future.done():
+                    future.cancel()
+        self._queues.clear()
+        self._queued_ids.clear()
+        self._started = False
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики отправки и длина очередей"""
+        return {
+            'queued': sum(len(queue) for queue in self._queues.values()),
+            'sent': self.sent,
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
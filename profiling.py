@@ -0,0 +1,218 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import random
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Сколько кадров стека обработчика выводится в предупреждении о медленном обновлении
+SLOW_STACK_FRAMES = 8
+# Стеки всех задач сохраняются не чаще раза в интервал: при перегрузке медленны почти все обновления
+SLOW_DUMP_INTERVAL = 60.0
+
+
+def await_stack(task: asyncio.Task) -> List[str]:
+    """Стек задачи по цепочке await (Task.get_stack для ждущей корутины дает только верхний кадр)"""
+    frames = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, 'cr_frame', None) or getattr(coro, 'gi_frame', None) or getattr(coro, 'ag_frame', None)
+        if frame is None:
+            break
+        frames.append((frame, frame.f_lineno))
+        coro = getattr(coro, 'cr_await', None) or getattr(coro, 'gi_yieldfrom', None) or getattr(coro, 'ag_await', None)
+    return traceback.StackSummary.extract(frames).format()
+
+
+class Profiler:
+    """Профилирование по запросу: все выключено, пока не задано окружением.
+
+    - sample_rate: доля обновлений, выполняемых под cProfile; профиль
+      сохраняется в directory как .prof (pstats). Одновременно профилируется
+      только одно обновление, поэтому в профиль попадает и работа других
+      задач, выполнявшихся, пока оно ждало (очередь, база, сеть).
+    - slow_threshold: если обработка дольше порога (секунды), в лог пишется
+      предупреждение с текущим стеком обработчика, а в directory - стеки всех
+      задач asyncio в этот момент (не чаще раза в SLOW_DUMP_INTERVAL).
+    - tracemalloc_interval: период снимков tracemalloc (секунды); снимки
+      сохраняются в directory, в лог - крупнейшие приросты с прошлого снимка.
+      Трассировка замедляет каждое выделение памяти: с одним кадром на ~15%,
+      с десятью - в разы, поэтому tracemalloc_frames больше 1 - только для
+      коротких сеансов.
+
+    В directory хранится не больше max_dumps файлов каждого вида.
+    """
+
+    def __init__(self, directory: str = 'profiles', sample_rate: float = 0.0, slow_threshold: float = 0.0,
+                 tracemalloc_interval: float = 0.0, tracemalloc_frames: int = 1, max_dumps: int = 200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.tracemalloc_interval = tracemalloc_interval
+        self.tracemalloc_frames = tracemalloc_frames
+        self.max_dumps = max_dumps
+
+        self._profiling = False
+        self._dumps: Dict[str, Deque[str]] = {}
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._last_slow_dump = float('-inf')
+
+        # Метрики
+        self.profiled = 0
+        self.skipped_busy = 0
+        self.slow = 0
+        self.snapshots = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_threshold > 0 or self.tracemalloc_interval > 0
+
+    def _dump_path(self, kind: str, name: str, extension: str) -> str:
+        """Путь для нового файла; старейший файл этого вида удаляется сверх max_dumps"""
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(self.directory, f"{kind}-{stamp}-{name}.{extension}")
+        dumps = self._dumps.setdefault(kind, deque())
+        dumps.append(path)
+        while len(dumps) > self.max_dumps:
+            old = dumps.popleft()
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+        return path
+
+    @asynccontextmanager
+    async def observe(self, name: str, always: bool = False) -> AsyncIterator[None]:
+        """Выполнение блока под наблюдением: выборочный cProfile и сторож медленной обработки.
+
+        always - профилировать при любой включенной выборке (для редких задач вроде сводок).
+        """
+        profile = None
+        if self.sample_rate > 0 and (always or random.random() < self.sample_rate):
+            if self._profiling:
+                self.skipped_busy += 1
+            else:
+                self._profiling = True
+                profile = cProfile.Profile()
+                profile.enable()
+
+        watchdog = None
+        started = time.perf_counter()
+        if self.slow_threshold > 0:
+            task = asyncio.current_task()
+            watchdog = asyncio.get_running_loop().call_later(self.slow_threshold, self._report_slow, name, task)
+        try:
+            yield
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+                elapsed = time.perf_counter() - started
+                if elapsed > self.slow_threshold:
+                    logger.warning(f"{name} обработано за {elapsed * 1000:.0f} мс")
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                self.profiled += 1
+                try:
+                    profile.dump_stats(self._dump_path('profile', name, 'prof'))
+                except OSError as e:
+                    logger.error(f"Не удалось сохранить профиль {name}: {e}")
+
+    def _report_slow(self, name: str, task: Optional[asyncio.Task]):
+        """Обработка еще идет дольше порога: стек обработчика в лог, стеки всех задач в файл"""
+        self.slow += 1
+        stack = ''.join(await_stack(task)[-SLOW_STACK_FRAMES:]) if task is not None else ''
+        logger.warning(f"{name} обрабатывается дольше {self.slow_threshold * 1000:.0f} мс, стек:\n{stack}")
+
+        now = time.monotonic()
+        if now - self._last_slow_dump < SLOW_DUMP_INTERVAL:
+            return
+        self._last_slow_dump = now
+        out = io.StringIO()
+        for other in asyncio.all_tasks():
+            out.write(f"--- {other.get_name()}\n")
+            out.writelines(await_stack(other))
+        try:
+            with open(self._dump_path('slow', name, 'txt'), 'w', encoding='utf-8') as f:
+                f.write(out.getvalue())
+        except OSError as e:
+            logger.error(f"Не удалось сохранить стеки задач для {name}: {e}")
+
+    def start(self):
+        """Запуск периодических снимков tracemalloc (если включены)"""
+        if self.tracemalloc_interval > 0 and self._snapshot_task is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.tracemalloc_frames)
+            self._snapshot_task = asyncio.get_running_loop().create_task(self._snapshot_loop())
+        if self.enabled:
+            logger.info(f"Профилирование: выборка {self.sample_rate}, порог {self.slow_threshold * 1000:.0f} мс, "
+                        f"снимки памяти каждые {self.tracemalloc_interval:.0f} с, файлы в {self.directory}")
+
+    async def stop(self):
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task = None
+            tracemalloc.stop()
+
+    async def _snapshot_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.tracemalloc_interval)
+            try:
+                # Снимок снимается в цикле событий, разбор и запись на диск - в отдельном потоке
+                await loop.run_in_executor(None, self.save_snapshot, tracemalloc.take_snapshot())
+            except Exception as e:
+                logger.error(f"Ошибка снимка tracemalloc: {e}")
+
+    def save_snapshot(self, snapshot: tracemalloc.Snapshot):
+        """Снимок выделений памяти в файл и крупнейшие приросты в лог"""
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        snapshot.dump(self._dump_path('tracemalloc', 'snapshot', 'pickle'))
+        self.snapshots += 1
+
+        current, peak = tracemalloc.get_traced_memory()
+        if self._last_snapshot is not None:
+            top = snapshot.compare_to(self._last_snapshot, 'lineno')[:5]
+            growth = '\n'.join(f"  {stat}" for stat in top)
+            logger.info(f"Память: {current / 2**20:.1f} МБ (пик {peak / 2**20:.1f} МБ), рост:\n{growth}")
+        else:
+            logger.info(f"Память: {current / 2**20:.1f} МБ (пик {peak / 2**20:.1f} МБ)")
+        self._last_snapshot = snapshot
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'profiled': self.profiled,
+            'skipped_busy': self.skipped_busy,
+            'slow': self.slow,
+            'snapshots': self.snapshots,
+        }
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: каждое обновление под Profiler.observe"""
+
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    async def __call__(self, handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        async with self.profiler.observe(f"update-{event.update_id}"):
+            return await handler(event, data)
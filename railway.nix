@@ -8,7 +8,7 @@ pkgs.buildPythonApplication {
   propagatedBuildInputs = with pkgs.python311Packages; [
     aiogram
     python-dotenv
-    apscheduler
+    tzdata
   ];
 
   meta = with pkgs.lib; {
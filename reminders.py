@@ -0,0 +1,99 @@
+from datetime import time
+from typing import Dict, Iterable, List, Tuple
+
+
+def parse_offsets(value: str) -> List[int]:
+    """Смещения напоминаний в минутах из строки вида "60,15" (пустая строка - без напоминаний)"""
+    return sorted({int(part) for part in value.replace(' ', '').split(',') if part}, reverse=True)
+
+
+def reminder_times(report_types: Dict[str, Dict], offsets: Iterable[int]) -> Dict[time, List[Tuple[str, int]]]:
+    """Время напоминаний группы -> [(тип отчета, минут до дедлайна)]
+
+    Типы с одинаковым временем напоминания попадают в одно сообщение.
+    Напоминания, которые пришлись бы на предыдущий день, пропускаются.
+    """
+    times: Dict[time, List[Tuple[str, int]]] = {}
+    for code, info in report_types.items():
+        deadline = info['deadline']
+        for offset in offsets:
+            minutes = deadline.hour * 60 + deadline.minute - offset
+            if offset <= 0 or minutes < 0:
+                continue
+            times.setdefault(time(minutes // 60, minutes % 60), []).append((code, offset))
+    return times
+
+
+class ReportedTracker:
+    """Кто уже сдал отчет сегодня: битовая маска участников на (чат, дата, тип).
+
+    Бит i соответствует i-му участнику в настройках группы (ChatConfig.tag_index).
+    Маски пополняются после каждого сохранения отчета и один раз за день
+    прогреваются из daily_status, поэтому напоминание не делает запросов
+    к базе по каждому участнику. При смене настроек группы ее маски
+    сбрасываются и прогреваются заново.
+
+    Прогрев: begin_warm() до чтения из базы, warm() с результатом чтения.
+    Отметки, пришедшие между ними (отчет сохранен уже после чтения),
+    откладываются и добавляются в маски в warm(), а не теряются.
+    """
+
+    def __init__(self):
+        # чат -> дата -> тип отчета -> маска
+        self._masks: Dict[int, Dict[str, Dict[str, int]]] = {}
+        # (чат, дата) прогреваемых масок -> отметки, пришедшие во время прогрева
+        self._warming: Dict[Tuple[int, str], List[Tuple[str, int]]] = {}
+
+    def mark(self, chat_id: int, date_str: str, report_type: str, index: int):
+        by_type = self._masks.setdefault(chat_id, {}).setdefault(date_str, {})
+        by_type[report_type] = by_type.get(report_type, 0) | (1 << index)
+
+    def record(self, chat_id: int, date_str: str, report_type: str, index: int):
+        """Отметка сохраненного отчета: в прогретые маски сразу, во время прогрева - в отложенные"""
+        if self.is_warm(chat_id, date_str):
+            self.mark(chat_id, date_str, report_type, index)
+            return
+        pending = self._warming.get((chat_id, date_str))
+        if pending is not None:
+            pending.append((report_type, index))
+
+    def mask(self, chat_id: int, date_str: str, report_type: str) -> int:
+        return self._masks.get(chat_id, {}).get(date_str, {}).get(report_type, 0)
+
+    def is_warm(self, chat_id: int, date_str: str) -> bool:
+        return date_str in self._masks.get(chat_id, {})
+
+    def begin_warm(self, chat_id: int, date_str: str):
+        """Начало прогрева: вызывается до чтения сводки из базы"""
+        self._warming.setdefault((chat_id, date_str), [])
+
+    def warm(self, chat_id: int, date_str: str, reports: Dict[str, Dict[str, Dict]], tag_index: Dict[str, int]):
+        """Заполнение масок за дату из сводки get_reports_for_date и отложенных отметок;
+        более старые даты удаляются. Если маски группы сбросили во время прогрева, прочитанная
+        сводка могла устареть и не применяется"""
+        pending = self._warming.pop((chat_id, date_str), None)
+        if pending is None:
+            return
+        by_date = self._masks.setdefault(chat_id, {})
+        for old_date in [d for d in by_date if d < date_str]:
+            del by_date[old_date]
+        by_type = by_date.setdefault(date_str, {})
+        for user_tag, user_reports in reports.items():
+            index = tag_index.get(user_tag)
+            if index is None:
+                continue
+            for report_type in user_reports:
+                by_type[report_type] = by_type.get(report_type, 0) | (1 << index)
+        for report_type, index in pending:
+            by_type[report_type] = by_type.get(report_type, 0) | (1 << index)
+
+    def reset_chat(self, chat_id: int):
+        self._masks.pop(chat_id, None)
+        for key in [key for key in self._warming if key[0] == chat_id]:
+            del self._warming[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'chats': len(self._masks),
+            'masks': sum(len(by_type) for by_date in self._masks.values() for by_type in by_date.values()),
+        }
@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, Optional
+
+
+class ReportsCache:
+    """Ограниченный LRU-кэш результатов get_reports_for_date по (чат, дата).
+
+    Кэш потокобезопасен: им пользуются потоки писателя и читателей.
+    Чтобы чтение, начатое до коммита, не положило в кэш устаревшие данные,
+    каждое значение сохраняется только если с начала чтения не было
+    инвалидаций (счетчик поколений). Возвращаемые словари общие для всех
+    вызывающих и не должны изменяться.
+    """
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def generation(self) -> int:
+        """Текущее поколение - берется перед чтением из базы"""
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Dict, generation: int):
+        """Сохранение результата чтения, начатого в поколении generation"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        """Сброс записей для затронутых дат"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_matching(self, predicate: Callable[[Hashable], bool]):
+        """Сброс всех записей, ключ которых удовлетворяет predicate (очистка старых отчетов)"""
+        with self._lock:
+            self._generation += 1
+            for old_key in [k for k in self._data if predicate(k)]:
+                del self._data[old_key]
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Статистика попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+            'invalidations': self.invalidations,
+        }
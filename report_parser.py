@@ -0,0 +1,112 @@
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ReportParser:
+    """Однопроходный разбор сообщений с отчетами.
+
+    Все структуры строятся один раз: регулярное выражение по ключам типов
+    отчетов (сначала 3-символьные, затем 2-символьные, как в исходном разборе)
+    и frozenset тегов участников. Текст разбирается за один проход по словам.
+    """
+
+    def __init__(self, participants: Dict[str, str], report_types: Iterable[str]):
+        self.participants = dict(participants)
+        self.participant_tags = frozenset(self.participants.values())
+
+        # Поддерживаются типы из 2 или 3 символов; длинные ключи проверяются первыми
+        keys = sorted((key for key in report_types if len(key) in (2, 3)), key=len, reverse=True)
+        self._report_re: Optional[re.Pattern] = (
+            re.compile('#(' + '|'.join(map(re.escape, keys)) + ')(.*)') if keys else None
+        )
+
+    def match_report(self, word: str) -> Optional[Tuple[str, int]]:
+        """Тип отчета и номер дня из хэштега вида #оу5 (слово уже в нижнем регистре)"""
+        if self._report_re is None:
+            return None
+        match = self._report_re.match(word)
+        if match is None:
+            return None
+        number_part = match.group(2)
+        if not number_part.isdecimal():
+            return None
+        return match.group(1), int(number_part)
+
+    def parse(self, text: str, username: str) -> List[Tuple[str, str, int]]:
+        """Извлечение отчетов (тип, тег участника, номер дня) из текста.
+
+        Хэштег отчета привязывается к ближайшему следующему тегу участника;
+        хэштеги отчетов между ними пропускаются. Если тег участника так и не
+        встретился, используется участник по username отправителя (только для
+        первого такого отчета).
+        """
+        reports = []
+        participant_tags = self.participant_tags
+        pending: Optional[Tuple[str, int]] = None
+
+        for word in text.lower().split():
+            if pending is not None:
+                if word not in participant_tags:
+                    continue
+                reports.append((pending[0], word, pending[1]))
+                pending = None
+                # Тег участника сам проверяется как возможный хэштег отчета
+
+            if word.startswith('#'):
+                pending = self.match_report(word)
+
+        if pending is not None:
+            participant_tag = self.participants.get(username)
+            if participant_tag:
+                reports.append((pending[0], participant_tag, pending[1]))
+            else:
+                logger.warning("Не найден участник для отчета: тип=%s, день=%s", pending[0], pending[1])
+
+        if reports and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Распознаны отчеты %s в сообщении от '%s'", reports, username)
+        return reports
+
+
+def legacy_parse(text: str, username: str, participants: Dict[str, str],
+                 report_types: Iterable[str]) -> List[Tuple[str, str, int]]:
+    """Прежний parse_message (без логирования): эталон для test_report_parser.py и benchmark.py"""
+    report_types = set(report_types)
+    reports = []
+    words = text.lower().split()
+
+    i = 0
+    while i < len(words):
+        word = words[i]
+        if word.startswith('#') and len(word) > 3:
+            potential_type = None
+            number_part = None
+            if word[1:4] in report_types:
+                potential_type = word[1:4]
+                number_part = word[4:]
+            elif word[1:3] in report_types:
+                potential_type = word[1:3]
+                number_part = word[3:]
+
+            if potential_type and number_part.isdigit():
+                day_number = int(number_part)
+                participant_tag = None
+                j = i + 1
+                while j < len(words):
+                    next_word = words[j]
+                    if next_word.startswith('#') and next_word in participants.values():
+                        participant_tag = next_word
+                        break
+                    j += 1
+
+                if not participant_tag and username in participants:
+                    participant_tag = participants[username]
+
+                if participant_tag:
+                    reports.append((potential_type, participant_tag, day_number))
+                    i = j
+                    continue
+        i += 1
+    return reports
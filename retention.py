@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable
+
+from chat_registry import ChatConfig
+
+logger = logging.getLogger(__name__)
+
+# Значение PRAGMA auto_vacuum, при котором incremental_vacuum возвращает страницы файлу
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class RetentionCleaner:
+    """Удаление старых отчетов небольшими пачками в фоне.
+
+    Каждая пачка - отдельная короткая транзакция в потоке-писателе: до
+    batch_size строк одной группы, найденных по индексу (chat_id, report_date).
+    Между пачками - пауза pause секунд, и сохранение новых отчетов ждет
+    не дольше одной пачки, а не всей очистки. Срок хранения у каждой группы
+    свой (ChatConfig.retention_days, 0 - хранить всегда).
+
+    После удаления свободные страницы возвращаются файлу через
+    PRAGMA incremental_vacuum порциями по vacuum_pages (0 - не возвращать).
+    Заодно удаляются сообщения outbox, от отправки которых отказались
+    (status='failed'), старше outbox_failed_days дней (0 - хранить всегда).
+    Это работает, только если в базе включен auto_vacuum=INCREMENTAL: новые
+    базы создаются с ним, существующие переводит migrate_db.py.
+    """
+
+    def __init__(self, storage, batch_size: int = 500, pause: float = 0.05, vacuum_pages: int = 256,
+                 outbox_failed_days: int = 7):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.pause = pause
+        self.vacuum_pages = vacuum_pages
+        self.outbox_failed_days = outbox_failed_days
+        self._running = False
+        self._vacuum_warned = False
+
+        # Метрики
+        self.runs = 0
+        self.deleted = 0
+        self.outbox_deleted = 0
+        self.batches = 0
+        self.vacuumed_pages = 0
+        self.chats_left = 0
+        self.last_run_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def run(self, configs: Iterable[ChatConfig]) -> int:
+        """Очистка всех групп по их срокам хранения; возвращает число удаленных отчетов"""
+        if self._running:
+            logger.info("Очистка старых отчетов уже выполняется")
+            return 0
+        self._running = True
+        started = time.perf_counter()
+        total = 0
+        try:
+            configs = [config for config in configs if config.retention_days > 0]
+            self.chats_left = len(configs)
+            for config in configs:
+                total += await self._clean_chat(config)
+                self.chats_left -= 1
+            if self.outbox_failed_days > 0:
+                await self._clean_outbox()
+            if self.vacuum_pages > 0:
+                await self._vacuum()
+        finally:
+            self._running = False
+            self.chats_left = 0
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        logger.info(f"Очистка старых отчетов завершена за {self.last_run_seconds:.1f} с, удалено: {total}")
+        return total
+
+    async def _clean_chat(self, config: ChatConfig) -> int:
+        cutoff = (datetime.now(config.timezone).date() - timedelta(days=config.retention_days)).isoformat()
+        deleted = 0
+        while True:
+            count = await self.storage.run_write(
+                self.storage.db.delete_old_reports_batch, config.chat_id, cutoff, self.batch_size
+            )
+            deleted += count
+            self.deleted += count
+            self.batches += 1
+            if count < self.batch_size:
+                break
+            # Между пачками в очередь писателя успевают встать сохранения новых отчетов
+            await asyncio.sleep(self.pause)
+        if deleted:
+            logger.info(f"Чат {config.chat_id}: удалено отчетов до {cutoff}: {deleted}")
+        return deleted
+
+    async def _clean_outbox(self):
+        cutoff = (datetime.now() - timedelta(days=self.outbox_failed_days)).isoformat()
+        deleted = 0
+        while True:
+            count = await self.storage.run_write(
+                self.storage.db.delete_failed_outbox_batch, cutoff, self.batch_size
+            )
+            deleted += count
+            self.outbox_deleted += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        if deleted:
+            logger.info(f"Удалено неотправленных сообщений outbox до {cutoff}: {deleted}")
+
+    async def _vacuum(self):
+        mode = await self.storage.run_read(self.storage.db.auto_vacuum_mode)
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            if not self._vacuum_warned:
+                self._vacuum_warned = True
+                logger.warning("В базе выключен auto_vacuum=INCREMENTAL: после очистки файл не уменьшается "
+                               "(включить - python migrate_db.py при остановленном боте)")
+            return
+        freed = 0
+        while True:
+            count = await self.storage.run_write(self.storage.db.incremental_vacuum, self.vacuum_pages)
+            freed += count
+            self.vacuumed_pages += count
+            if count < self.vacuum_pages:
+                break
+            await asyncio.sleep(self.pause)
+        if freed:
+            logger.info(f"Файлу базы возвращено страниц: {freed}")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'running': int(self._running),
+            'runs': self.runs,
+            'deleted': self.deleted,
+            'outbox_deleted': self.outbox_deleted,
+            'batches': self.batches,
+            'vacuumed_pages': self.vacuumed_pages,
+            'chats_left': self.chats_left,
+            'last_run_seconds': self.last_run_seconds,
+        }
@@ -28,7 +28,7 @@ def send_yesterday_report_simple():
 
         # Получаем вчерашнюю дату
         yesterday = datetime.now() - timedelta(days=1)
-        reports = db.get_reports_for_date(yesterday)
+        reports = db.get_reports_for_date(yesterday, int(chat_id))
 
         if not reports:
             print("❌ Нет отчетов за вчера")
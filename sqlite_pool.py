@@ -0,0 +1,165 @@
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Размер кэша подготовленных выражений на одно соединение
+STATEMENT_CACHE_SIZE = 256
+
+
+def readonly_uri(db_path: str) -> str:
+    """URI для открытия базы только на чтение"""
+    return f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+
+def connect_readonly(db_path: str, busy_timeout_ms: int = 5000) -> sqlite3.Connection:
+    """Соединение только на чтение для диагностических скриптов.
+
+    В режиме WAL такое соединение читает последний закоммиченный снимок
+    и не блокирует запись бота.
+    """
+    conn = sqlite3.connect(readonly_uri(db_path), uri=True, timeout=busy_timeout_ms / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+class SQLiteConnectionManager:
+    """Долгоживущие соединения с SQLite: один писатель и пул читателей.
+
+    Писатель работает в режиме WAL с настроенными pragma и защищен блокировкой,
+    читатели открываются только на чтение и не мешают записи (при readonly=True
+    писателя нет вовсе, и файл базы не создается и не меняется). Подготовленные
+    выражения переиспользуются через кэш statement'ов каждого соединения,
+    поэтому SQL-запросы должны передаваться одинаковыми строками.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, busy_timeout_ms: int = 5000,
+                 cache_size_kib: int = 16384, mmap_size: int = 64 * 1024 * 1024,
+                 synchronous: str = 'NORMAL', readonly: bool = False):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.max_readers = max(1, readers)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.synchronous = synchronous
+
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers_opened = 0
+        self._readers_lock = threading.Lock()
+        self._closed = False
+
+    def _apply_pragmas(self, conn: sqlite3.Connection):
+        """Общие настройки для всех соединений"""
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        self._apply_pragmas(conn)
+        # Действует только на новую базу и только до перехода в WAL: освобожденные
+        # очисткой страницы можно вернуть файлу через PRAGMA incremental_vacuum
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        if mode.lower() != 'wal':
+            logger.warning(f"Не удалось включить WAL, текущий режим журнала: {mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        # Триггеры daily_status должны срабатывать и на удаление при INSERT OR REPLACE
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
+    def _open_reader(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            readonly_uri(self.db_path),
+            uri=True,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        self._apply_pragmas(conn)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Эксклюзивный доступ к соединению-писателю.
+
+        Транзакцией управляет вызывающий код (``with conn:``).
+        """
+        with self._writer_lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Менеджер соединений закрыт")
+            if self.readonly:
+                raise sqlite3.ProgrammingError("База открыта только на чтение")
+            if self._writer is None:
+                self._writer = self._open_writer()
+            yield self._writer
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Соединение из пула читателей"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Менеджер соединений закрыт")
+
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        except Exception:
+            # Не возвращаем в пул соединение с незавершенной транзакцией
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._readers_lock:
+            if self._readers_opened < self.max_readers:
+                # Файл базы должен существовать до открытия читателя в режиме ro
+                if not self.readonly:
+                    with self.writer():
+                        pass
+                conn = self._open_reader()
+                self._readers_opened += 1
+                return conn
+
+        try:
+            return self._readers.get(timeout=self.busy_timeout_ms / 1000)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Нет свободных соединений для чтения") from None
+
+    def close(self):
+        """Закрытие всех соединений"""
+        self._closed = True
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -0,0 +1,108 @@
+from typing import List, NamedTuple, Tuple
+
+# Лимит Telegram на длину сообщения (в UTF-16 кодовых единицах)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+ITEM_SEPARATOR = ', '
+LINE_SEPARATOR = '\n'
+
+
+def utf16_len(text: str) -> int:
+    """Длина строки так, как ее считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+class SummaryLine(NamedTuple):
+    """Строка сводки: префикс ("✅ Вовремя: ") и перечисляемые элементы"""
+    prefix: str
+    items: List[str]
+
+
+class SummarySection(NamedTuple):
+    """Раздел сводки (один тип отчета): заголовок и строки"""
+    title: str
+    lines: List[SummaryLine]
+
+
+def render_summary(header: str, sections: List[SummarySection]) -> str:
+    """Сводка одним сообщением без учета лимита"""
+    parts = [header]
+    for section in sections:
+        parts.append(section.title)
+        parts.extend(line.prefix + ITEM_SEPARATOR.join(line.items) for line in section.lines)
+    return LINE_SEPARATOR.join(parts)
+
+
+def _split_line(line: SummaryLine, limit: int) -> List[Tuple[str, int]]:
+    """Строка, разбитая на куски не длиннее limit; префикс повторяется в каждом куске"""
+    prefix_len = utf16_len(line.prefix)
+    sep_len = utf16_len(ITEM_SEPARATOR)
+
+    chunks = []
+    current: List[str] = []
+    current_len = prefix_len
+    for item in line.items:
+        item_len = utf16_len(item)
+        added = item_len + (sep_len if current else 0)
+        if current and current_len + added > limit:
+            chunks.append((line.prefix + ITEM_SEPARATOR.join(current), current_len))
+            current, current_len = [], prefix_len
+            added = item_len
+        current.append(item)
+        current_len += added
+    chunks.append((line.prefix + ITEM_SEPARATOR.join(current), current_len))
+    return chunks
+
+
+def split_summary(header: str, sections: List[SummarySection],
+                  limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """Разбиение сводки на сообщения не длиннее limit.
+
+    Длина каждой строки считается один раз, сообщения собираются по известным
+    длинам. Разделы (типы отчетов) не разрываются, если помещаются в одно
+    сообщение; слишком длинный раздел делится по строкам, а слишком длинная
+    строка - по элементам списка.
+    """
+    sep_len = utf16_len(LINE_SEPARATOR)
+    header_len = utf16_len(header)
+    title_lens = [utf16_len(section.title) for section in sections]
+
+    # Куски длинных строк оставляют место для заголовков, чтобы первый кусок
+    # поместился в одно сообщение с заголовком раздела
+    line_limit = max(1, limit - header_len - max(title_lens, default=0) - 2 * sep_len)
+
+    # Блоки (раздел -> список строк с длинами)
+    blocks: List[List[Tuple[str, int]]] = [[(header, header_len)]]
+    for section, title_len in zip(sections, title_lens):
+        block = [(section.title, title_len)]
+        for line in section.lines:
+            block.extend(_split_line(line, line_limit))
+        blocks.append(block)
+
+    messages: List[str] = []
+    current: List[str] = []
+    current_len = 0
+
+    def flush():
+        nonlocal current, current_len
+        if current:
+            messages.append(LINE_SEPARATOR.join(current))
+        current, current_len = [], 0
+
+    for block in blocks:
+        block_len = sum(length for _, length in block) + sep_len * (len(block) - 1)
+        joined_len = current_len + (sep_len if current else 0) + block_len
+        if current and joined_len > limit and block_len <= limit:
+            # Раздел целиком переносится в следующее сообщение
+            flush()
+
+        for text, length in block:
+            added = length + (sep_len if current else 0)
+            if current and current_len + added > limit:
+                flush()
+                added = length
+            current.append(text)
+            current_len += added
+
+    flush()
+    return messages
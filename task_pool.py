@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple
+
+Job = Tuple[Callable[..., Awaitable[Any]], tuple, asyncio.Future]
+
+
+class _Slot:
+    """Слот пула, занятый текущей задачей; освобождается не больше одного раза"""
+
+    __slots__ = ('pool', 'held')
+
+    def __init__(self, pool: 'KeyedTaskPool'):
+        self.pool = pool
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.pool.in_flight -= 1
+            self.pool._slots.release()
+
+
+_current_slot: ContextVar[Optional[_Slot]] = ContextVar('keyed_task_pool_slot', default=None)
+
+
+def release_slot():
+    """Досрочное освобождение слота пула задачей, которая дальше только ждет.
+
+    Вызывается перед ожиданием коммита группового буфера: пока задача ждет,
+    ее слот занимает задача другого ключа и добавляет в ту же пачку свои
+    строки. Порядок внутри ключа не меняется - следующая задача ключа
+    по-прежнему начинается после завершения текущей. Вне пула ничего не делает.
+    """
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.release()
+        slot.pool.released_early += 1
+
+
+class KeyedTaskPool:
+    """Ограниченная параллельная обработка с порядком внутри ключа.
+
+    Задачи с разными ключами (чат, пользователь) выполняются параллельно,
+    но не более workers одновременно; задачи с одним ключом выполняются
+    строго по очереди в порядке поступления. Задача, которая дальше только
+    ждет (коммит пачки), отдает слот вызовом release_slot(). Общее число задач в очереди
+    и в работе ограничено max_queue: при переполнении run() ждет.
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 1000):
+        self.workers = workers
+        self.max_queue = max_queue
+
+        self._slots = asyncio.Semaphore(workers)
+        self._capacity = asyncio.Semaphore(max_queue)
+        self._queues: Dict[Hashable, Deque[Job]] = {}
+        self._drainers: Set[asyncio.Task] = set()
+
+        # Метрики
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.released_early = 0
+
+    async def run(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Выполнение func(*args) в очереди ключа key, возвращает ее результат"""
+        await self._capacity.acquire()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            task = loop.create_task(self._drain(key, queue))
+            self._drainers.add(task)
+            task.add_done_callback(self._drainers.discard)
+
+        queue.append((func, args, future))
+        self.queued += 1
+        return await future
+
+    async def _drain(self, key: Hashable, queue: Deque[Job]):
+        while queue:
+            func, args, future = queue.popleft()
+            self.queued -= 1
+            try:
+                await self._slots.acquire()
+                self.in_flight += 1
+                slot = _Slot(self)
+                token = _current_slot.set(slot)
+                try:
+                    result = await func(*args)
+                finally:
+                    _current_slot.reset(token)
+                    slot.release()
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                self.completed += 1
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._capacity.release()
+
+        del self._queues[key]
+
+    async def join(self):
+        """Ожидание завершения всех поставленных задач"""
+        while self._drainers:
+            await asyncio.gather(*self._drainers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Глубина очереди и число задач в работе"""
+        return {
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'active_keys': len(self._queues),
+            'completed': self.completed,
+            'failed': self.failed,
+            'released_early': self.released_early,
+        }
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Учет обработанных обновлений: повторы, доставка не по порядку, разрывы и сброс нумерации.
+
+    python -m pytest test_ingestion.py
+"""
+import asyncio
+import unittest
+
+from aiogram.types import Update
+
+from ingestion import UpdateCheckpointMiddleware, UpdateWatermark
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class UpdateWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.watermark = UpdateWatermark(100, gap_timeout=300, clock=self.clock)
+
+    def handle(self, update_id: int) -> bool:
+        if self.watermark.is_processed(update_id):
+            return False
+        self.watermark.begin(update_id)
+        self.watermark.done(update_id)
+        return True
+
+    def test_saved_updates_are_replays(self):
+        self.assertTrue(self.watermark.is_processed(99))
+        self.assertTrue(self.watermark.is_processed(100))
+        self.assertFalse(self.watermark.is_processed(101))
+
+    def test_out_of_order_update_is_not_dropped(self):
+        self.assertTrue(self.handle(102))
+        # Отметка не проходит через 101, пока оно не пришло
+        self.assertEqual(self.watermark.value, 100)
+        self.assertTrue(self.handle(101))
+        self.assertEqual(self.watermark.value, 102)
+
+    def test_seen_update_is_replay(self):
+        self.assertTrue(self.handle(101))
+        self.assertTrue(self.handle(103))
+        self.assertFalse(self.handle(101))
+        self.assertFalse(self.handle(103))
+
+    def test_in_flight_update_holds_watermark(self):
+        self.watermark.begin(101)
+        self.assertTrue(self.handle(102))
+        self.assertEqual(self.watermark.value, 100)
+        self.assertTrue(self.watermark.is_processed(101))
+        self.watermark.done(101)
+        self.assertEqual(self.watermark.value, 102)
+
+    def test_gap_skipped_after_timeout(self):
+        self.assertTrue(self.handle(102))
+        self.clock.now = 299
+        self.watermark.advance()
+        self.assertEqual(self.watermark.value, 100)
+        self.clock.now = 300
+        self.watermark.advance()
+        self.assertEqual(self.watermark.value, 102)
+        self.assertEqual(self.watermark.gaps_skipped, 1)
+        # Запоздавшее обновление из разрыва все равно обрабатывается, но только один раз
+        self.assertTrue(self.handle(101))
+        self.assertFalse(self.handle(101))
+        self.assertEqual(self.watermark.value, 102)
+
+    def test_polling_gap_skipped_immediately(self):
+        watermark = UpdateWatermark(100, gap_timeout=0)
+        watermark.begin(105)
+        watermark.done(105)
+        self.assertEqual(watermark.value, 105)
+
+    def test_seen_set_is_bounded(self):
+        watermark = UpdateWatermark(0, seen_limit=10)
+        for update_id in range(1, 101):
+            watermark.begin(update_id)
+            watermark.done(update_id)
+        self.assertEqual(watermark.value, 100)
+        self.assertEqual(len(watermark._seen), 10)
+
+    def test_reset(self):
+        watermark = self.watermark = UpdateWatermark(500000)
+        self.assertTrue(self.handle(500001))
+        self.assertFalse(watermark.check_reset(450000))
+        self.assertTrue(watermark.check_reset(5))
+        self.assertTrue(self.handle(5))
+        self.assertEqual(self.watermark.value, 5)
+        self.assertTrue(self.handle(6))
+
+
+class UpdateCheckpointMiddlewareTest(unittest.TestCase):
+    def test_out_of_order_delivery(self):
+        watermark = UpdateWatermark(100, gap_timeout=300)
+        middleware = UpdateCheckpointMiddleware(watermark)
+        handled = []
+
+        async def handler(event, data):
+            handled.append(event.update_id)
+
+        async def deliver(*update_ids):
+            for update_id in update_ids:
+                await middleware(handler, Update(update_id=update_id), {})
+
+        asyncio.run(deliver(102, 101, 102, 100))
+        self.assertEqual(handled, [102, 101])
+        self.assertEqual(middleware.replays, 2)
+        self.assertEqual(watermark.value, 102)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Очередь исходящих сообщений: ошибки базы не останавливают обработчик чата.
+
+    python -m pytest test_outbox.py
+"""
+import asyncio
+import itertools
+import unittest
+
+from aiogram.exceptions import TelegramServerError
+
+from outbox import OutboundSender
+
+
+class FakeBot:
+    def __init__(self, errors: int = 0):
+        self.sent = []
+        self.errors = errors
+
+    async def send_message(self, chat_id: int, text: str, parse_mode=None):
+        if self.errors:
+            self.errors -= 1
+            raise TelegramServerError(method=None, message='Bad Gateway')
+        self.sent.append(text)
+
+
+class FakeDB:
+    def __init__(self, fail_delete: bool = False, fail_update: bool = False):
+        self.fail_delete = fail_delete
+        self.fail_update = fail_update
+        self.rows = {}
+        self._ids = itertools.count(1)
+
+    def outbox_add(self, chat_id, texts, parse_mode):
+        ids = [next(self._ids) for _ in texts]
+        self.rows.update((outbox_id, 'pending') for outbox_id in ids)
+        return ids
+
+    def outbox_delete(self, outbox_id):
+        if self.fail_delete:
+            raise RuntimeError('database is locked')
+        del self.rows[outbox_id]
+
+    def outbox_update(self, outbox_id, attempts, status, last_error):
+        if self.fail_update:
+            raise RuntimeError('database is locked')
+        self.rows[outbox_id] = status
+
+
+class FakeStorage:
+    def __init__(self, db: FakeDB):
+        self.db = db
+
+    async def run_write(self, func, *args):
+        return func(*args)
+
+
+def make_sender(bot: FakeBot, db: FakeDB) -> OutboundSender:
+    return OutboundSender(bot, FakeStorage(db), global_rate=1000, chat_rate_per_minute=60000, chat_burst=100,
+                          base_backoff=0.001)
+
+
+class OutboundSenderErrorsTest(unittest.TestCase):
+    def test_failed_delete_counts_as_delivered(self):
+        async def run():
+            bot, db = FakeBot(), FakeDB(fail_delete=True)
+            sender = make_sender(bot, db)
+            self.assertTrue(await asyncio.wait_for(sender.send_many(1, ['a', 'b']), 5))
+            # Следующая постановка не отправляет уже доставленные сообщения снова
+            self.assertTrue(await asyncio.wait_for(sender.send(1, 'c'), 5))
+            self.assertEqual(bot.sent, ['a', 'b', 'c'])
+            self.assertEqual(sender.stats()['queued'], 0)
+            self.assertEqual(sender.errors, 3)
+
+        asyncio.run(run())
+
+    def test_failed_update_in_retry_resolves_waiter(self):
+        async def run():
+            bot, db = FakeBot(errors=1), FakeDB(fail_update=True)
+            sender = make_sender(bot, db)
+            self.assertFalse(await asyncio.wait_for(sender.send(1, 'a'), 5))
+            self.assertEqual(sender.stats()['queued'], 0)
+            # Обработчик чата продолжает работать
+            db.fail_update = False
+            self.assertTrue(await asyncio.wait_for(sender.send(1, 'b'), 5))
+            self.assertEqual(bot.sent, ['b'])
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
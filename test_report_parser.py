@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Сверка ReportParser с прежним разбором parse_message.
+
+Прежний разбор (цикл по словам с поиском типа по срезам word[1:4]/word[1:3]
+и isdigit) - эталон report_parser.legacy_parse. На корпусе из характерных сообщений и
+случайной смеси по ключам REPORT_TYPES и тегам PARTICIPANTS результаты должны
+совпадать. Единственное задуманное отличие: номер дня проверяется через
+isdecimal, поэтому хэштег вроде #оу² игнорируется, а прежний разбор падал на
+нем с ValueError.
+
+    python -m pytest test_report_parser.py
+    python -m unittest test_report_parser
+"""
+import os
+import random
+import tempfile
+import unittest
+from typing import List, Tuple
+
+# main читает настройки при импорте; рабочая база и настоящий токен не нужны
+_test_dir = tempfile.TemporaryDirectory(prefix='bot-test-')
+os.environ['DATABASE_PATH'] = os.path.join(_test_dir.name, 'bot.db')
+os.environ['GROUP_CHAT_ID'] = '0'
+os.environ.setdefault('TELEGRAM_BOT_TOKEN', '0:test')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from main import PARTICIPANTS, REPORT_TYPES
+from report_parser import ReportParser, legacy_parse
+
+SEED = 42
+RANDOM_MESSAGES = 5000
+
+
+# Характерные случаи: несколько отчетов подряд, теги участников вперемешку,
+# регистр, неизвестные типы, пустой номер, 3-символьный тип без отката на 2 символа
+CORPUS = [
+    ("#оу5 #ан", '@Dev_Jones'),
+    ("#ос12", '@A_N_yaki'),
+    ("#ос12", '@unknown'),
+    ("#ОУ3 #АН доброе утро", '@unknown'),
+    ("#оу1 #ос2 #ден", '@A_N_yaki'),
+    ("#оу1 #ден #ос2 #ан #ов3", '@helga_sigy'),
+    ("#оу1 #ов2 #ос3", '@helga_sigy'),
+    ("#гсд7 #тор", '@unknown'),
+    ("#гсд7", '@Mikhailovmind'),
+    ("#гсдх #тор", '@Mikhailovmind'),
+    ("#гс5 #тор", '@Mikhailovmind'),
+    ("#оу #ан", '@A_N_yaki'),
+    ("#оу05 #ан", '@A_N_yaki'),
+    ("#оу5х #ан", '@A_N_yaki'),
+    ("#ох5 #ан", '@A_N_yaki'),
+    ("оу5 #ан", '@A_N_yaki'),
+    ("#в #оу5 #в", '@Wlad_is_law'),
+    ("#ан #оу5", '@Dev_Jones'),
+    ("#оу5 текст без тега", '@unknown'),
+    ("#оу5 #мысли #ан", '@unknown'),
+    ("#оу5\n#ан\t#ос6 #любовь", '@unknown'),
+    ("", '@A_N_yaki'),
+    ("#", '@A_N_yaki'),
+    ("просто сообщение #мысли", '@A_N_yaki'),
+]
+
+
+def random_corpus(rng: random.Random, count: int) -> List[Tuple[str, str]]:
+    """Случайные сообщения из хэштегов отчетов (в том числе испорченных), тегов и слов"""
+    types = list(REPORT_TYPES) + ['ох', 'гс', 'о']
+    tags = list(PARTICIPANTS.values())
+    usernames = list(PARTICIPANTS) + ['@unknown']
+    words = ['доброе', 'утро', 'пробежка', 'км', 'сделано', '#мысли', '#', '5', 'ОС', '#ос', '#оу-1']
+
+    def token() -> str:
+        kind = rng.random()
+        if kind < 0.35:
+            number = rng.choice([str(rng.randint(0, 400)), '', '07', 'x', '1x'])
+            hashtag = f"#{rng.choice(types)}{number}"
+            return hashtag.upper() if rng.random() < 0.1 else hashtag
+        if kind < 0.65:
+            return rng.choice(tags)
+        return rng.choice(words)
+
+    return [(' '.join(token() for _ in range(rng.randint(0, 12))), rng.choice(usernames)) for _ in range(count)]
+
+
+class ReportParserEquivalenceTest(unittest.TestCase):
+    def setUp(self):
+        self.parser = ReportParser(PARTICIPANTS, REPORT_TYPES)
+
+    def assert_same(self, corpus: List[Tuple[str, str]]):
+        for text, username in corpus:
+            with self.subTest(text=text, username=username):
+                self.assertEqual(self.parser.parse(text, username),
+                                 legacy_parse(text, username, PARTICIPANTS, REPORT_TYPES))
+
+    def test_corpus(self):
+        self.assert_same(CORPUS)
+
+    def test_random_corpus(self):
+        self.assert_same(random_corpus(random.Random(SEED), RANDOM_MESSAGES))
+
+    def test_non_decimal_day_number(self):
+        # Задуманное отличие: '²'.isdigit() истинно, но int('²') - ошибка
+        for text in ("#оу² #ан", "#ос1² #ден"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    legacy_parse(text, '@A_N_yaki', PARTICIPANTS, REPORT_TYPES)
+                self.assertEqual(self.parser.parse(text, '@A_N_yaki'), [])
+
+        # Хэштег с таким номером пропускается, следующий отчет разбирается как обычно
+        self.assertEqual(self.parser.parse("#оу² #ан #ос3 #ден", '@unknown'), [('ос', '#ден', 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()